@@ -11,7 +11,13 @@ SRC_DIR = os.path.join(ROOT_DIR, 'src')
 DATA_DIR = os.path.join(ROOT_DIR, 'data')
 OUTPUT_DIR = os.path.join(ROOT_DIR, 'output')
 EMBEDDINGS_DIR = os.path.join(ROOT_DIR, 'embeddings')
+# TorchScript model artifacts, so embedders start without network access. Pre-warm with
+# python -m src.features.audio_embedding.model_cache
+MODEL_CACHE_DIR = os.environ.get('MODEL_CACHE_DIR', os.path.join(ROOT_DIR, 'model_cache'))
 
 # VGGish
 MODEL_NAME = 'harritaylor/torchvggish'
 MODEL_TYPE = 'vggish'
+
+# Wav2Vec2: a Hugging Face model id or a local directory with the weights
+WAV2VEC2_MODEL_NAME = os.environ.get('WAV2VEC2_MODEL_NAME', 'facebook/wav2vec2-base')
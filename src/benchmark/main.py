@@ -0,0 +1,196 @@
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+import config
+from src.benchmark.stage_timer import StageTimer
+from src.benchmark.synthetic_audio import SIREN_LABEL, write_clip, write_corpus_recording, write_label_folders
+from src.features.audio_embedding.embedder_registry import EmbedderFactory, add_embedder_arguments, register_embedder
+from src.features.audio_embedding.spectral_gate import add_gate_arguments
+from src.utils.instrumentation import add_profiling_arguments, start_profiling
+
+
+def get_git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=config.ROOT_DIR, check=True,
+                              capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def get_environment():
+    import torch
+
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'torch': torch.__version__,
+        'torch_threads': torch.get_num_threads(),
+    }
+
+
+def compare_results(baseline, results):
+    # Speedup of every stage against a results file from another commit; above 1 is faster.
+    baseline_stages = {stage['name']: stage for stage in baseline['stages']}
+    print(f"\nAgainst {baseline.get('git_commit')} ({baseline.get('timestamp')}):")
+    for stage in results['stages']:
+        before = baseline_stages.get(stage['name'])
+        if before is not None:
+            print(f"{stage['name']:<28}{before['seconds']:>10.3f}s -> {stage['seconds']:>8.3f}s "
+                  f"({before['seconds'] / max(stage['seconds'], 1e-9):.2f}x)")
+
+
+def create_stub_embedder(audio_data, args, feature_pipeline, gate):
+    from src.benchmark.stub_embedder import StubAudioEmbedder
+
+    return StubAudioEmbedder(audio_data, args.batch_size, feature_pipeline, gate=gate)
+
+
+register_embedder('stub', create_stub_embedder)
+
+
+def stats_printer_available():
+    try:
+        return importlib.util.find_spec('src.models.stats.stats_printer') is not None
+    except ModuleNotFoundError:
+        return False
+
+
+def run_benchmark(args, timer):
+    from src.dataset.audio_splitter.audio_splitter import AudioSplitter
+    from src.features.audio_embedding.audio_data import AudioDataFactory
+    from src.features.audio_embedding.embedding import Embedding
+    from src.features.audio_embedding.retriever import EmbeddingRetriever
+    from src.features.audio_embedding.spectral_gate import create_gate
+
+    work_dir = args.work_dir
+    recording_path = os.path.join(work_dir, 'raw', f"synthetic_{args.num_chunks}.wav")
+    query_path = os.path.join(work_dir, 'query', 'siren_query.wav')
+    embedding_file = os.path.join(work_dir, 'embeddings', f"synthetic_{args.num_chunks}_{args.embedder}.emb")
+
+    with timer.stage('synthesize', args.num_chunks):
+        labels = write_corpus_recording(recording_path, args.num_chunks, args.chunk_length, args.sample_rate,
+                                        args.siren_fraction, args.seed)
+        write_clip(query_path, args.chunk_length, args.sample_rate, SIREN_LABEL, args.seed + 1)
+
+    splitter = AudioSplitter(args.chunk_length * 1000, os.path.join(work_dir, 'processed'), show_progress=False)
+    chunk_folder = splitter.get_output_folder(recording_path)
+    for file in os.listdir(chunk_folder) if os.path.isdir(chunk_folder) else []:
+        os.remove(os.path.join(chunk_folder, file))
+    with timer.stage('split_audio', args.num_chunks):
+        splitter.split_audio(recording_path)
+    chunk_paths = [splitter.get_chunk_name(recording_path, i, args.chunk_length * 1000) for i in range(len(labels))]
+    labeled_root = os.path.join(work_dir, 'labeled')
+    shutil.rmtree(labeled_root, ignore_errors=True)
+    first_class_folder, second_class_folder = write_label_folders(chunk_paths, labels, labeled_root)
+
+    audio_data = AudioDataFactory.create_audio_data(args.chunk_length, chunk_folder)
+    with timer.stage('load_model'):
+        embedder = EmbedderFactory.create_embedder(args.embedder, audio_data, args, gate=create_gate(args))
+
+    with timer.stage('generate_embeddings', len(audio_data.audio_paths)) as record:
+        embeddings_list = embedder.generate_embeddings()
+        if embedder.gate is not None:
+            record['skip_rate'] = embedder.gate.skip_rate()
+    with timer.stage('store_embeddings', len(embeddings_list)):
+        Embedding(audio_data, embedding_file, replace_existing=True).store_embeddings(embeddings_list)
+    del embeddings_list
+
+    embedding = Embedding(audio_data, embedding_file)
+    with timer.stage('load_embeddings', len(audio_data.audio_paths)):
+        embedding.load_embeddings()
+
+    retriever = EmbeddingRetriever(audio_data, embedder, embedding)
+    query_embedding = embedder.generate_embedding(query_path).cpu().numpy().squeeze()
+    with timer.stage('find_similar_embeddings_cold', len(audio_data.audio_paths)):
+        retriever.find_similar_embeddings(query_embedding)
+    with timer.stage('find_similar_embeddings_warm', args.num_queries * len(audio_data.audio_paths)) as record:
+        for _ in range(args.num_queries):
+            retriever.find_similar_embeddings(query_embedding)
+        record['queries'] = args.num_queries
+
+    if args.classify:
+        from src.models.stats.stats_printer import DatasetConfig, ClassificationStatPrinter
+        from src.models.zero_shot_vggish.classifier import ZeroShotVGGishClassifier
+
+        dataset_config = DatasetConfig('siren', 'nosiren', first_class_folder, second_class_folder,
+                                       os.path.join(work_dir, 'output'), embedding_file)
+        classifier = ZeroShotVGGishClassifier(audio_data, embedding, embedder, retriever,
+                                              ClassificationStatPrinter(dataset_config), False,
+                                              first_class_folder=first_class_folder,
+                                              second_class_folder=second_class_folder)
+        with timer.stage('zero_shot_classifier_run', len(audio_data.audio_paths)):
+            classifier.run(query_path, args.similarity_thresholds)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the split, embed, retrieve and classify stages on a synthetic corpus")
+    parser.add_argument('--num_chunks', type=int, default=1000, help="Chunks in the synthetic corpus recording")
+    parser.add_argument('--chunk_length', type=int, choices=[1, 3], default=3, help="Length of the audio chunks in seconds (1 or 3)")
+    parser.add_argument('--sample_rate', type=int, default=16000, help="Sample rate of the synthetic audio")
+    parser.add_argument('--siren_fraction', type=float, default=0.3, help="Fraction of chunks containing a siren")
+    parser.add_argument('--batch_size', type=int, default=64, help="Number of audio chunks embedded per forward pass")
+    parser.add_argument('--num_queries', type=int, default=20, help="Warm retrieval queries timed after the first")
+    parser.add_argument('--similarity_thresholds', type=float, nargs='+', default=[0.5, 0.7, 0.9],
+                        help="Thresholds of the timed zero-shot classification")
+    parser.add_argument('--classify', action='store_true',
+                        help="Also time ZeroShotVGGishClassifier.run. Needs src.models.stats.stats_printer")
+    parser.add_argument('--trace_memory', action='store_true',
+                        help="Also record the peak traced (numpy/Python) memory of every stage. Slows stages down")
+    parser.add_argument('--seed', type=int, default=42, help="Seed of the synthetic corpus")
+    parser.add_argument('--work_dir', type=str, default=f"{config.OUTPUT_DIR}/benchmark/work",
+                        help="Folder the synthetic corpus, chunks and embeddings are written to")
+    parser.add_argument('--results_file', type=str, default=None,
+                        help="JSON results file. Defaults to output/benchmark/<timestamp>_<commit>.json")
+    parser.add_argument('--compare', type=str, default=None, help="Results file of an earlier run to compare against")
+    # stub is a random projection of the VGGish features that needs no model.
+    add_embedder_arguments(parser, default='stub')
+    add_gate_arguments(parser)
+    add_profiling_arguments(parser)
+
+    args = parser.parse_args()
+    if args.classify and not stats_printer_available():
+        parser.error("--classify needs src.models.stats.stats_printer, which is not installed")
+    start_profiling(args, 'benchmark')
+
+    timer = StageTimer(args.trace_memory)
+    start = time.time()
+    run_benchmark(args, timer)
+
+    commit = get_git_commit()
+    results = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(start)),
+        'git_commit': commit,
+        'command': sys.argv,
+        'config': {key: value for key, value in vars(args).items() if key not in ('results_file', 'compare')},
+        'environment': get_environment(),
+        'stages': timer.stages,
+    }
+    results_file = args.results_file or os.path.join(
+        config.OUTPUT_DIR, 'benchmark', f"{time.strftime('%Y%m%d_%H%M%S', time.localtime(start))}_{commit}.json")
+    os.makedirs(os.path.dirname(results_file) or '.', exist_ok=True)
+    with open(results_file, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {results_file}")
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            compare_results(json.load(f), results)
+
+
+# python -m src.benchmark.main --num_chunks 5000 --embedder stub
+# python -m src.benchmark.main --num_chunks 200 --embedder vggish --compare output/benchmark/<earlier run>.json
+# python -m src.benchmark.main --num_chunks 1000 --embedder stub --spectral_gate
+# python -m src.benchmark.main --num_chunks 200 --embedder wav2vec2 --hidden_layer 6
+if __name__ == "__main__":
+    main()
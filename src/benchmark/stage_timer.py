@@ -0,0 +1,42 @@
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+from src.dataset.audio_splitter.streaming_splitter import get_peak_rss_mb
+
+
+class StageTimer:
+    # Wall time, optional traced peak memory and the process peak RSS of each named stage. tracemalloc sees numpy
+    # and Python allocations but not torch's, and slows Python-heavy stages down, so it is opt-in.
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.stages = []
+
+    @contextmanager
+    def stage(self, name, items=None):
+        record = {'name': name, 'items': items}
+        if self.trace_memory:
+            tracemalloc.start()
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record['seconds'] = time.perf_counter() - start
+            if self.trace_memory:
+                record['peak_traced_mb'] = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+                tracemalloc.stop()
+            record['peak_rss_mb'] = get_peak_rss_mb()
+            if record['items']:
+                record['items_per_second'] = record['items'] / max(record['seconds'], 1e-9)
+            self.stages.append(record)
+            print(self.format_stage(record))
+
+    @staticmethod
+    def format_stage(record):
+        line = f"{record['name']:<28}{record['seconds']:>10.3f}s"
+        if record.get('items_per_second'):
+            line += f"{record['items_per_second']:>14.1f} items/s"
+        if 'peak_traced_mb' in record:
+            line += f"{record['peak_traced_mb']:>10.1f} MB traced"
+        return line + f"{record['peak_rss_mb']:>10.1f} MB peak RSS"
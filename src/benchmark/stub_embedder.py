@@ -0,0 +1,32 @@
+import numpy as np
+import torch
+
+from src.features.audio_embedding.audio_embedder import AudioEmbedder
+from src.features.audio_embedding.vggish_features import (NUM_BANDS, NUM_FRAMES, waveform_to_examples,
+                                                         wavfile_to_examples)
+
+STUB_EMBEDDING_SIZE = 128
+
+
+class StubAudioEmbedder(AudioEmbedder):
+    # Stand-in for VGGish with the same features and output shape: a fixed random projection of each log-mel
+    # example followed by a ReLU. It needs no model download and costs one small GEMM, so retrieval and
+    # classification can be benchmarked at corpus sizes the real model would take hours to embed.
+    def __init__(self, audio_data, batch_size=64, feature_pipeline=None, seed=0, gate=None):
+        self.seed = seed
+        super().__init__(audio_data, torch.device("cpu"), batch_size, feature_pipeline, gate)
+
+    def load_model(self):
+        rng = np.random.default_rng(self.seed)
+        projection = rng.standard_normal((NUM_FRAMES * NUM_BANDS, STUB_EMBEDDING_SIZE)).astype(np.float32)
+        self.projection = projection / np.sqrt(NUM_FRAMES * NUM_BANDS)
+
+    def get_feature_extractor(self):
+        return wavfile_to_examples
+
+    def waveform_to_features(self, samples, sample_rate):
+        return waveform_to_examples(samples, sample_rate)
+
+    def embed_features(self, features):
+        features = np.asarray(features, dtype=np.float32).reshape(len(features), -1)
+        return torch.from_numpy(np.maximum(features @ self.projection, 0))
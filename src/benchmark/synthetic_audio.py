@@ -0,0 +1,68 @@
+import os
+
+import numpy as np
+import soundfile as sf
+
+SIREN_LABEL = 'siren'
+NOISE_LABEL = 'nosiren'
+
+
+def siren_waveform(num_samples, sample_rate, rng):
+    # Wail or yelp: a tone sweeping between a low and a high frequency in the 500-1800 Hz band, with two harmonics
+    # and background noise.
+    low = rng.uniform(500, 800)
+    high = rng.uniform(1200, 1800)
+    period = rng.uniform(0.25, 0.5) if rng.random() < 0.5 else rng.uniform(2.0, 4.0)
+    t = np.arange(num_samples) / sample_rate
+    sweep = (1 - np.cos(2 * np.pi * (t / period + rng.random()))) / 2
+    phase = 2 * np.pi * np.cumsum(low + (high - low) * sweep) / sample_rate
+    tone = np.sin(phase) + 0.3 * np.sin(2 * phase) + 0.1 * np.sin(3 * phase)
+    return 0.3 * tone / 1.4 + noise_waveform(num_samples, sample_rate, rng, 0.05)
+
+
+def noise_waveform(num_samples, sample_rate, rng, amplitude=None):
+    # Brown-ish traffic rumble with occasional short broadband bursts.
+    amplitude = rng.uniform(0.05, 0.3) if amplitude is None else amplitude
+    rumble = np.cumsum(rng.standard_normal(num_samples))
+    rumble -= np.convolve(rumble, np.ones(256) / 256, mode='same')
+    rumble /= max(np.abs(rumble).max(), 1e-9)
+    burst_seconds = (rng.random(num_samples // sample_rate + 1) < 0.2).repeat(sample_rate)[:num_samples]
+    bursts = rng.standard_normal(num_samples) * burst_seconds
+    return amplitude * (0.8 * rumble + 0.2 * bursts)
+
+
+def write_corpus_recording(filepath, num_chunks, chunk_seconds, sample_rate, siren_fraction=0.3, seed=42):
+    # One long recording of chunk-aligned siren and noise segments. Returns the label of every chunk.
+    rng = np.random.default_rng(seed)
+    chunk_samples = int(chunk_seconds * sample_rate)
+    labels = np.where(rng.random(num_chunks) < siren_fraction, SIREN_LABEL, NOISE_LABEL)
+    os.makedirs(os.path.dirname(filepath) or '.', exist_ok=True)
+    with sf.SoundFile(filepath, 'w', samplerate=sample_rate, channels=1, subtype='PCM_16') as f:
+        for label in labels:
+            generate = siren_waveform if label == SIREN_LABEL else noise_waveform
+            f.write(np.clip(generate(chunk_samples, sample_rate, rng), -1, 1).astype(np.float32))
+    return labels
+
+
+def write_clip(filepath, seconds, sample_rate, label=SIREN_LABEL, seed=0):
+    rng = np.random.default_rng(seed)
+    generate = siren_waveform if label == SIREN_LABEL else noise_waveform
+    os.makedirs(os.path.dirname(filepath) or '.', exist_ok=True)
+    sf.write(filepath, np.clip(generate(int(seconds * sample_rate), sample_rate, rng), -1, 1), sample_rate,
+             subtype='PCM_16')
+
+
+def write_label_folders(chunk_paths, labels, labeled_root):
+    # Mirrors the test_labeled layout (<root>/siren, <root>/nosiren) with hard links to the chunk files.
+    folders = {}
+    for label in (SIREN_LABEL, NOISE_LABEL):
+        folders[label] = os.path.join(labeled_root, label)
+        os.makedirs(folders[label], exist_ok=True)
+    for path, label in zip(chunk_paths, labels):
+        link = os.path.join(folders[label], os.path.basename(path))
+        if not os.path.exists(link):
+            try:
+                os.link(path, link)
+            except OSError:
+                os.symlink(os.path.abspath(path), link)
+    return folders[SIREN_LABEL], folders[NOISE_LABEL]
@@ -1,26 +1,82 @@
 import os
+import re
 
-from pydub import AudioSegment
+import numpy as np
+import soundfile as sf
 from tqdm import tqdm
 
+from src.utils.instrumentation import span
 from .time import format_duration
 
 SUPPORTED_AUDIO_FORMATS = ['.m4a', '.wav', '.mp3', '.flac']
 OUTPUT_AUDIO_FILE_FORMAT = 'wav'
+# <recording>_<duration>_chunk_<n>_<duration>.wav as written by get_chunk_name, with durations from format_duration.
+CHUNK_NAME_PATTERN = re.compile(r'^(?P<recording>.+)_(?P<duration>\d+(?:h\d+m|m\d+s|s))_chunk_(?P<index>\d+)_'
+                                r'(?P=duration)\.' + OUTPUT_AUDIO_FILE_FORMAT + '$')
+
+
+def parse_chunk_name(file_path):
+    # (source recording name, 1-based chunk index) of a chunk file, or None for files not named by AudioSplitter.
+    match = CHUNK_NAME_PATTERN.match(os.path.basename(file_path))
+    if match is None:
+        return None
+    return match.group('recording'), int(match.group('index'))
 
 
 class AudioSplitter:
-    def __init__(self, chunk_length_ms, output_folder):
+    def __init__(self, chunk_length_ms, output_folder, show_progress=True):
         self.chunk_length_ms = chunk_length_ms
         self.output_folder = output_folder
+        self.show_progress = show_progress
 
     def is_folder_empty(self, folder):
         return all(f.startswith('.') for f in os.listdir(folder))
 
+    def get_output_folder(self, file_path):
+        base_name = os.path.splitext(os.path.basename(file_path))[0]
+        return os.path.join(self.output_folder, f"{base_name}_{format_duration(self.chunk_length_ms)}")
+
+    def get_chunk_name(self, file_path, chunk_index, chunk_duration_ms):
+        base_name = os.path.splitext(os.path.basename(file_path))[0]
+        duration = format_duration(chunk_duration_ms)
+        return os.path.join(self.get_output_folder(file_path),
+                            f"{base_name}_{duration}_chunk_{chunk_index + 1}_{duration}.{OUTPUT_AUDIO_FILE_FORMAT}")
+
+    @staticmethod
+    def load_samples(file_path):
+        # Decodes the whole file once into a float32 (samples, channels) buffer in [-1, 1].
+        from pydub import AudioSegment
+
+        audio = AudioSegment.from_file(file_path)
+        raw_samples = audio.get_array_of_samples()
+        samples = np.frombuffer(raw_samples, dtype=np.dtype(raw_samples.typecode)).reshape(-1, audio.channels)
+        return samples.astype(np.float32) / float(1 << (8 * audio.sample_width - 1)), audio.frame_rate
+
+    def iter_chunks(self, file_path, write_files=False):
+        # Yields (chunk_id, samples, sample_rate) for every full chunk without going through WAV files. Chunks are
+        # sample-accurate views over one decoded buffer, and chunk ids are the paths split_audio would write, so
+        # embeddings stored for them line up with split folders. Optionally writes the chunk files as well.
+        with span('decode'):
+            samples, sample_rate = self.load_samples(file_path)
+        chunk_samples = self.chunk_length_ms * sample_rate // 1000
+        if write_files:
+            os.makedirs(self.get_output_folder(file_path), exist_ok=True)
+
+        for j, start in enumerate(range(0, len(samples) - chunk_samples + 1, chunk_samples)):
+            chunk = samples[start:start + chunk_samples]
+            chunk_id = self.get_chunk_name(file_path, j, self.chunk_length_ms)
+            if write_files:
+                sf.write(chunk_id, chunk, sample_rate, subtype='PCM_16')
+            yield chunk_id, chunk, sample_rate
+
     def split_audio(self, file_path):
+        # Returns the number of chunks written, or None when the file was skipped or could not be loaded.
+        from pydub import AudioSegment
+
         print(f"Processing file: {file_path}")
         try:
-            audio = AudioSegment.from_file(file_path)
+            with span('decode'):
+                audio = AudioSegment.from_file(file_path)
         except Exception as e:
             print(f"Error loading file {file_path}: {e}")
             return
@@ -33,9 +89,7 @@ class AudioSplitter:
             chunk = audio[i:i + self.chunk_length_ms]
             chunks.append(chunk)
 
-        base_name = os.path.splitext(os.path.basename(file_path))[0]
-        duration = format_duration(self.chunk_length_ms)
-        output_folder = os.path.join(self.output_folder, f"{base_name}_{duration}")
+        output_folder = self.get_output_folder(file_path)
 
         if not os.path.exists(output_folder):
             os.makedirs(output_folder)
@@ -43,19 +97,22 @@ class AudioSplitter:
             print(f"Skipping {output_folder} because it is not empty.")
             return
 
-        for j, chunk in tqdm(enumerate(chunks), total=len(chunks)):
-            actual_duration_ms = len(chunk)
-            duration = format_duration(actual_duration_ms)
-            chunk_name = os.path.join(output_folder,
-                                      f"{base_name}_{duration}_chunk_{j + 1}_{duration}.{OUTPUT_AUDIO_FILE_FORMAT}")
-            if duration == desired_chunk_duration:
-                try:
-                    chunk.export(chunk_name, format=OUTPUT_AUDIO_FILE_FORMAT)
-                except Exception as e:
-                    print(f"Error exporting {chunk_name}: {e}")
-            else:
-                print(f"Skipping creating chunk {chunk_name} because it does not match the desired length of "
-                      f"{desired_chunk_duration}. Actual length is found as {duration}.")
+        num_chunks = 0
+        with span('write_chunks', chunks=len(chunks), audio_seconds=total_length_ms / 1000):
+            for j, chunk in tqdm(enumerate(chunks), total=len(chunks), disable=not self.show_progress):
+                actual_duration_ms = len(chunk)
+                duration = format_duration(actual_duration_ms)
+                chunk_name = self.get_chunk_name(file_path, j, actual_duration_ms)
+                if duration == desired_chunk_duration:
+                    try:
+                        chunk.export(chunk_name, format=OUTPUT_AUDIO_FILE_FORMAT)
+                        num_chunks += 1
+                    except Exception as e:
+                        print(f"Error exporting {chunk_name}: {e}")
+                else:
+                    print(f"Skipping creating chunk {chunk_name} because it does not match the desired length of "
+                          f"{desired_chunk_duration}. Actual length is found as {duration}.")
+        return num_chunks
 
     def process_file(self, file_path):
         if not os.path.isfile(file_path):
@@ -67,4 +124,4 @@ class AudioSplitter:
             print(f"Error: {file_path} is not a supported audio file.")
             return
 
-        self.split_audio(file_path)
+        return self.split_audio(file_path)
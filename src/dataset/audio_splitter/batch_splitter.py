@@ -0,0 +1,62 @@
+import glob
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from .audio_splitter import SUPPORTED_AUDIO_FORMATS
+
+FileSplitResult = namedtuple('FileSplitResult', ['file_path', 'num_chunks', 'elapsed_seconds'])
+
+
+def collect_audio_files(input_folder=None, input_glob=None):
+    if input_glob is not None:
+        candidates = glob.glob(input_glob, recursive=True)
+    else:
+        candidates = [os.path.join(input_folder, file) for file in os.listdir(input_folder)]
+    return sorted(path for path in candidates
+                  if os.path.isfile(path) and not os.path.basename(path).startswith('.')
+                  and os.path.splitext(path)[1].lower() in SUPPORTED_AUDIO_FORMATS)
+
+
+def _split_file(splitter, file_path):
+    start = time.perf_counter()
+    num_chunks = splitter.process_file(file_path)
+    return FileSplitResult(file_path, num_chunks, time.perf_counter() - start)
+
+
+class BatchAudioSplitter:
+    # Splits many recordings concurrently, one file per worker process. Each file keeps the single-file
+    # behaviour of the wrapped splitter, including skipping output folders that are not empty.
+    def __init__(self, splitter, num_workers=None):
+        self.splitter = splitter
+        self.num_workers = num_workers or os.cpu_count()
+
+    def split_files(self, file_paths):
+        start = time.perf_counter()
+        results = []
+        with ProcessPoolExecutor(max_workers=self.num_workers) as executor:
+            futures = [executor.submit(_split_file, self.splitter, file_path) for file_path in file_paths]
+            for future in as_completed(futures):
+                results.append(future.result())
+        self.print_summary(sorted(results), time.perf_counter() - start)
+        return results
+
+    def print_summary(self, results, elapsed_seconds):
+        chunk_seconds = self.splitter.chunk_length_ms / 1000
+        print("\n**Split summary**")
+        for result in results:
+            if result.num_chunks is None:
+                print(f"{result.file_path}: skipped")
+            else:
+                audio_seconds = result.num_chunks * chunk_seconds
+                print(f"{result.file_path}: {result.num_chunks} chunks, {audio_seconds:.0f}s of audio in "
+                      f"{result.elapsed_seconds:.1f}s ({audio_seconds / max(result.elapsed_seconds, 1e-9):.1f} "
+                      f"audio seconds/s)")
+
+        split = [result for result in results if result.num_chunks is not None]
+        total_chunks = sum(result.num_chunks for result in split)
+        total_audio_seconds = total_chunks * chunk_seconds
+        print(f"Total: {len(split)} of {len(results)} files split into {total_chunks} chunks, "
+              f"{total_audio_seconds:.0f}s of audio in {elapsed_seconds:.1f}s wall time with {self.num_workers} "
+              f"workers ({total_audio_seconds / max(elapsed_seconds, 1e-9):.1f} audio seconds/s)")
@@ -1,18 +1,50 @@
 import argparse
-from .audio_splitter import AudioSplitter
+
+from src.utils.instrumentation import add_profiling_arguments, start_profiling
 
 def main():
     parser = argparse.ArgumentParser(description="Split audio files into chunks.")
     parser.add_argument("--output_folder", type=str, default="data/processed", help="Output folder for processed audio files")
     parser.add_argument("--chunk_length_ms", type=int, default=3000, help="Length of each chunk in milliseconds")
     parser.add_argument("--input_file", type=str, help="Specific audio file to split")
+    parser.add_argument("--input_folder", type=str, help="Folder whose supported audio files are all split")
+    parser.add_argument("--input_glob", type=str, help="Glob pattern of audio files to split, e.g. 'data/raw/**/*.m4a'")
+    parser.add_argument("--num_workers", type=int, default=None,
+                        help="Worker processes for --input_folder/--input_glob. Defaults to the number of CPUs")
+    parser.add_argument("--streaming", action="store_true",
+                        help="Decode the input chunk by chunk so memory stays constant for very long recordings")
+    parser.add_argument("--resume", action="store_true",
+                        help="With --streaming, continue an interrupted split after the last chunk written")
+    add_profiling_arguments(parser)
 
     args = parser.parse_args()
+    start_profiling(args, 'audio_splitter')
+
+    # Decoding libraries are only imported once the arguments are valid.
+    from .audio_splitter import AudioSplitter
+    from .batch_splitter import BatchAudioSplitter, collect_audio_files
+    from .streaming_splitter import StreamingAudioSplitter
+
+    batch_mode = args.input_folder is not None or args.input_glob is not None
+    if args.streaming:
+        splitter = StreamingAudioSplitter(args.chunk_length_ms, args.output_folder, resume=args.resume,
+                                          show_progress=not batch_mode)
+    else:
+        splitter = AudioSplitter(args.chunk_length_ms, args.output_folder, show_progress=not batch_mode)
 
-    splitter = AudioSplitter(args.chunk_length_ms, args.output_folder)
-    splitter.process_file(args.input_file)
+    if batch_mode:
+        file_paths = collect_audio_files(args.input_folder, args.input_glob)
+        if not file_paths:
+            print("Error: no supported audio files found.")
+            return
+        BatchAudioSplitter(splitter, args.num_workers).split_files(file_paths)
+    elif args.input_file is not None:
+        splitter.process_file(args.input_file)
+    else:
+        parser.error("one of --input_file, --input_folder or --input_glob is required")
 
 
-# python -m src.data.audio_splitter.main --input_folder data/raw --chunk_length_ms 3000 --input_file data/raw/Sample_1.m4a
+# python -m src.dataset.audio_splitter.main --chunk_length_ms 3000 --input_file data/raw/Sample_1.m4a
+# python -m src.dataset.audio_splitter.main --chunk_length_ms 3000 --input_folder data/raw --num_workers 8
 if __name__ == "__main__":
     main()
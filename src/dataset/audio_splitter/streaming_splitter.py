@@ -0,0 +1,134 @@
+import json
+import os
+import re
+import resource
+import subprocess
+import sys
+import time
+
+import numpy as np
+import soundfile as sf
+from tqdm import tqdm
+
+from src.utils.instrumentation import record
+from .audio_splitter import AudioSplitter
+from .time import format_duration
+
+# Formats soundfile can read block by block; everything else is decoded through an ffmpeg pipe.
+SOUNDFILE_FORMATS = ['.wav', '.flac']
+PIPE_BUFFER_SIZE = 1 << 20
+_CHUNK_INDEX_PATTERN = re.compile(r'_chunk_(\d+)_')
+
+
+def get_peak_rss_mb():
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and in kilobytes on Linux.
+    return peak_rss / (1024 * 1024) if sys.platform == 'darwin' else peak_rss / 1024
+
+
+class StreamingAudioSplitter(AudioSplitter):
+    # Decodes the input one chunk at a time (soundfile block reads or an ffmpeg pipe) so peak memory does not grow
+    # with the length of the recording. With resume, chunks already present in the output folder are kept and
+    # decoding starts right after the last complete one.
+    def __init__(self, chunk_length_ms, output_folder, resume=False, show_progress=True):
+        super().__init__(chunk_length_ms, output_folder, show_progress)
+        self.resume = resume
+
+    @staticmethod
+    def probe(file_path):
+        if os.path.splitext(file_path)[1].lower() in SOUNDFILE_FORMATS:
+            info = sf.info(file_path)
+            return info.samplerate, info.channels
+        output = subprocess.run(['ffprobe', '-v', 'error', '-select_streams', 'a:0', '-show_entries',
+                                 'stream=sample_rate,channels', '-of', 'json', file_path],
+                                check=True, capture_output=True, text=True).stdout
+        stream = json.loads(output)['streams'][0]
+        return int(stream['sample_rate']), int(stream['channels'])
+
+    @staticmethod
+    def read_blocks(file_path, block_frames, sample_rate, channels, start_frame=0):
+        # Yields float32 (frames, channels) blocks of exactly block_frames; the trailing partial block is dropped.
+        if os.path.splitext(file_path)[1].lower() in SOUNDFILE_FORMATS:
+            with sf.SoundFile(file_path) as f:
+                f.seek(start_frame)
+                while True:
+                    block = f.read(block_frames, dtype='float32', always_2d=True)
+                    if len(block) < block_frames:
+                        return
+                    yield block
+            return
+
+        command = ['ffmpeg', '-nostdin', '-v', 'error', '-ss', f"{start_frame / sample_rate:.6f}", '-i', file_path,
+                   '-f', 's16le', '-acodec', 'pcm_s16le', '-']
+        block_bytes = block_frames * channels * 2
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, bufsize=PIPE_BUFFER_SIZE)
+        try:
+            while True:
+                data = process.stdout.read(block_bytes)
+                if len(data) < block_bytes:
+                    return
+                yield np.frombuffer(data, dtype='<i2').reshape(-1, channels).astype(np.float32) / 32768.0
+        finally:
+            process.stdout.close()
+            process.kill()
+            process.wait()
+
+    def get_completed_chunks(self, file_path):
+        # Number of leading chunks, 1..n without gaps, already written to the output folder.
+        output_folder = self.get_output_folder(file_path)
+        if not os.path.isdir(output_folder):
+            return 0
+        written = set()
+        for file_name in os.listdir(output_folder):
+            match = _CHUNK_INDEX_PATTERN.search(file_name)
+            if match and not file_name.startswith('.'):
+                written.add(int(match.group(1)))
+        completed = 0
+        while completed + 1 in written:
+            completed += 1
+        return completed
+
+    def iter_chunks(self, file_path, write_files=False):
+        sample_rate, channels = self.probe(file_path)
+        chunk_frames = self.chunk_length_ms * sample_rate // 1000
+        first_chunk = self.get_completed_chunks(file_path) if self.resume and write_files else 0
+        if write_files:
+            os.makedirs(self.get_output_folder(file_path), exist_ok=True)
+
+        blocks = self.read_blocks(file_path, chunk_frames, sample_rate, channels, first_chunk * chunk_frames)
+        for j, chunk in enumerate(blocks, start=first_chunk):
+            chunk_id = self.get_chunk_name(file_path, j, self.chunk_length_ms)
+            if write_files:
+                # Written under a temporary name and renamed, so an interrupted run never leaves a partial chunk.
+                tmp_name = os.path.join(os.path.dirname(chunk_id), f".{os.path.basename(chunk_id)}.tmp")
+                sf.write(tmp_name, chunk, sample_rate, subtype='PCM_16', format='WAV')
+                os.replace(tmp_name, chunk_id)
+            yield chunk_id, chunk, sample_rate
+
+    def split_audio(self, file_path):
+        print(f"Processing file: {file_path}")
+        output_folder = self.get_output_folder(file_path)
+        if os.path.exists(output_folder) and not self.is_folder_empty(output_folder) and not self.resume:
+            print(f"Skipping {output_folder} because it is not empty.")
+            return
+
+        completed = self.get_completed_chunks(file_path) if self.resume else 0
+        if completed:
+            print(f"Resuming {output_folder} after {completed} existing chunks.")
+
+        start = time.perf_counter()
+        num_chunks = 0
+        try:
+            for _ in tqdm(self.iter_chunks(file_path, write_files=True), disable=not self.show_progress):
+                num_chunks += 1
+        except Exception as e:
+            print(f"Error splitting file {file_path}: {e}")
+            return
+
+        elapsed = time.perf_counter() - start
+        audio_seconds = num_chunks * self.chunk_length_ms / 1000
+        record('split_audio', elapsed, num_chunks, audio_seconds)
+        print(f"Wrote {num_chunks} chunks of {format_duration(self.chunk_length_ms)} ({audio_seconds:.0f}s of audio) in "
+              f"{elapsed:.1f}s: {audio_seconds / elapsed if elapsed else 0:.1f} audio seconds/s, "
+              f"peak RSS {get_peak_rss_mb():.0f} MB.")
+        return num_chunks
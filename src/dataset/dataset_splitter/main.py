@@ -1,17 +1,34 @@
-from .splitter import DataSplitter
+import argparse
+
+from src.utils.instrumentation import add_profiling_arguments, start_profiling
+from .splitter import SPLIT_MODES, DataSplitter
 
 
 def main():
-    # Directories
-    source_dir = 'data/labeled'
-    train_dir = 'data/train-2'
-    test_dir = 'data/test-2'
+    parser = argparse.ArgumentParser(description="Split a labeled dataset into train and test folders.")
+    parser.add_argument("--source_dir", type=str, default="data/labeled", help="Folder of the labeled audio files")
+    parser.add_argument("--train_dir", type=str, default="data/train-2", help="Folder the training files are copied to")
+    parser.add_argument("--test_dir", type=str, default="data/test-2", help="Folder the test files are copied to")
+    parser.add_argument("--train_size", type=float, default=0.8,
+                        help="Fraction of the source recordings (or of the files with --chunk_level) used for training")
+    parser.add_argument("--mode", type=str, choices=SPLIT_MODES, default="hardlink",
+                        help="hardlink/symlink mirror the source tree without copying audio, copy copies it, manifest "
+                             "writes <train_dir>.txt and <test_dir>.txt file lists that AudioData reads directly")
+    parser.add_argument("--chunk_level", action="store_true",
+                        help="Split chunks independently instead of keeping the chunks of a source recording together")
+    parser.add_argument("--num_workers", type=int, default=None, help="Threads linking or copying files")
+    add_profiling_arguments(parser)
+
+    args = parser.parse_args()
+    start_profiling(args, 'dataset_splitter')
 
     # Split the data
-    splitter = DataSplitter(source_dir, train_dir, test_dir)
+    splitter = DataSplitter(args.source_dir, args.train_dir, args.test_dir, args.train_size, args.mode,
+                            not args.chunk_level, args.num_workers)
     splitter.split_data()
 
 
-# python -m src.data.dataset_splitter.main
+# python -m src.dataset.dataset_splitter.main --source_dir data/labeled --train_dir data/train-2 --test_dir data/test-2 --profile
+# python -m src.dataset.dataset_splitter.main --mode manifest
 if __name__ == "__main__":
     main()
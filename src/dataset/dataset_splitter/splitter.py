@@ -1,32 +1,83 @@
-from sklearn.model_selection import train_test_split
+import os
 
-from utils.file_manager import FileManager
+from src.dataset.audio_splitter.audio_splitter import parse_chunk_name
+from src.utils.file_manager import LINK_MODES, FileManager
+from src.utils.instrumentation import span
+
+SPLIT_MODES = LINK_MODES + ['manifest']
+# Manifests are written next to the train and test folders, e.g. data/train-2.txt.
+MANIFEST_EXTENSION = '.txt'
+
+
+def get_source_recording(file_path):
+    # Chunks of one recording share its name; files not named by AudioSplitter form a group of their own.
+    parsed = parse_chunk_name(file_path)
+    return parsed[0] if parsed is not None else file_path
 
 
 class DataSplitter:
-    def __init__(self, source_dir, train_dir, test_dir, train_size=0.8):
+    # mode 'manifest' writes the train and test file lists instead of files; 'hardlink' and 'symlink' mirror the
+    # source tree without copying audio; 'copy' copies it. With group_by_recording, all chunks of a source
+    # recording land on the same side of the split, so neighbouring chunks cannot leak from train into test.
+    def __init__(self, source_dir, train_dir, test_dir, train_size=0.8, mode='hardlink', group_by_recording=True,
+                 num_workers=None):
+        if mode not in SPLIT_MODES:
+            raise ValueError(f"Unsupported split mode: {mode}. Choose from {SPLIT_MODES}.")
         self.source_dir = source_dir
         self.train_dir = train_dir
         self.test_dir = test_dir
         self.train_size = train_size
+        self.mode = mode
+        self.group_by_recording = group_by_recording
+        self.num_workers = num_workers
 
     def split_data(self):
+        from sklearn.model_selection import GroupShuffleSplit, train_test_split
+
         # Check and create directories
-        for directory in [self.train_dir, self.test_dir]:
-            FileManager.create_directory(directory=directory, allow_existing=True, allow_non_empty=False)
+        if self.mode != 'manifest':
+            for directory in [self.train_dir, self.test_dir]:
+                FileManager.create_directory(directory=directory, allow_existing=True, allow_non_empty=False)
 
         # Get all files
-        all_files = FileManager.get_all_non_system_files(self.source_dir)
+        all_files = sorted(FileManager.get_all_non_system_files(self.source_dir))
         print(f"Total files found: {len(all_files)}")
 
         if not all_files:
             raise ValueError("No files found in the source directory. Please check the path.")
 
         # Split the files
-        train_files, test_files = train_test_split(all_files, train_size=self.train_size, random_state=42)
+        if self.group_by_recording:
+            groups = [get_source_recording(file) for file in all_files]
+            num_groups = len(set(groups))
+            print(f"Source recordings found: {num_groups}")
+            if num_groups < 2:
+                raise ValueError("Splitting by source recording needs at least two recordings. "
+                                 "Split at the chunk level instead.")
+            group_splitter = GroupShuffleSplit(n_splits=1, train_size=self.train_size, random_state=42)
+            train_indices, test_indices = next(group_splitter.split(all_files, groups=groups))
+            train_files = [all_files[i] for i in train_indices]
+            test_files = [all_files[i] for i in test_indices]
+        else:
+            train_files, test_files = train_test_split(all_files, train_size=self.train_size, random_state=42)
         print(f"Training files: {len(train_files)}")
         print(f"Testing files: {len(test_files)}")
 
-        # Copy files to train and test directories
-        FileManager.copy_files(train_files, self.source_dir, self.train_dir)
-        FileManager.copy_files(test_files, self.source_dir, self.test_dir)
+        # Write manifests, or link or copy files to train and test directories
+        with span('write_split', chunks=len(all_files)):
+            if self.mode == 'manifest':
+                for files, directory in [(train_files, self.train_dir), (test_files, self.test_dir)]:
+                    self.write_manifest(files, f"{os.path.normpath(directory)}{MANIFEST_EXTENSION}")
+            else:
+                copied = (FileManager.link_files(train_files, self.source_dir, self.train_dir, self.mode, self.num_workers)
+                          + FileManager.link_files(test_files, self.source_dir, self.test_dir, self.mode, self.num_workers))
+                if copied and self.mode != 'copy':
+                    print(f"{copied} files could not be linked and were copied instead.")
+        return train_files, test_files
+
+    @staticmethod
+    def write_manifest(files, manifest_path):
+        os.makedirs(os.path.dirname(manifest_path) or '.', exist_ok=True)
+        with open(manifest_path, 'w') as f:
+            f.writelines(f"{file}\n" for file in files)
+        print(f"Wrote {len(files)} paths to {manifest_path}")
@@ -1,13 +1,73 @@
 import argparse
+import hashlib
+import json
 import os
+import struct
+import time
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from src.features.audio_embedding.fingerprint import CONTENT_HASH_SIZE, hash_file_content
+from src.utils.instrumentation import add_profiling_arguments, span, start_profiling
+
+_READ_BLOCK_SIZE = 1 << 20
+DEFAULT_NEAR_DUPLICATE_THRESHOLD = 0.99
+# Corpus rows compared against all others per matrix product when looking for near duplicates.
+NEAR_DUPLICATE_BLOCK_SIZE = 2048
+
+
+def hash_audio_payload(filepath):
+    # Digest of the format and sample data of a WAV file, so copies whose headers or metadata chunks differ still
+    # match. Other formats, and WAV files whose chunks cannot be followed, are hashed whole.
+    digest = hashlib.blake2b(digest_size=CONTENT_HASH_SIZE)
+    with open(filepath, 'rb') as f:
+        header = f.read(12)
+        if len(header) == 12 and header[:4] == b'RIFF' and header[8:] == b'WAVE':
+            while True:
+                chunk_header = f.read(8)
+                if len(chunk_header) < 8:
+                    break
+                chunk_id, size = chunk_header[:4], struct.unpack('<I', chunk_header[4:])[0]
+                if chunk_id == b'fmt ':
+                    digest.update(f.read(size))
+                    f.seek(size % 2, os.SEEK_CUR)
+                elif chunk_id == b'data':
+                    remaining = size
+                    while remaining > 0:
+                        block = f.read(min(_READ_BLOCK_SIZE, remaining))
+                        if not block:
+                            break
+                        digest.update(block)
+                        remaining -= len(block)
+                    return digest.digest()
+                else:
+                    f.seek(size + size % 2, os.SEEK_CUR)
+    return hash_file_content(filepath)
+
+
+def find_near_duplicates(matrix, threshold, block_size=NEAR_DUPLICATE_BLOCK_SIZE):
+    # Pairs (i, j, similarity) with i < j whose L2-normalized embeddings have a cosine similarity >= threshold.
+    pairs = []
+    for start in range(0, len(matrix), block_size):
+        similarities = matrix[start:start + block_size] @ matrix.T
+        rows, cols = np.nonzero(similarities >= threshold)
+        keep = cols > rows + start
+        for row, col in zip(rows[keep], cols[keep]):
+            pairs.append((start + int(row), int(col), float(similarities[row, col])))
+    return pairs
 
 
 class FileStructure:
+    # Walks the tree once. The file count of every directory is accumulated during the walk, so printing the
+    # tree does not count sub trees again at every level.
     def __init__(self, base_dir):
         self.base_dir = base_dir
         self.file_structure = {}
         self.duplicates = defaultdict(list)
+        self.file_paths = []
+        self.directory_counts = defaultdict(int)
         self._build_file_structure()
 
     def _build_file_structure(self):
@@ -19,11 +79,15 @@ class FileStructure:
                 relative_path = os.path.relpath(file_path, self.base_dir)
                 dir_structure = self.file_structure
 
-                for part in relative_path.split(os.sep)[:-1]:
+                parts = relative_path.split(os.sep)
+                self.directory_counts[()] += 1
+                for depth, part in enumerate(parts[:-1]):
                     dir_structure = dir_structure.setdefault(part, {})
-                dir_structure[relative_path.split(os.sep)[-1]] = file_path
+                    self.directory_counts[tuple(parts[:depth + 1])] += 1
+                dir_structure[parts[-1]] = file_path
 
                 self.duplicates[file].append(file_path)
+                self.file_paths.append(file_path)
 
     def count_files(self, structure):
         if isinstance(structure, str):
@@ -33,34 +97,89 @@ class FileStructure:
     def find_duplicates(self):
         return {file: paths for file, paths in self.duplicates.items() if len(paths) > 1}
 
+    def get_group(self, file_path):
+        # Top level folder of a file, e.g. train/test or siren/nosiren; duplicates across groups leak labels.
+        return os.path.relpath(file_path, self.base_dir).split(os.sep)[0]
 
-class FileStructurePrinter:
-    @staticmethod
-    def print_structure(structure, indent="", is_last=True):
-        for i, (name, substructure) in enumerate(structure.items()):
-            if isinstance(substructure, str):
+
+class DuplicateFinder:
+    # Exact duplicates share the digest of their audio payload, hashed across files in a thread pool (hashlib
+    # releases the GIL on large buffers). Near duplicates are optional and come from stored VGGish embeddings:
+    # pairs of files whose pooled embeddings have a cosine similarity of at least the threshold.
+    def __init__(self, file_structure, num_workers=None):
+        self.file_structure = file_structure
+        self.num_workers = num_workers or min(32, (os.cpu_count() or 1) + 4)
+        self.hashes = {}
+        self.hash_seconds = 0.0
+
+    def hash_files(self):
+        file_paths = self.file_structure.file_paths
+        start = time.perf_counter()
+        with span('hash_files', chunks=len(file_paths)), ThreadPoolExecutor(max_workers=self.num_workers) as executor:
+            self.hashes = dict(zip(file_paths, executor.map(hash_audio_payload, file_paths)))
+        self.hash_seconds = time.perf_counter() - start
+        return self.hashes
+
+    def find_exact_duplicates(self):
+        groups = defaultdict(list)
+        for path, digest in self.hashes.items():
+            groups[digest].append(path)
+        return [{'hash': digest.hex(), 'paths': paths, 'cross_group': self._is_cross_group(paths)}
+                for digest, paths in groups.items() if len(paths) > 1]
+
+    def find_near_duplicates(self, embedding_file, threshold=DEFAULT_NEAR_DUPLICATE_THRESHOLD):
+        from src.features.audio_embedding.embedding_store import create_embedding_store
+        from src.features.audio_embedding.retriever import pool_and_normalize
+
+        # Stored paths are matched to the scanned files by absolute path.
+        scanned = {os.path.abspath(path): path for path in self.file_structure.file_paths}
+        paths = []
+        embeddings = []
+        with span('load_embeddings'):
+            for path, embedding in create_embedding_store(embedding_file).load():
+                file_path = scanned.get(os.path.abspath(path))
+                if file_path is not None:
+                    paths.append(file_path)
+                    embeddings.append(pool_and_normalize(embedding))
+        print(f"Found stored embeddings for {len(paths)} of {len(scanned)} files.")
+        if not paths:
+            return []
+
+        with span('near_duplicates', chunks=len(paths)):
+            pairs = find_near_duplicates(np.stack(embeddings), threshold)
+        near_duplicates = []
+        for i, j, similarity in pairs:
+            # Byte-identical audio is already reported as an exact duplicate.
+            if self.hashes and self.hashes[paths[i]] == self.hashes[paths[j]]:
                 continue
-            else:
-                num_files = FileStructurePrinter._count_files(substructure)
-                if i == len(structure) - 1:
-                    print(f"{indent}└── {name}/ ({num_files} files)")
-                    FileStructurePrinter.print_structure(substructure, indent + "    ", True)
-                else:
-                    print(f"{indent}├── {name}/ ({num_files} files)")
-                    FileStructurePrinter.print_structure(substructure, indent + "│   ", False)
+            near_duplicates.append({'paths': [paths[i], paths[j]], 'similarity': similarity,
+                                    'cross_group': self._is_cross_group([paths[i], paths[j]])})
+        return sorted(near_duplicates, key=lambda pair: -pair['similarity'])
+
+    def _is_cross_group(self, paths):
+        return len({self.file_structure.get_group(path) for path in paths}) > 1
 
+
+class FileStructurePrinter:
     @staticmethod
-    def _count_files(structure):
-        if isinstance(structure, str):
-            return 1
-        return sum(FileStructurePrinter._count_files(substructure) for substructure in structure.values())
+    def print_structure(file_structure, structure, indent="", is_last=True, path=()):
+        directories = [(name, substructure) for name, substructure in structure.items()
+                       if not isinstance(substructure, str)]
+        for i, (name, substructure) in enumerate(directories):
+            num_files = file_structure.directory_counts[path + (name,)]
+            if i == len(directories) - 1:
+                print(f"{indent}└── {name}/ ({num_files} files)")
+                FileStructurePrinter.print_structure(file_structure, substructure, indent + "    ", True, path + (name,))
+            else:
+                print(f"{indent}├── {name}/ ({num_files} files)")
+                FileStructurePrinter.print_structure(file_structure, substructure, indent + "│   ", False, path + (name,))
 
     @staticmethod
     def print_state(base_dir, file_structure):
         print("**State of data**")
-        num_files = FileStructurePrinter._count_files(file_structure.file_structure)
+        num_files = file_structure.directory_counts[()]
         print(f"{os.path.basename(base_dir)}/ ({num_files} files)")
-        FileStructurePrinter.print_structure(file_structure.file_structure, "    ")
+        FileStructurePrinter.print_structure(file_structure, file_structure.file_structure, "    ")
 
     @staticmethod
     def print_duplicates(duplicates):
@@ -74,11 +193,41 @@ class FileStructurePrinter:
             print("\n**Duplicates**")
             print("No duplicate files found.")
 
+    @staticmethod
+    def print_exact_duplicates(exact_duplicates):
+        print("\n**Exact duplicates (same audio payload)**")
+        if not exact_duplicates:
+            print("No exact duplicates found.")
+        for group in exact_duplicates:
+            print(f"{group['hash']}{' (across groups)' if group['cross_group'] else ''}")
+            for path in group['paths']:
+                print(f"...{path}")
+
+    @staticmethod
+    def print_near_duplicates(near_duplicates, threshold):
+        print(f"\n**Near duplicates (embedding similarity >= {threshold})**")
+        if not near_duplicates:
+            print("No near duplicates found.")
+        for pair in near_duplicates:
+            print(f"{pair['similarity']:.4f}{' (across groups)' if pair['cross_group'] else ''}")
+            for path in pair['paths']:
+                print(f"...{path}")
+
 
 def main():
     parser = argparse.ArgumentParser(description="Analyze the file structure of a directory.")
     parser.add_argument('--base_dir', type=str, default='data/labeled', help='The base directory to analyze')
+    parser.add_argument('--skip_hashing', action='store_true',
+                        help="Only report duplicates by file name instead of hashing the audio of every file")
+    parser.add_argument('--num_workers', type=int, default=None, help="Threads hashing files in parallel")
+    parser.add_argument('--embedding_file', type=str, default=None,
+                        help="Embedding store of the files, e.g. embeddings/vggish_zero_shot.emb, to also find near duplicates")
+    parser.add_argument('--near_duplicate_threshold', type=float, default=DEFAULT_NEAR_DUPLICATE_THRESHOLD,
+                        help="Cosine similarity of pooled embeddings at or above which two files are near duplicates")
+    parser.add_argument('--report_file', type=str, default=None, help="Write the counts and duplicates as JSON to this file")
+    add_profiling_arguments(parser)
     args = parser.parse_args()
+    start_profiling(args, 'describe_labeled_data')
 
     base_dir = args.base_dir
 
@@ -86,14 +235,47 @@ def main():
         print(f"The directory '{base_dir}' does not exist.")
         return
 
-    file_structure = FileStructure(base_dir)
+    with span('scan_files'):
+        file_structure = FileStructure(base_dir)
 
     FileStructurePrinter.print_state(base_dir, file_structure)
 
     duplicate_files = file_structure.find_duplicates()
     FileStructurePrinter.print_duplicates(duplicate_files)
 
+    duplicate_finder = DuplicateFinder(file_structure, args.num_workers)
+    exact_duplicates = None
+    near_duplicates = None
+    if not args.skip_hashing:
+        duplicate_finder.hash_files()
+        num_files = len(file_structure.file_paths)
+        print(f"\nHashed {num_files} files in {duplicate_finder.hash_seconds:.1f}s "
+              f"({num_files / max(duplicate_finder.hash_seconds, 1e-9):.0f} files/s).")
+        exact_duplicates = duplicate_finder.find_exact_duplicates()
+        FileStructurePrinter.print_exact_duplicates(exact_duplicates)
+    if args.embedding_file is not None:
+        near_duplicates = duplicate_finder.find_near_duplicates(args.embedding_file, args.near_duplicate_threshold)
+        FileStructurePrinter.print_near_duplicates(near_duplicates, args.near_duplicate_threshold)
+
+    if args.report_file is not None:
+        report = {
+            'base_dir': base_dir,
+            'num_files': file_structure.directory_counts[()],
+            'directories': {os.sep.join(path): count for path, count in sorted(file_structure.directory_counts.items())
+                            if path},
+            'name_duplicates': duplicate_files,
+            'exact_duplicates': exact_duplicates,
+            'near_duplicates': near_duplicates,
+            'near_duplicate_threshold': args.near_duplicate_threshold if near_duplicates is not None else None,
+            'hash_seconds': duplicate_finder.hash_seconds if exact_duplicates is not None else None,
+        }
+        os.makedirs(os.path.dirname(args.report_file) or '.', exist_ok=True)
+        with open(args.report_file, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {args.report_file}")
+
 
 # python -m src.dataset.utils.describe_labeled_data --base_dir data/test_labeled
+# python -m src.dataset.utils.describe_labeled_data --base_dir data/labeled --embedding_file embeddings/vggish_zero_shot.emb --report_file output/labeled_report.json
 if __name__ == "__main__":
     main()
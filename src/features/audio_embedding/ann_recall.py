@@ -0,0 +1,66 @@
+import argparse
+import time
+
+import numpy as np
+
+from .audio_data import AudioDataFactory
+from .embedding import Embedding
+from .retriever import EmbeddingRetriever
+from .vector_index import DEFAULT_NUM_PROBES, ExactIndex, IVFIndex
+
+
+def evaluate_recall(exact_index, ann_index, queries, k):
+    # recall@k of the approximate index against exact search, with the mean latency of both per query.
+    exact_seconds = 0.0
+    ann_seconds = 0.0
+    recalls = []
+    for query in queries:
+        start = time.perf_counter()
+        exact_indices, _ = exact_index.search(query, k)
+        exact_seconds += time.perf_counter() - start
+
+        start = time.perf_counter()
+        ann_indices, _ = ann_index.search(query, k)
+        ann_seconds += time.perf_counter() - start
+
+        recalls.append(len(np.intersect1d(exact_indices, ann_indices)) / len(exact_indices))
+    return np.mean(recalls), 1000 * exact_seconds / len(queries), 1000 * ann_seconds / len(queries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report recall@k and latency of the IVF index against exact search")
+    parser.add_argument('--audio_folder', type=str, required=True, help="Path to the folder containing audio files")
+    parser.add_argument('--embedding_file', type=str, required=True, help="Path to the embedding store to search")
+    parser.add_argument('--chunk_length', type=int, choices=[1, 3], required=True,
+                        help="Length of the audio chunks in seconds (1 or 3)")
+    parser.add_argument('--k', type=int, default=10, help="Number of neighbours to retrieve")
+    parser.add_argument('--num_queries', type=int, default=200, help="Stored embeddings sampled as queries")
+    parser.add_argument('--ann_lists', type=int, default=None, help="IVF lists. Defaults to sqrt of the corpus size")
+    parser.add_argument('--ann_probes', type=int, nargs='+', default=[DEFAULT_NUM_PROBES],
+                        help="IVF lists scanned per query. Several values are reported one after another")
+
+    args = parser.parse_args()
+
+    audio_data = AudioDataFactory.create_audio_data(args.chunk_length, args.audio_folder)
+    embedding = Embedding(audio_data, args.embedding_file)
+    ann_index = IVFIndex(num_lists=args.ann_lists)
+    retriever = EmbeddingRetriever(audio_data, None, embedding, index=ann_index)
+    matrix = retriever.get_pooled_embeddings().matrix
+
+    exact_index = ExactIndex()
+    exact_index.build(matrix)
+    rng = np.random.default_rng(42)
+    queries = matrix[rng.choice(len(matrix), size=min(args.num_queries, len(matrix)), replace=False)]
+
+    print(f"Corpus: {len(matrix)} embeddings, {len(ann_index.centroids)} IVF lists, {len(queries)} queries")
+    for num_probes in args.ann_probes:
+        ann_index.num_probes = num_probes
+        recall, exact_ms, ann_ms = evaluate_recall(exact_index, ann_index, queries, args.k)
+        print(f"probes={num_probes}: recall@{args.k}={recall:.4f}, exact {exact_ms:.3f} ms/query, "
+              f"ivf {ann_ms:.3f} ms/query")
+
+
+# python -m src.features.audio_embedding.ann_recall --audio_folder data/processed/Sample_4_3s
+#                                                   --embedding_file embeddings/embeddings_Sample_4_3s.emb --chunk_length 3 --ann_probes 1 4 16
+if __name__ == "__main__":
+    main()
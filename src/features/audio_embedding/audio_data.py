@@ -1,13 +1,36 @@
 import os
 from abc import ABC, abstractmethod
 
+# VGGish emits one 128-dimensional embedding per 0.96s example; frame-level stores keep one row per example.
+FRAME_SECONDS = 0.96
+FRAME_EMBEDDING_SIZE = 128
+RECORDING_EXTENSIONS = ('.wav', '.flac')
+
+
+def seconds_to_frames(seconds):
+    # Nearest whole number of frames, at least one: 1s and 3s windows pool the 1 and 3 frames of a split chunk.
+    return max(1, int(round(seconds / FRAME_SECONDS)))
+
+
+def read_manifest(manifest_path):
+    # One audio path per line, as written by the dataset splitter's manifest mode.
+    with open(manifest_path) as f:
+        return [line.strip() for line in f if line.strip()]
+
 
 class AudioData(ABC):
-    def __init__(self, audio_folder):
+    def __init__(self, audio_folder, audio_paths=None):
+        # audio_paths can name chunks that only exist in memory, e.g. the chunk ids of AudioSplitter.iter_chunks.
         self.audio_folder = audio_folder
-        self.audio_paths = self.get_audio_paths()
+        self.audio_paths = self.get_audio_paths() if audio_paths is None else audio_paths
+        # Shape of one stored embedding when the embedder differs from VGGish, e.g. (768,) for one pooled Wav2Vec2
+        # vector per chunk; None keeps the VGGish shape of the subclass.
+        self.embedding_shape = None
 
     def get_audio_paths(self):
+        # audio_folder can also be a manifest file listing the audio paths, e.g. data/test-2.txt.
+        if os.path.isfile(self.audio_folder):
+            return sorted(path for path in read_manifest(self.audio_folder) if path.endswith('.wav'))
         return sorted(
             [os.path.join(self.audio_folder, file) for file in os.listdir(self.audio_folder) if file.endswith('.wav')])
 
@@ -19,18 +42,23 @@ class AudioData(ABC):
     def get_expected_embedding_dimension(self):
         pass
 
+    def set_embedding_shape(self, embedding_shape):
+        self.embedding_shape = tuple(embedding_shape) if embedding_shape is not None else None
+
 
 class ThreeSecondAudioData(AudioData):
     __CHUNK_LENGTH_SECONDS = 3
     __EXPECTED_EMBEDDING_DIMENSION = (3, 128)
 
-    def __init__(self, audio_folder):
-        super().__init__(audio_folder)
+    def __init__(self, audio_folder, audio_paths=None):
+        super().__init__(audio_folder, audio_paths)
 
     def get_chunk_length_seconds(self):
         return self.__CHUNK_LENGTH_SECONDS
 
     def get_expected_embedding_dimension(self):
+        if self.embedding_shape is not None:
+            return self.embedding_shape
         return self.__EXPECTED_EMBEDDING_DIMENSION
 
 
@@ -38,22 +66,58 @@ class OneSecondAudioData(AudioData):
     __CHUNK_LENGTH_SECONDS = 1
     __EXPECTED_EMBEDDING_DIMENSION = (1, 128)
 
-    def __init__(self, audio_folder):
-        super().__init__(audio_folder)
+    def __init__(self, audio_folder, audio_paths=None):
+        super().__init__(audio_folder, audio_paths)
 
     def get_chunk_length_seconds(self):
         return self.__CHUNK_LENGTH_SECONDS
 
     def get_expected_embedding_dimension(self):
+        if self.embedding_shape is not None:
+            return self.embedding_shape
         return self.__EXPECTED_EMBEDDING_DIMENSION
 
 
+class WindowedAudioData(AudioData):
+    # Whole source recordings embedded once at the frame level by FrameEmbedding, which pools the stored frames
+    # into windows of window_seconds starting every hop_seconds. Window and hop are rounded to whole frames;
+    # the hop defaults to the window, i.e. no overlap.
+    def __init__(self, audio_folder, window_seconds, hop_seconds=None, audio_paths=None):
+        self.window_seconds = window_seconds
+        self.hop_seconds = window_seconds if hop_seconds is None else hop_seconds
+        super().__init__(audio_folder, audio_paths)
+
+    def get_audio_paths(self):
+        if os.path.isfile(self.audio_folder):
+            return sorted(path for path in read_manifest(self.audio_folder) if path.endswith(RECORDING_EXTENSIONS))
+        return sorted(os.path.join(self.audio_folder, file) for file in os.listdir(self.audio_folder)
+                      if file.endswith(RECORDING_EXTENSIONS))
+
+    def get_window_frames(self):
+        return seconds_to_frames(self.window_seconds)
+
+    def get_hop_frames(self):
+        return seconds_to_frames(self.hop_seconds)
+
+    def get_chunk_length_seconds(self):
+        return self.window_seconds
+
+    def get_expected_embedding_dimension(self):
+        return self.get_window_frames(), FRAME_EMBEDDING_SIZE
+
+
 class AudioDataFactory:
     @staticmethod
-    def create_audio_data(chunk_length, audio_folder):
+    def create_audio_data(chunk_length, audio_folder, audio_paths=None):
         if chunk_length == 1:
-            return OneSecondAudioData(audio_folder)
+            return OneSecondAudioData(audio_folder, audio_paths)
         elif chunk_length == 3:
-            return ThreeSecondAudioData(audio_folder)
+            return ThreeSecondAudioData(audio_folder, audio_paths)
         else:
             raise ValueError("Invalid chunk length. Only 1 or 3 seconds are supported.")
+
+    @staticmethod
+    def create_windowed_audio_data(window_seconds, hop_seconds, audio_folder, audio_paths=None):
+        if window_seconds <= 0 or (hop_seconds is not None and hop_seconds <= 0):
+            raise ValueError("Window and hop lengths must be positive.")
+        return WindowedAudioData(audio_folder, window_seconds, hop_seconds, audio_paths)
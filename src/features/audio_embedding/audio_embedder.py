@@ -1,42 +1,247 @@
+import copy
+import os
 from abc import ABC, abstractmethod
 
+import numpy as np
 import torch
 from tqdm import tqdm
 
 import config
+from src.utils.instrumentation import count, span, timed_iter
+from .embedder_registry import COMPILE_MODES, QUANTIZATION_MODES
+from .model_cache import VGGishNetwork, example_inputs, load_cached_model, model_cache_path, save_cached_model
+from .vggish_features import EXAMPLE_HOP_SECONDS, waveform_to_examples, wavfile_to_examples
 
+DEFAULT_BATCH_SIZE = 64
+EMBEDDING_SIZE = 128
+# Upper bound on the examples of one forward pass, so whole recordings do not stack hours of features at once.
+MAX_FORWARD_EXAMPLES = 1024
+# Chunks whose features calibrate the activation ranges of static quantization, drawn with a fixed seed.
+DEFAULT_CALIBRATION_CHUNKS = 64
+CALIBRATION_SEED = 0
 
+
+def configure_threads(num_threads=None, num_interop_threads=None):
+    # Inter-op threads can only be set before the first parallel torch operation of the process.
+    if num_threads is not None:
+        torch.set_num_threads(num_threads)
+    if num_interop_threads is not None:
+        try:
+            torch.set_num_interop_threads(num_interop_threads)
+        except RuntimeError as e:
+            print(f"Could not set inter-op threads to {num_interop_threads}: {e}")
+
+
+# gate is an optional SpectralGate; chunks it rejects get all-zero embeddings without a model call, which the
+# retriever scores as similarity 0.
 class AudioEmbedder(ABC):
-    def __init__(self, audio_data, device=None):
+    embedding_size = EMBEDDING_SIZE
+
+    def __init__(self, audio_data, device=None, batch_size=DEFAULT_BATCH_SIZE, feature_pipeline=None, gate=None):
         self.audio_data = audio_data
         if device is None:
             device = torch.device("mps" if torch.backends.mps.is_available() else "cpu")
         self.device = device
+        if batch_size < 1:
+            raise ValueError("Batch size must be at least 1.")
+        self.batch_size = batch_size
+        self.feature_pipeline = feature_pipeline
+        self.gate = gate
         self.load_model()
+        if audio_data is not None and self.get_embedding_shape() is not None:
+            audio_data.set_embedding_shape(self.get_embedding_shape())
 
     @abstractmethod
     def load_model(self):
         pass
 
+    def get_embedding_shape(self):
+        # Shape of the embedding stored per chunk if it differs from the VGGish shape the audio data expects.
+        return None
+
     @abstractmethod
-    def generate_embedding(self, audio_path):
+    def get_feature_extractor(self):
+        # Must return a picklable module-level function path -> features so it can run in worker processes.
+        pass
+
+    @abstractmethod
+    def waveform_to_features(self, samples, sample_rate):
         pass
 
-    def generate_embeddings(self):
+    @abstractmethod
+    def embed_features(self, features):
+        pass
+
+    def extract_features(self, audio_path):
+        return self.get_feature_extractor()(audio_path)
+
+    def generate_embedding(self, audio_path):
+        return self.embed_features(self.extract_features(audio_path))
+
+    def generate_embeddings(self, audio_paths=None):
+        if audio_paths is None:
+            audio_paths = self.audio_data.audio_paths
+        if self.feature_pipeline is not None:
+            features = self.feature_pipeline.iter_features(self.get_feature_extractor(), audio_paths)
+        else:
+            features = ((path, self.extract_features(path)) for path in audio_paths)
+        return self.generate_embeddings_from_features(features, total=len(audio_paths))
+
+    def generate_embeddings_from_waveforms(self, waveforms, total=None):
+        # waveforms yields (path, samples, sample_rate) for audio that is already decoded.
+        features = ((path, self.waveform_to_features(samples, sample_rate)) for path, samples, sample_rate in waveforms)
+        return self.generate_embeddings_from_features(features, total=total)
+
+    def generate_embeddings_from_features(self, features, total=None):
+        # Chunks are stacked into one forward pass of up to batch_size chunks, or fewer once they hold
+        # MAX_FORWARD_EXAMPLES examples; the output keeps the (path, embedding) contract of one squeezed array per chunk.
         embeddings_list = []
-        for path in tqdm(self.audio_data.audio_paths):
-            with torch.no_grad():
-                embeddings = self.generate_embedding(path)
-            embeddings_list.append((path, embeddings.cpu().numpy().squeeze()))
+        batch = []
+        num_examples = 0
+        for item in tqdm(timed_iter('feature_wait', features), total=total):
+            batch.append(item)
+            num_examples += len(item[1])
+            if len(batch) == self.batch_size or num_examples >= MAX_FORWARD_EXAMPLES:
+                embeddings_list.extend(self._embed_batch(batch))
+                batch = []
+                num_examples = 0
+        if batch:
+            embeddings_list.extend(self._embed_batch(batch))
+        if self.gate is not None:
+            print(f"Spectral gate skipped {self.gate.num_rejected} of {self.gate.num_chunks} chunks "
+                  f"({self.gate.skip_rate() * 100:.1f}%) without model inference.")
         return embeddings_list
 
+    def _embed_batch(self, batch):
+        counts = [len(features) for _, features in batch]
+        stacked = np.concatenate([features for _, features in batch])
+        if self.gate is not None:
+            with span('spectral_gate', chunks=len(batch), audio_seconds=len(stacked) * EXAMPLE_HOP_SECONDS):
+                rejected = self.gate.reject_chunks(stacked, counts)
+            count('gated_chunks', int(rejected.sum()))
+            embeddings = np.zeros((len(stacked), self.embedding_size), dtype=np.float32)
+            kept = np.repeat(~rejected, counts)
+            embeddings[kept] = self._embed_stacked(stacked[kept], int(np.count_nonzero(~rejected)))
+        else:
+            embeddings = self._embed_stacked(stacked, len(batch))
+        per_chunk = np.split(embeddings, np.cumsum(counts)[:-1])
+        return [(path, chunk_embeddings.squeeze()) for (path, _), chunk_embeddings in zip(batch, per_chunk)]
+
+    def _embed_stacked(self, stacked, num_chunks):
+        if len(stacked) == 0:
+            return np.empty((0, self.embedding_size), dtype=np.float32)
+        with span('model_forward', chunks=num_chunks, audio_seconds=len(stacked) * EXAMPLE_HOP_SECONDS), \
+                torch.inference_mode():
+            return np.concatenate([self.embed_features(stacked[start:start + MAX_FORWARD_EXAMPLES]).cpu().numpy()
+                                   for start in range(0, len(stacked), MAX_FORWARD_EXAMPLES)])
+
 
 class VGGishAudioEmbedder(AudioEmbedder):
     def load_model(self):
-        self.model = torch.hub.load(config.MODEL_NAME, config.MODEL_TYPE).to(self.device)
-        self.model.postprocess = False
-        self.model.device = self.device
-        self.model.eval()
+        # A cached TorchScript artifact starts without the network and the hub code; otherwise the hub model is
+        # built once and cached for the next run.
+        cache_path = self.get_model_cache_path()
+        self.model = load_cached_model(cache_path, self.device) if cache_path is not None else None
+        if self.model is None:
+            self.model = self.build_model()
+            if cache_path is not None:
+                save_cached_model(self.model, cache_path)
 
-    def generate_embedding(self, audio_path):
-        return self.model(audio_path).to(self.device)
+    def build_model(self):
+        # Log-mel examples are computed by vggish_features, so the model only runs the network.
+        model = torch.hub.load(config.MODEL_NAME, config.MODEL_TYPE)
+        return VGGishNetwork(model).to(self.device).eval()
+
+    @staticmethod
+    def get_model_variant():
+        return 'float'
+
+    def get_model_cache_path(self):
+        return model_cache_path(self.get_model_variant())
+
+    def get_feature_extractor(self):
+        return wavfile_to_examples
+
+    def waveform_to_features(self, samples, sample_rate):
+        return waveform_to_examples(samples, sample_rate)
+
+    def embed_features(self, features):
+        examples = torch.from_numpy(np.asarray(features, dtype=np.float32))[:, None, :, :]
+        return self.model(examples.to(self.device))
+
+
+class OptimizedVGGishAudioEmbedder(VGGishAudioEmbedder):
+    # CPU backend for VGGish. Dynamic quantization converts the fully connected layers to int8 with activations
+    # quantized on the fly. Static quantization also converts the conv layers, with activation ranges calibrated on
+    # the features of calibration_chunks audio chunks drawn at random, with a fixed seed, from the whole file list, so
+    # they span many source recordings rather than the first one or two. TorchScript traces and freezes the network
+    # into one graph, which removes the Python overhead per layer at small batch sizes.
+    def __init__(self, audio_data, batch_size=DEFAULT_BATCH_SIZE, feature_pipeline=None, quantization='dynamic',
+                 compile_mode='torchscript', num_threads=None, num_interop_threads=None,
+                 calibration_chunks=DEFAULT_CALIBRATION_CHUNKS, gate=None):
+        if quantization not in QUANTIZATION_MODES:
+            raise ValueError(f"Unsupported quantization: {quantization}. Choose from {QUANTIZATION_MODES}.")
+        if compile_mode not in COMPILE_MODES:
+            raise ValueError(f"Unsupported compile mode: {compile_mode}. Choose from {COMPILE_MODES}.")
+        self.quantization = quantization
+        self.compile_mode = compile_mode
+        self.calibration_chunks = calibration_chunks
+        configure_threads(num_threads, num_interop_threads)
+        super().__init__(audio_data, torch.device("cpu"), batch_size, feature_pipeline, gate)
+
+    def build_model(self):
+        model = copy.deepcopy(super().build_model())
+        if self.quantization == 'dynamic':
+            model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        elif self.quantization == 'static':
+            model = self._quantize_static(model)
+        if self.compile_mode == 'torchscript':
+            with torch.inference_mode():
+                model = torch.jit.freeze(torch.jit.trace(model, example_inputs()))
+        return model
+
+    def load_model(self):
+        cache_path = self.get_model_cache_path()
+        if self.quantization == 'static' and cache_path is not None and os.path.exists(cache_path):
+            print(f"Reusing the static quantization calibrated when {cache_path} was cached. Rebuild it with "
+                  f"model_cache --refresh to calibrate on other audio.")
+        super().load_model()
+
+    @staticmethod
+    def get_model_variant(quantization='dynamic', compile_mode='torchscript',
+                          calibration_chunks=DEFAULT_CALIBRATION_CHUNKS):
+        # Only compiled graphs can be cached; an eager quantized model would need the hub code to load. Quantized
+        # weights are packed for the quantized engine, and static activation ranges depend on the calibration.
+        if compile_mode != 'torchscript':
+            return None
+        if quantization == 'dynamic':
+            return f"dynamic_{torch.backends.quantized.engine}"
+        if quantization == 'static':
+            return f"static_{calibration_chunks}_{torch.backends.quantized.engine}"
+        return quantization
+
+    def get_model_cache_path(self):
+        variant = self.get_model_variant(self.quantization, self.compile_mode, self.calibration_chunks)
+        return model_cache_path(variant) if variant is not None else None
+
+    def _quantize_static(self, model):
+        from torch.ao.quantization import get_default_qconfig_mapping
+        from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+        calibration = self._calibration_inputs()
+        prepared = prepare_fx(model, get_default_qconfig_mapping(torch.backends.quantized.engine), (calibration[:1],))
+        with torch.inference_mode():
+            for start in range(0, len(calibration), self.batch_size):
+                prepared(calibration[start:start + self.batch_size])
+        return convert_fx(prepared)
+
+    def _calibration_inputs(self):
+        audio_paths = self.audio_data.audio_paths
+        if not audio_paths:
+            raise ValueError("Static quantization needs audio files to calibrate on.")
+        rng = np.random.default_rng(CALIBRATION_SEED)
+        picked = np.sort(rng.choice(len(audio_paths), min(self.calibration_chunks, len(audio_paths)), replace=False))
+        features = np.concatenate([self.extract_features(audio_paths[i]) for i in picked])
+        if len(features) == 0:
+            raise ValueError("The calibration chunks are shorter than one VGGish example (0.96 s).")
+        return torch.from_numpy(features)[:, None, :, :]
@@ -0,0 +1,99 @@
+import argparse
+import time
+
+import numpy as np
+import torch
+
+from .audio_data import AudioDataFactory
+from .audio_embedder import (COMPILE_MODES, DEFAULT_CALIBRATION_CHUNKS, QUANTIZATION_MODES,
+                             OptimizedVGGishAudioEmbedder, VGGishAudioEmbedder, configure_threads)
+from .retriever import pool_and_normalize
+
+BENCHMARK_BATCH_SIZES = [1, 8, 32, 128]
+
+
+def embed_all(embedder, features, batch_size):
+    outputs = []
+    with torch.inference_mode():
+        for start in range(0, len(features), batch_size):
+            outputs.append(embedder.embed_features(features[start:start + batch_size]).cpu().numpy())
+    return np.concatenate(outputs)
+
+
+def parity(reference, candidate):
+    # Cosine similarity per chunk and worst absolute difference against the float model's embeddings.
+    cosine = np.sum(pool_and_normalize(reference[:, None]) * pool_and_normalize(candidate[:, None]), axis=1)
+    return cosine.min(), cosine.mean(), np.abs(reference - candidate).max()
+
+
+def throughput(embedder, features, batch_size, min_seconds):
+    # Chunks per second at a fixed batch size, after one warm-up batch.
+    batch = features[np.arange(batch_size) % len(features)]
+    with torch.inference_mode():
+        embedder.embed_features(batch)
+        num_batches = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < min_seconds:
+            embedder.embed_features(batch)
+            num_batches += 1
+    return num_batches * batch_size / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the optimized VGGish CPU backends against the float model")
+    parser.add_argument('--audio_folder', type=str, required=True, help="Path to the folder containing audio files")
+    parser.add_argument('--chunk_length', type=int, choices=[1, 3], required=True,
+                        help="Length of the audio chunks in seconds (1 or 3)")
+    parser.add_argument('--num_chunks', type=int, default=256, help="Audio chunks whose features are compared")
+    parser.add_argument('--quantization', type=str, nargs='+', choices=QUANTIZATION_MODES,
+                        default=QUANTIZATION_MODES, help="Quantization modes to compare")
+    parser.add_argument('--compile_mode', type=str, nargs='+', choices=COMPILE_MODES, default=COMPILE_MODES,
+                        help="Compilation modes to compare")
+    parser.add_argument('--batch_sizes', type=int, nargs='+', default=BENCHMARK_BATCH_SIZES,
+                        help="Batch sizes the throughput is measured at")
+    parser.add_argument('--min_seconds', type=float, default=2.0, help="Minimum timing duration per batch size")
+    parser.add_argument('--num_threads', type=int, default=None, help="Intra-op CPU threads used by torch")
+    parser.add_argument('--num_interop_threads', type=int, default=None, help="Inter-op CPU threads used by torch")
+    parser.add_argument('--calibration_chunks', type=int, default=DEFAULT_CALIBRATION_CHUNKS,
+                        help="Chunks used to calibrate static quantization")
+
+    args = parser.parse_args()
+
+    configure_threads(args.num_threads, args.num_interop_threads)
+    audio_data = AudioDataFactory.create_audio_data(args.chunk_length, args.audio_folder)
+    float_embedder = VGGishAudioEmbedder(audio_data, device=torch.device("cpu"))
+    features = []
+    for path in audio_data.audio_paths:
+        features.append(float_embedder.extract_features(path))
+        if sum(len(f) for f in features) >= args.num_chunks:
+            break
+    if not features:
+        raise ValueError(f"No audio files found in {args.audio_folder}.")
+    features = np.concatenate(features)[:args.num_chunks]
+    reference = embed_all(float_embedder, features, max(args.batch_sizes))
+
+    print(f"{len(features)} chunks, {torch.get_num_threads()} intra-op and {torch.get_num_interop_threads()} "
+          f"inter-op threads")
+    header = ''.join(f"{f'bs={batch_size}':>12}" for batch_size in args.batch_sizes)
+    print(f"{'backend':<24}{'min cos':>10}{'mean cos':>10}{'max abs':>10}{header}   (chunks/s)")
+
+    backends = [('float/eager', float_embedder)]
+    for quantization in args.quantization:
+        for compile_mode in args.compile_mode:
+            if quantization == 'none' and compile_mode == 'none':
+                continue
+            backends.append((f"{quantization}/{compile_mode}", OptimizedVGGishAudioEmbedder(
+                audio_data, quantization=quantization, compile_mode=compile_mode,
+                calibration_chunks=args.calibration_chunks)))
+
+    for name, embedder in backends:
+        min_cosine, mean_cosine, max_abs = parity(reference, embed_all(embedder, features, max(args.batch_sizes)))
+        rates = [throughput(embedder, features, batch_size, args.min_seconds) for batch_size in args.batch_sizes]
+        print(f"{name:<24}{min_cosine:>10.5f}{mean_cosine:>10.5f}{max_abs:>10.4f}"
+              f"{''.join(f'{rate:>12.1f}' for rate in rates)}")
+
+
+# python -m src.features.audio_embedding.backend_benchmark --audio_folder data/processed/Sample_4_3s --chunk_length 3
+#                                                          --num_threads 4 --quantization none dynamic static
+if __name__ == "__main__":
+    main()
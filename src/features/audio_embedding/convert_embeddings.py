@@ -0,0 +1,45 @@
+import argparse
+import glob
+import os
+
+import config
+from .embedding_store import DEFAULT_DTYPE, SUPPORTED_DTYPES, MemmapEmbeddingStore, PickleEmbeddingStore
+
+COLUMNAR_STORE_EXTENSION = '.emb'
+
+
+def convert_pickle_file(pickle_file, dtype=DEFAULT_DTYPE, replace_existing=False):
+    output_directory = f"{os.path.splitext(pickle_file)[0]}{COLUMNAR_STORE_EXTENSION}"
+    store = MemmapEmbeddingStore(output_directory, dtype)
+    if store.exists() and not replace_existing:
+        print(f"Skipping {pickle_file} because '{output_directory}' already exists.")
+        return output_directory
+
+    embeddings_list = PickleEmbeddingStore(pickle_file).load()
+    store.write(embeddings_list)
+    print(f"Converted {len(embeddings_list)} embeddings from {pickle_file} to {output_directory}")
+    return output_directory
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert legacy pickled embeddings to the memory-mapped store format")
+    parser.add_argument('--input_files', type=str, nargs='+', default=None,
+                        help="Pickle embedding files to convert. Defaults to every .pkl file in the embeddings folder")
+    parser.add_argument('--dtype', type=str, choices=SUPPORTED_DTYPES, default=DEFAULT_DTYPE,
+                        help="Floating point type of the converted embedding matrix")
+    parser.add_argument('--replace_existing', action='store_true', help="Replace converted stores that already exist")
+
+    args = parser.parse_args()
+
+    input_files = args.input_files or sorted(glob.glob(os.path.join(config.EMBEDDINGS_DIR, '*.pkl')))
+    if not input_files:
+        print("No pickle embedding files found.")
+        return
+
+    for pickle_file in input_files:
+        convert_pickle_file(pickle_file, args.dtype, args.replace_existing)
+
+
+# python -m src.features.audio_embedding.convert_embeddings --input_files embeddings/embeddings_Sample_4_3s.pkl
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+import config
+
+# Options of the optimized VGGish backend. They live here so building a parser does not import torch.
+QUANTIZATION_MODES = ['none', 'dynamic', 'static']
+COMPILE_MODES = ['none', 'torchscript']
+DEFAULT_EMBEDDER = 'vggish'
+# Embedders selectable by name, e.g. with --embedder. A factory takes (audio_data, args, feature_pipeline, gate),
+# where args holds the options added by add_embedder_arguments, and returns an AudioEmbedder. Factories import
+# their embedder when called, so registering and parsing arguments stay free of torch and model code.
+EMBEDDER_FACTORIES = {}
+
+
+def register_embedder(name, factory):
+    EMBEDDER_FACTORIES[name] = factory
+
+
+def get_embedder_names():
+    return list(EMBEDDER_FACTORIES)
+
+
+def _create_vggish_embedder(audio_data, args, feature_pipeline, gate):
+    from .audio_embedder import OptimizedVGGishAudioEmbedder, VGGishAudioEmbedder, configure_threads
+
+    if args.backend == 'optimized':
+        return OptimizedVGGishAudioEmbedder(audio_data, args.batch_size, feature_pipeline, args.quantization,
+                                            args.compile_mode, args.num_threads, args.num_interop_threads, gate=gate)
+    configure_threads(args.num_threads, args.num_interop_threads)
+    return VGGishAudioEmbedder(audio_data, batch_size=args.batch_size, feature_pipeline=feature_pipeline, gate=gate)
+
+
+def _create_wav2vec2_embedder(audio_data, args, feature_pipeline, gate):
+    from .audio_embedder import configure_threads
+    from .wav2vec2_embedder import Wav2Vec2AudioEmbedder
+
+    configure_threads(args.num_threads, args.num_interop_threads)
+    return Wav2Vec2AudioEmbedder(audio_data, args.batch_size, feature_pipeline, args.wav2vec2_model,
+                                 args.hidden_layer, args.wav2vec2_config, gate=gate)
+
+
+register_embedder('vggish', _create_vggish_embedder)
+register_embedder('wav2vec2', _create_wav2vec2_embedder)
+
+
+class EmbedderFactory:
+    @staticmethod
+    def create_embedder(name, audio_data, args, feature_pipeline=None, gate=None):
+        if name not in EMBEDDER_FACTORIES:
+            raise ValueError(f"Unsupported embedder: {name}. Choose from {get_embedder_names()}.")
+        return EMBEDDER_FACTORIES[name](audio_data, args, feature_pipeline, gate)
+
+
+def add_embedder_arguments(parser, default=DEFAULT_EMBEDDER):
+    # The choices are the embedders registered when the parser is built.
+    parser.add_argument('--embedder', type=str, choices=get_embedder_names(), default=default,
+                        help="Model that embeds the audio chunks. Stores of different embedders are not compatible")
+    parser.add_argument('--backend', type=str, choices=['eager', 'optimized'], default='eager',
+                        help="eager runs the float hub model. optimized is the quantized/compiled CPU backend. "
+                             "vggish only")
+    parser.add_argument('--quantization', type=str, choices=QUANTIZATION_MODES, default='dynamic',
+                        help="int8 quantization of the optimized backend: fc layers only (dynamic) or conv and fc "
+                             "(static)")
+    parser.add_argument('--compile_mode', type=str, choices=COMPILE_MODES, default='torchscript',
+                        help="Graph compilation of the optimized backend")
+    parser.add_argument('--num_threads', type=int, default=None, help="Intra-op CPU threads used by torch")
+    parser.add_argument('--num_interop_threads', type=int, default=None, help="Inter-op CPU threads used by torch")
+    parser.add_argument('--wav2vec2_model', type=str, default=config.WAV2VEC2_MODEL_NAME,
+                        help="Hugging Face model id or local directory of the wav2vec2 embedder")
+    parser.add_argument('--wav2vec2_config', type=str, default=None,
+                        help="config.json of a randomly initialized wav2vec2 model, used instead of --wav2vec2_model "
+                             "to run offline without weights")
+    parser.add_argument('--hidden_layer', type=int, default=None,
+                        help="Transformer layer of the wav2vec2 embedder whose output is pooled, as hidden_states[k]. "
+                             "Defaults to the final, normalized last_hidden_state")
@@ -1,29 +1,85 @@
-import os
-import pickle
+from collections import namedtuple
+
+from src.utils.instrumentation import span
+
+from .embedding_store import DEFAULT_DTYPE, PickleEmbeddingStore, create_embedding_store
+from .fingerprint import fingerprint_file, fingerprint_matches
+
+RefreshSummary = namedtuple('RefreshSummary', ['reused', 'added', 'evicted'])
 
 
 class Embedding:
-    def __init__(self, audio_data, embedding_file, replace_existing=False):
+    def __init__(self, audio_data, embedding_file, replace_existing=False, dtype=DEFAULT_DTYPE, content_hash=False):
         self.audio_data = audio_data
         self.embedding_file = embedding_file
         self.replace_existing = replace_existing
+        self.content_hash = content_hash
+        self.store = create_embedding_store(embedding_file, dtype)
         self.embeddings_list = None
 
     def load_embeddings(self):
         if self.embeddings_exist():
-            with open(self.embedding_file, 'rb') as f:
-                self.embeddings_list = pickle.load(f)
+            with span('store_load'):
+                self.embeddings_list = self.load_store()
         else:
             print(f"Embedding file '{self.embedding_file}' does not exist.")
 
+    def load_store(self):
+        # What the retriever searches; subclasses can derive it from the stored entries.
+        return self.store.load()
+
     def store_embeddings(self, embeddings_list):
         if self.replace_existing or not self.embeddings_exist():
-            with open(self.embedding_file, 'wb') as f:
-                pickle.dump(embeddings_list, f)
-            self.embeddings_list = embeddings_list
+            with span('store_write', chunks=len(embeddings_list)):
+                self.store.write(embeddings_list, self.content_hash)
+            with span('store_load'):
+                self.embeddings_list = self.load_store()
         else:
             print(
                 f"Embedding file '{self.embedding_file}' already exists and replace_existing is False. Skipping storage.")
 
+    def refresh_embeddings(self, embedder):
+        # Embeds only the audio files that are new or whose fingerprint changed since they were stored, evicts
+        # entries of changed and deleted files and appends the new embeddings to the store in place.
+        if isinstance(self.store, PickleEmbeddingStore):
+            raise ValueError(f"Cannot refresh the legacy pickle file '{self.embedding_file}' incrementally. "
+                             f"Convert it with python -m src.features.audio_embedding.convert_embeddings first.")
+        if not self.embeddings_exist():
+            # The embedder may be built on other audio data, e.g. the search set when refreshing a training store.
+            embeddings_list = embedder.generate_embeddings(self.audio_data.audio_paths)
+            self.store.write(embeddings_list, self.content_hash)
+            self.embeddings_list = self.load_store()
+            summary = RefreshSummary(reused=0, added=len(embeddings_list), evicted=0)
+            print(f"Embedding refresh: {summary.reused} reused, {summary.added} added, {summary.evicted} evicted.")
+            return summary
+
+        stored = self.store.load()
+        stored_items = {stored.get_path(i): i for i in range(len(stored))}
+        current_paths = set(self.audio_data.audio_paths)
+
+        paths_to_embed = []
+        evict_positions = []
+        for path in self.audio_data.audio_paths:
+            item = stored_items.get(path)
+            if item is not None and fingerprint_matches(stored.get_fingerprint(item),
+                                                        fingerprint_file(path, self.content_hash)):
+                continue
+            paths_to_embed.append(path)
+            if item is not None:
+                evict_positions.append(stored.get_position(item))
+        evict_positions.extend(stored.get_position(item) for path, item in stored_items.items()
+                               if path not in current_paths)
+
+        summary = RefreshSummary(reused=len(current_paths) - len(paths_to_embed), added=len(paths_to_embed),
+                                 evicted=len(evict_positions))
+        if paths_to_embed or evict_positions:
+            new_embeddings = embedder.generate_embeddings(paths_to_embed) if paths_to_embed else []
+            del stored
+            with span('store_write', chunks=len(new_embeddings)):
+                self.store.update(new_embeddings, evict_positions, self.content_hash)
+        self.embeddings_list = self.load_store()
+        print(f"Embedding refresh: {summary.reused} reused, {summary.added} added, {summary.evicted} evicted.")
+        return summary
+
     def embeddings_exist(self):
-        return os.path.exists(self.embedding_file)
+        return self.store.exists()
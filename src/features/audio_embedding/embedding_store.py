@@ -0,0 +1,282 @@
+import itertools
+import json
+import os
+import pickle
+import shutil
+from collections.abc import Sequence
+
+import numpy as np
+
+from .fingerprint import CONTENT_HASH_SIZE, MISSING_FILE_SIZE, fingerprint_file
+
+FORMAT_VERSION = 2
+SUPPORTED_DTYPES = ['float32', 'float16']
+DEFAULT_DTYPE = 'float32'
+LEGACY_PICKLE_EXTENSION = '.pkl'
+
+META_FILENAME = 'meta.json'
+VECTORS_FILENAME = 'vectors.bin'
+INDEX_FILENAME = 'index.bin'
+PATHS_FILENAME = 'paths.bin'
+
+# One record per stored (path, embedding) item. Rows of every item live back to back in vectors.bin, and the path
+# is a utf-8 slice of paths.bin. ndim remembers whether the embedding was stored squeezed to a single vector.
+INDEX_DTYPE_V1 = np.dtype([
+    ('path_start', '<i8'),
+    ('path_length', '<i4'),
+    ('row_start', '<i8'),
+    ('num_rows', '<i4'),
+    ('ndim', '<i1'),
+])
+# Version 2 adds the source file fingerprint used by incremental refreshes, and a flag that tombstones entries
+# whose file changed or disappeared until the store is compacted.
+INDEX_DTYPE = np.dtype(INDEX_DTYPE_V1.descr + [
+    ('file_size', '<i8'),
+    ('mtime_ns', '<i8'),
+    ('content_hash', f'V{CONTENT_HASH_SIZE}'),
+    ('alive', '?'),
+])
+
+# Compact once tombstoned rows make up more than this share of vectors.bin.
+COMPACTION_DEAD_ROW_FRACTION = 0.5
+
+
+def _open_array(filepath, dtype, shape):
+    # np.memmap refuses zero-length files, so empty stores are served from an in-memory array.
+    if int(np.prod(shape)) == 0:
+        return np.empty(shape, dtype=dtype)
+    return np.memmap(filepath, dtype=dtype, mode='r', shape=shape)
+
+
+def _upgrade_index(index_v1):
+    index = np.zeros(len(index_v1), dtype=INDEX_DTYPE)
+    for name in INDEX_DTYPE_V1.names:
+        index[name] = index_v1[name]
+    index['file_size'] = MISSING_FILE_SIZE
+    index['alive'] = True
+    return index
+
+
+def _write_meta(directory, meta):
+    tmp_filepath = os.path.join(directory, f"{META_FILENAME}.tmp")
+    with open(tmp_filepath, 'w') as f:
+        json.dump(meta, f, indent=2)
+    os.replace(tmp_filepath, os.path.join(directory, META_FILENAME))
+
+
+class EmbeddingList(Sequence):
+    # Read-only list of (path, embedding) tuples backed by memory-mapped files. Items are materialized on access,
+    # so opening a store costs the same for ten or ten million entries. positions maps items to their record in
+    # index.bin and is only set when tombstoned records have to be skipped.
+    def __init__(self, vectors, index, paths_blob, positions=None):
+        self.vectors = vectors
+        self.index = index
+        self.paths_blob = paths_blob
+        self.positions = positions
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [self[i] for i in range(*item.indices(len(self)))]
+        if item < 0:
+            item += len(self)
+        if not 0 <= item < len(self):
+            raise IndexError("Embedding index out of range.")
+        return self.get_path(item), self.get_embedding(item)
+
+    def get_path(self, item):
+        record = self.index[item]
+        start = int(record['path_start'])
+        return bytes(self.paths_blob[start:start + int(record['path_length'])]).decode('utf-8')
+
+    def get_embedding(self, item):
+        record = self.index[item]
+        start = int(record['row_start'])
+        rows = self.vectors[start:start + int(record['num_rows'])]
+        return rows[0] if record['ndim'] == 1 else rows
+
+    def get_fingerprint(self, item):
+        record = self.index[item]
+        digest = bytes(record['content_hash'])
+        return int(record['file_size']), int(record['mtime_ns']), digest if any(digest) else b''
+
+    def get_position(self, item):
+        return item if self.positions is None else int(self.positions[item])
+
+    def get_paths(self):
+        return [self.get_path(i) for i in range(len(self))]
+
+    def as_matrix(self):
+        # N x frames x dim view over vectors.bin; only possible when every item has the same number of frames.
+        num_rows = self.index['num_rows']
+        if len(num_rows) == 0 or np.any(num_rows != num_rows[0]):
+            raise ValueError("Stored embeddings do not share a common number of frames.")
+        frames = int(num_rows[0])
+        if np.any(self.index['row_start'] != np.arange(len(self.index)) * frames):
+            raise ValueError("Stored embeddings are not laid out contiguously.")
+        return self.vectors[:len(self.index) * frames].reshape(len(self.index), frames, self.vectors.shape[1])
+
+
+class MemmapEmbeddingStore:
+    # Columnar on-disk format: a directory holding one contiguous float matrix of all embedding rows (vectors.bin),
+    # a fixed-width index of path/row offsets (index.bin), the concatenated utf-8 paths (paths.bin) and meta.json.
+    # meta.json is the commit point: readers and appends only trust the bytes it accounts for.
+    def __init__(self, directory, dtype=DEFAULT_DTYPE):
+        if dtype not in SUPPORTED_DTYPES:
+            raise ValueError(f"Unsupported embedding dtype '{dtype}'. Supported: {SUPPORTED_DTYPES}")
+        self.directory = directory
+        self.dtype = dtype
+
+    def exists(self):
+        return os.path.exists(os.path.join(self.directory, META_FILENAME))
+
+    def read_meta(self):
+        with open(os.path.join(self.directory, META_FILENAME)) as f:
+            meta = json.load(f)
+        if meta['format_version'] not in (1, FORMAT_VERSION):
+            raise ValueError(f"Unsupported embedding store version {meta['format_version']} in '{self.directory}'.")
+        return meta
+
+    def load(self):
+        meta = self.read_meta()
+        vectors = _open_array(os.path.join(self.directory, VECTORS_FILENAME), np.dtype(meta['dtype']),
+                              (meta['num_rows'], meta['embedding_dim']))
+        paths_blob = _open_array(os.path.join(self.directory, PATHS_FILENAME), np.uint8, (meta['paths_size'],))
+        if meta['format_version'] == 1:
+            index_v1 = _open_array(os.path.join(self.directory, INDEX_FILENAME), INDEX_DTYPE_V1, (meta['num_entries'],))
+            return EmbeddingList(vectors, _upgrade_index(index_v1), paths_blob)
+
+        index = _open_array(os.path.join(self.directory, INDEX_FILENAME), INDEX_DTYPE, (meta['num_entries'],))
+        positions = None
+        if meta['num_dead_entries']:
+            positions = np.flatnonzero(index['alive'])
+            index = index[positions]
+        return EmbeddingList(vectors, index, paths_blob, positions)
+
+    def write(self, embeddings_list, content_hash=False):
+        entries = ((path, embedding, fingerprint_file(path, content_hash)) for path, embedding in embeddings_list)
+        self._write_entries(entries)
+
+    def update(self, embeddings_list, evict_positions=(), content_hash=False):
+        # Tombstones evicted records in place and appends new entries to the end of every file.
+        meta = self.read_meta()
+        if meta['format_version'] != FORMAT_VERSION:
+            self._rewrite_with(embeddings_list, evict_positions, content_hash)
+            return
+        vectors_size = meta['num_rows'] * meta['embedding_dim'] * np.dtype(meta['dtype']).itemsize
+        for filename, size in [(VECTORS_FILENAME, vectors_size),
+                               (INDEX_FILENAME, meta['num_entries'] * INDEX_DTYPE.itemsize),
+                               (PATHS_FILENAME, meta['paths_size'])]:
+            # Drop bytes appended by an interrupted run that never reached meta.json.
+            os.truncate(os.path.join(self.directory, filename), size)
+
+        evict_positions = np.unique(np.asarray(evict_positions, dtype=np.int64))
+        if len(evict_positions):
+            index = np.memmap(os.path.join(self.directory, INDEX_FILENAME), dtype=INDEX_DTYPE, mode='r+',
+                              shape=(meta['num_entries'],))
+            evict_positions = evict_positions[index['alive'][evict_positions]]
+            index['alive'][evict_positions] = False
+            meta['num_dead_entries'] += len(evict_positions)
+            meta['num_dead_rows'] += int(index['num_rows'][evict_positions].sum())
+            index.flush()
+            del index
+
+        entries = ((path, embedding, fingerprint_file(path, content_hash)) for path, embedding in embeddings_list)
+        records, meta['embedding_dim'], meta['num_rows'], meta['paths_size'] = self._append_entries(
+            self.directory, entries, np.dtype(meta['dtype']), meta['embedding_dim'] or None, meta['num_rows'],
+            meta['paths_size'])
+        meta['num_entries'] += len(records)
+        _write_meta(self.directory, meta)
+
+        if meta['num_dead_rows'] > COMPACTION_DEAD_ROW_FRACTION * meta['num_rows']:
+            self.compact()
+
+    def compact(self):
+        embeddings_list = self.load()
+        self.dtype = embeddings_list.vectors.dtype.name
+        self._write_entries((path, embedding, embeddings_list.get_fingerprint(i))
+                            for i, (path, embedding) in enumerate(embeddings_list))
+
+    def _rewrite_with(self, embeddings_list, evict_positions, content_hash):
+        stored = self.load()
+        evicted = set(int(position) for position in evict_positions)
+        kept = ((path, embedding, stored.get_fingerprint(i)) for i, (path, embedding) in enumerate(stored)
+                if stored.get_position(i) not in evicted)
+        added = ((path, embedding, fingerprint_file(path, content_hash)) for path, embedding in embeddings_list)
+        self._write_entries(itertools.chain(kept, added))
+
+    def _write_entries(self, entries):
+        # Written next to the target and swapped in at the end so a failed run never leaves a half-written store.
+        tmp_directory = f"{self.directory.rstrip(os.sep)}.tmp"
+        if os.path.exists(tmp_directory):
+            shutil.rmtree(tmp_directory)
+        os.makedirs(tmp_directory)
+
+        records, embedding_dim, num_rows, paths_size = self._append_entries(tmp_directory, entries,
+                                                                            np.dtype(self.dtype), None, 0, 0)
+        _write_meta(tmp_directory, {
+            'format_version': FORMAT_VERSION,
+            'dtype': self.dtype,
+            'embedding_dim': embedding_dim or 0,
+            'num_entries': len(records),
+            'num_rows': num_rows,
+            'paths_size': paths_size,
+            'num_dead_entries': 0,
+            'num_dead_rows': 0,
+        })
+
+        if os.path.exists(self.directory):
+            shutil.rmtree(self.directory)
+        os.rename(tmp_directory, self.directory)
+
+    @staticmethod
+    def _append_entries(directory, entries, dtype, embedding_dim, num_rows, paths_size):
+        records = []
+        with open(os.path.join(directory, VECTORS_FILENAME), 'ab') as vectors_file, \
+                open(os.path.join(directory, PATHS_FILENAME), 'ab') as paths_file:
+            for path, embedding, (file_size, mtime_ns, digest) in entries:
+                embedding = np.asarray(embedding)
+                if embedding.ndim not in (1, 2):
+                    raise ValueError(f"Embedding for '{path}' has unsupported shape {embedding.shape}.")
+                rows = embedding.reshape(-1, embedding.shape[-1])
+                if embedding_dim is None:
+                    embedding_dim = rows.shape[1]
+                elif rows.shape[1] != embedding_dim:
+                    raise ValueError(f"Embedding for '{path}' has dimension {rows.shape[1]}, expected {embedding_dim}.")
+                encoded_path = path.encode('utf-8')
+
+                vectors_file.write(np.ascontiguousarray(rows, dtype=dtype).tobytes())
+                paths_file.write(encoded_path)
+                records.append((paths_size, len(encoded_path), num_rows, len(rows), embedding.ndim,
+                                file_size, mtime_ns, digest.ljust(CONTENT_HASH_SIZE, b'\0'), True))
+                num_rows += len(rows)
+                paths_size += len(encoded_path)
+
+        with open(os.path.join(directory, INDEX_FILENAME), 'ab') as index_file:
+            np.array(records, dtype=INDEX_DTYPE).tofile(index_file)
+        return records, embedding_dim, num_rows, paths_size
+
+
+class PickleEmbeddingStore:
+    # Legacy format: a pickled list of (path, ndarray) tuples. Kept for reading existing files only.
+    def __init__(self, filepath):
+        self.filepath = filepath
+
+    def exists(self):
+        return os.path.exists(self.filepath)
+
+    def load(self):
+        with open(self.filepath, 'rb') as f:
+            return pickle.load(f)
+
+    def write(self, embeddings_list, content_hash=False):
+        raise ValueError(f"Pickle embedding files are read-only. Store embeddings in a columnar store path instead "
+                         f"of '{self.filepath}', or convert it with python -m src.features.audio_embedding.convert_embeddings.")
+
+
+def create_embedding_store(embedding_file, dtype=DEFAULT_DTYPE):
+    if embedding_file.endswith(LEGACY_PICKLE_EXTENSION):
+        return PickleEmbeddingStore(embedding_file)
+    return MemmapEmbeddingStore(embedding_file, dtype)
@@ -0,0 +1,90 @@
+import logging
+import multiprocessing
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+DEFAULT_QUEUE_DEPTH = 256
+DEFAULT_PREFETCH = 4
+
+_END_OF_STREAM = object()
+
+
+# Decodes audio and computes model features in a process pool while the caller runs inference. A feeder thread
+# keeps at most num_workers * prefetch files in flight and moves finished features, in input order, into a
+# bounded queue of queue_depth items that the embedder drains in batches.
+class FeaturePipeline:
+    def __init__(self, num_workers, queue_depth=DEFAULT_QUEUE_DEPTH, prefetch=DEFAULT_PREFETCH):
+        if num_workers < 1:
+            raise ValueError("The feature pipeline needs at least one worker.")
+        if queue_depth < 1 or prefetch < 1:
+            raise ValueError("Queue depth and prefetch must be at least 1.")
+        self.num_workers = num_workers
+        self.queue_depth = queue_depth
+        self.prefetch = prefetch
+
+    def iter_features(self, feature_extractor, audio_paths):
+        results = queue.Queue(maxsize=self.queue_depth)
+        stop = threading.Event()
+        # Workers only need numpy/soundfile, so spawn them instead of forking a process that holds the model.
+        executor = ProcessPoolExecutor(max_workers=self.num_workers, mp_context=multiprocessing.get_context('spawn'))
+        feeder = threading.Thread(target=self._feed, args=(executor, feature_extractor, audio_paths, results, stop),
+                                  daemon=True)
+        feeder.start()
+        try:
+            while True:
+                item = results.get()
+                if item is _END_OF_STREAM:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            stop.set()
+            self._drain(results)
+            feeder.join()
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def _feed(self, executor, feature_extractor, audio_paths, results, stop):
+        in_flight = deque()
+        max_in_flight = self.num_workers * self.prefetch
+        try:
+            for path in audio_paths:
+                if stop.is_set():
+                    return
+                in_flight.append((path, executor.submit(feature_extractor, path)))
+                if len(in_flight) >= max_in_flight:
+                    self._put(results, self._pop_result(in_flight), stop)
+            while in_flight and not stop.is_set():
+                self._put(results, self._pop_result(in_flight), stop)
+        except BaseException as e:
+            logging.error(f"Feature extraction failed: {e}")
+            self._put(results, e, stop)
+            return
+        finally:
+            for _, future in in_flight:
+                future.cancel()
+        self._put(results, _END_OF_STREAM, stop)
+
+    @staticmethod
+    def _pop_result(in_flight):
+        path, future = in_flight.popleft()
+        return path, future.result()
+
+    @staticmethod
+    def _put(results, item, stop):
+        while not stop.is_set():
+            try:
+                results.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    @staticmethod
+    def _drain(results):
+        while True:
+            try:
+                results.get_nowait()
+            except queue.Empty:
+                return
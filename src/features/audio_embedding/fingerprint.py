@@ -0,0 +1,37 @@
+import hashlib
+import os
+
+CONTENT_HASH_SIZE = 16
+_READ_BLOCK_SIZE = 1 << 20
+
+MISSING_FILE_SIZE = -1
+
+
+def hash_file_content(filepath):
+    digest = hashlib.blake2b(digest_size=CONTENT_HASH_SIZE)
+    with open(filepath, 'rb') as f:
+        for block in iter(lambda: f.read(_READ_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.digest()
+
+
+def fingerprint_file(filepath, content_hash=False):
+    # (size, mtime_ns, content digest) of a file; paths that do not exist on disk, such as virtual chunk ids,
+    # get a fingerprint that never matches so they are always treated as changed.
+    try:
+        stat = os.stat(filepath)
+    except OSError:
+        return MISSING_FILE_SIZE, 0, b''
+    digest = hash_file_content(filepath) if content_hash else b''
+    return stat.st_size, stat.st_mtime_ns, digest
+
+
+def fingerprint_matches(stored_fingerprint, current_fingerprint):
+    stored_size, stored_mtime_ns, stored_digest = stored_fingerprint
+    size, mtime_ns, digest = current_fingerprint
+    if size == MISSING_FILE_SIZE or stored_size != size:
+        return False
+    # Content hashes win when both sides have one, so touched or copied files are still reused.
+    if stored_digest and digest:
+        return stored_digest == digest
+    return stored_mtime_ns == mtime_ns
@@ -0,0 +1,45 @@
+import numpy as np
+
+from src.utils.instrumentation import span
+from .audio_data import FRAME_SECONDS
+from .embedding import Embedding
+from .retriever import PooledEmbeddings, pool_and_normalize
+
+
+def pool_windows(frames, window_frames, hop_frames):
+    # Mean of every run of window_frames consecutive frames, one run starting every hop_frames frames. All windows
+    # come from one cumulative sum, so the cost does not grow with the window length. Recordings shorter than one
+    # window give no windows.
+    frames = np.atleast_2d(np.asarray(frames, dtype=np.float32))
+    starts = np.arange(0, len(frames) - window_frames + 1, hop_frames)
+    cumulative = np.zeros((len(frames) + 1, frames.shape[1]), dtype=np.float64)
+    np.cumsum(frames, axis=0, out=cumulative[1:])
+    return ((cumulative[starts + window_frames] - cumulative[starts]) / window_frames).astype(np.float32), starts
+
+
+def get_window_id(recording_path, start_seconds, end_seconds):
+    # Windows only exist in memory; their id names the recording and the span it covers.
+    return f"{recording_path}#{start_seconds:.2f}-{end_seconds:.2f}"
+
+
+class FrameEmbedding(Embedding):
+    # Frame-level store: one (frames, dim) entry per source recording of a WindowedAudioData, computed once.
+    # Loading it yields the pooled, L2-normalized windows of the audio data's window and hop, derived from the
+    # stored frames without decoding audio or running the model, so every chunk length and overlap reuses the
+    # same store. Windows start on frame boundaries, i.e. every multiple of 0.96s.
+    def load_store(self):
+        window_frames = self.audio_data.get_window_frames()
+        hop_frames = self.audio_data.get_hop_frames()
+        paths = []
+        matrices = []
+        stored = self.store.load()
+        with span('pool_windows', chunks=len(stored)):
+            for recording_path, frames in stored:
+                pooled, starts = pool_windows(frames, window_frames, hop_frames)
+                paths.extend(get_window_id(recording_path, start * FRAME_SECONDS, (start + window_frames) * FRAME_SECONDS)
+                             for start in starts)
+                matrices.append(pooled)
+            if not paths:
+                return PooledEmbeddings(paths, np.empty((0, self.audio_data.get_expected_embedding_dimension()[-1]),
+                                                        dtype=np.float32))
+            return PooledEmbeddings(paths, pool_and_normalize(np.concatenate(matrices)[:, None]))
@@ -0,0 +1,133 @@
+import argparse
+import csv
+import os
+import time
+
+import numpy as np
+import torch
+
+import config
+from src.models.threshold_sweep import NEGATIVE_LABEL, POSITIVE_LABEL, ThresholdSweep, labels_from_folders
+from src.utils.instrumentation import add_profiling_arguments, start_profiling
+from .audio_data import AudioDataFactory
+from .audio_embedder import DEFAULT_BATCH_SIZE, VGGishAudioEmbedder
+from .feature_pipeline import DEFAULT_PREFETCH, DEFAULT_QUEUE_DEPTH, FeaturePipeline
+from .retriever import pool_and_normalize
+from .spectral_gate import GATE_FEATURES, add_gate_arguments, create_gate, gate_features
+
+
+class GateEvaluation:
+    # Runs the labeled chunks through the full pipeline once, and the gate on the same log-mel features. A gated run
+    # embeds exactly the chunks the gate keeps and scores the rejected ones 0, so both sets of similarities come
+    # from one model pass and any difference in recall is the cost of the gate.
+    def __init__(self, embedder, gate):
+        self.embedder = embedder
+        self.gate = gate
+        self.rejected = {}
+        self.chunk_features = {}
+        self.gate_seconds = 0.0
+        self.pipeline_seconds = 0.0
+
+    def _gate_features(self, features):
+        for path, examples in features:
+            start = time.perf_counter()
+            self.rejected[path] = bool(self.gate.reject_chunks(examples, [len(examples)])[0])
+            # A chunk is kept if any of its examples is, so its features are the maxima over its examples.
+            self.chunk_features[path] = {name: float(np.max(values)) if len(examples) else 0.0
+                                         for name, values in gate_features(examples).items()}
+            self.gate_seconds += time.perf_counter() - start
+            yield path, examples
+
+    def run(self, audio_paths, query_audio_path):
+        if self.embedder.feature_pipeline is not None:
+            features = self.embedder.feature_pipeline.iter_features(self.embedder.get_feature_extractor(), audio_paths)
+        else:
+            features = ((path, self.embedder.extract_features(path)) for path in audio_paths)
+        start = time.perf_counter()
+        embeddings_list = self.embedder.generate_embeddings_from_features(self._gate_features(features),
+                                                                          total=len(audio_paths))
+        self.pipeline_seconds = time.perf_counter() - start - self.gate_seconds
+
+        with torch.no_grad():
+            query_embedding = pool_and_normalize(self.embedder.generate_embedding(query_audio_path).cpu().numpy())
+        paths = [path for path, _ in embeddings_list]
+        full_similarities = np.array([pool_and_normalize(embedding) @ query_embedding for _, embedding in embeddings_list])
+        rejected = np.array([self.rejected[path] for path in paths], dtype=bool)
+        gated_similarities = np.where(rejected, 0.0, full_similarities)
+        return paths, rejected, full_similarities, gated_similarities
+
+    def write_features(self, paths, labels, rejected, report_file):
+        os.makedirs(os.path.dirname(report_file) or '.', exist_ok=True)
+        with open(report_file, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['path', 'label', 'rejected'] + GATE_FEATURES)
+            for path, label, is_rejected in zip(paths, labels, rejected):
+                writer.writerow([path, int(label), int(is_rejected)]
+                                + [f"{self.chunk_features[path][name]:.4f}" for name in GATE_FEATURES])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report the skip rate of the spectral gate and its recall cost "
+                                                 "against the full pipeline on the labeled test set")
+    parser.add_argument('--first_class_folder', type=str, default=f"{config.DATA_DIR}/test_labeled/siren",
+                        help="Folder of the labeled siren chunks")
+    parser.add_argument('--second_class_folder', type=str, default=f"{config.DATA_DIR}/test_labeled/nosiren",
+                        help="Folder of the labeled nosiren chunks")
+    parser.add_argument('--query_audio_path', type=str, required=True, help="Path to the query audio file")
+    parser.add_argument('--similarity_thresholds', type=float, nargs='+', required=True,
+                        help="Similarity thresholds the recall of both pipelines is compared at")
+    parser.add_argument('--chunk_length', type=int, choices=[1, 3], required=True,
+                        help="Length of the audio chunks in seconds (1 or 3)")
+    parser.add_argument('--batch_size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help="Number of audio chunks embedded per model forward pass")
+    parser.add_argument('--num_workers', type=int, default=0,
+                        help="Worker processes decoding audio and computing features. 0 runs them on the main thread")
+    parser.add_argument('--report_file', type=str, default=None,
+                        help="Write the gate features and decision of every chunk to this CSV file, to tune the gate")
+    add_gate_arguments(parser, switch=False)
+    add_profiling_arguments(parser)
+
+    args = parser.parse_args()
+    start_profiling(args, 'gate_report')
+
+    audio_paths = sorted(os.path.join(folder, file) for folder in [args.first_class_folder, args.second_class_folder]
+                         for file in os.listdir(folder) if file.endswith('.wav'))
+    audio_data = AudioDataFactory.create_audio_data(args.chunk_length, args.first_class_folder, audio_paths)
+    feature_pipeline = FeaturePipeline(args.num_workers, DEFAULT_QUEUE_DEPTH, DEFAULT_PREFETCH) if args.num_workers > 0 else None
+    embedder = VGGishAudioEmbedder(audio_data, batch_size=args.batch_size, feature_pipeline=feature_pipeline)
+    gate = create_gate(args)
+
+    evaluation = GateEvaluation(embedder, gate)
+    paths, rejected, full_similarities, gated_similarities = evaluation.run(audio_paths, args.query_audio_path)
+    labels = labels_from_folders(paths, args.first_class_folder, args.second_class_folder)
+    positives = labels == POSITIVE_LABEL
+    negatives = labels == NEGATIVE_LABEL
+
+    print(f"\nSkip rate: {rejected.mean() * 100:.1f}% of {len(paths)} chunks "
+          f"(siren {rejected[positives].mean() * 100 if positives.any() else 0:.1f}%, "
+          f"nosiren {rejected[negatives].mean() * 100 if negatives.any() else 0:.1f}%)")
+    print(f"Gate: {1000 * evaluation.gate_seconds / max(len(paths), 1):.3f} ms/chunk, full pipeline: "
+          f"{1000 * evaluation.pipeline_seconds / max(len(paths), 1):.3f} ms/chunk")
+
+    thresholds = sorted(args.similarity_thresholds)
+    full_metrics = ThresholdSweep(full_similarities, labels).metrics(thresholds)
+    gated_metrics = ThresholdSweep(gated_similarities, labels).metrics(thresholds)
+    for i, threshold in enumerate(thresholds):
+        print(f"Threshold {threshold * 100:.1f}%: recall {full_metrics['recall'][i]:.4f} -> "
+              f"{gated_metrics['recall'][i]:.4f} (cost {full_metrics['recall'][i] - gated_metrics['recall'][i]:.4f}), "
+              f"precision {full_metrics['precision'][i]:.4f} -> {gated_metrics['precision'][i]:.4f}")
+
+    missed = [path for path, is_rejected, positive in zip(paths, rejected, positives) if is_rejected and positive]
+    if missed:
+        print(f"\nSiren chunks rejected by the gate ({len(missed)}):")
+        for path in missed:
+            print(f"...{path}")
+    if args.report_file is not None:
+        evaluation.write_features(paths, labels, rejected, args.report_file)
+        print(f"\nGate features written to {args.report_file}")
+
+
+# python -m src.features.audio_embedding.gate_report --query_audio_path data/query/siren_query.wav --similarity_thresholds 0.7 0.8 0.9
+#                                                    --chunk_length 3 --report_file output/gate_report.csv
+if __name__ == "__main__":
+    main()
@@ -1,33 +1,105 @@
 import argparse
 
-import numpy as np
 import torch
 
+from src.dataset.audio_splitter.audio_splitter import AudioSplitter
+from src.utils.instrumentation import add_profiling_arguments, start_profiling
 from .audio_data import AudioDataFactory
-from .audio_embedder import VGGishAudioEmbedder
+from .audio_embedder import DEFAULT_BATCH_SIZE
+from .embedder_registry import DEFAULT_EMBEDDER, EmbedderFactory, add_embedder_arguments
 from .embedding import Embedding
+from .embedding_store import DEFAULT_DTYPE, SUPPORTED_DTYPES
+from .feature_pipeline import DEFAULT_PREFETCH, DEFAULT_QUEUE_DEPTH, FeaturePipeline
+from .frame_embedding import FrameEmbedding
 from .retriever import EmbeddingRetriever
+from .spectral_gate import add_gate_arguments, create_gate
+from .vector_index import DEFAULT_NUM_PROBES, ExactIndex, IVFIndex, VectorIndexFactory
 
 
 def main():
     parser = argparse.ArgumentParser(description="Audio Embedding and Retrieval")
-    parser.add_argument('--audio_folder', type=str, required=True, help="Path to the folder containing audio files")
-    parser.add_argument('--embedding_file', type=str, required=True, help="Path to the file to store/load embeddings")
-    parser.add_argument('--chunk_length', type=int, choices=[1, 3], required=True,
-                        help="Length of the audio chunks in seconds (1 or 3)")
+    parser.add_argument('--audio_folder', type=str, required=True,
+                        help="Path to the folder containing audio files, or the split output root with --source_recording")
+    parser.add_argument('--source_recording', type=str, default=None,
+                        help="Unsplit recording to chunk and embed in memory, without reading chunk WAV files")
+    parser.add_argument('--write_chunks', action='store_true',
+                        help="Also write the chunk WAV files when embedding a --source_recording")
+    parser.add_argument('--embedding_file', type=str, required=True,
+                        help="Path to the embedding store to write/read. Legacy .pkl files are read-only")
+    parser.add_argument('--chunk_length', type=int, choices=[1, 3], default=None,
+                        help="Length of the audio chunks in seconds (1 or 3). Required unless --frame_level is set")
+    parser.add_argument('--frame_level', action='store_true',
+                        help="Embed the whole recordings in --audio_folder once at the frame level and search windows "
+                             "pooled from the stored frames")
+    parser.add_argument('--window_seconds', type=float, default=None,
+                        help="Window length of --frame_level, rounded to 0.96s frames. Defaults to --chunk_length")
+    parser.add_argument('--hop_seconds', type=float, default=None,
+                        help="Hop between --frame_level windows, rounded to 0.96s frames. Defaults to the window length")
     parser.add_argument('--query_audio_path', type=str, default=None,
                         help="Path to the query audio file for retrieval. If not provided, retrieval will be skipped.")
     parser.add_argument('--replace_existing', action='store_true', help="Replace existing embedding file if it exists")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Only embed new or changed audio files and evict deleted ones from the existing store")
+    parser.add_argument('--content_hash', action='store_true',
+                        help="Fingerprint audio files by content hash instead of modification time")
+    parser.add_argument('--batch_size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help="Number of audio chunks embedded per model forward pass")
+    parser.add_argument('--num_workers', type=int, default=0,
+                        help="Worker processes decoding audio and computing features. 0 runs them on the main thread")
+    parser.add_argument('--queue_depth', type=int, default=DEFAULT_QUEUE_DEPTH,
+                        help="Maximum number of decoded chunks waiting for the model")
+    parser.add_argument('--prefetch', type=int, default=DEFAULT_PREFETCH,
+                        help="Files submitted ahead per worker")
+    parser.add_argument('--embedding_dtype', type=str, choices=SUPPORTED_DTYPES, default=DEFAULT_DTYPE,
+                        help="Floating point type of the stored embedding matrix")
+    parser.add_argument('--ann_index', type=str, choices=[ExactIndex.name, IVFIndex.name], default=ExactIndex.name,
+                        help="Similarity search index. ivf is approximate and is persisted next to the embedding store")
+    parser.add_argument('--ann_lists', type=int, default=None, help="IVF lists. Defaults to sqrt of the corpus size")
+    parser.add_argument('--ann_probes', type=int, default=DEFAULT_NUM_PROBES,
+                        help="IVF lists scanned per query. Higher is slower with better recall")
+    add_embedder_arguments(parser)
+    add_gate_arguments(parser)
+    add_profiling_arguments(parser)
 
     args = parser.parse_args()
-
-    audio_data = AudioDataFactory.create_audio_data(args.chunk_length, args.audio_folder)
-
-    embedding = Embedding(audio_data, args.embedding_file, replace_existing=args.replace_existing)
-    embedder = VGGishAudioEmbedder(audio_data)
-    retriever = EmbeddingRetriever(audio_data, embedder, embedding)
-
-    if not embedding.embeddings_exist() or args.replace_existing:
+    start_profiling(args, 'audio_embedding')
+    if args.frame_level:
+        if args.source_recording is not None:
+            parser.error("--frame_level embeds the recordings in --audio_folder and cannot be combined with --source_recording")
+        if args.window_seconds is None and args.chunk_length is None:
+            parser.error("--frame_level requires --window_seconds or --chunk_length")
+    elif args.chunk_length is None:
+        parser.error("--chunk_length is required unless --frame_level is set")
+    if args.embedder != DEFAULT_EMBEDDER and (args.frame_level or args.spectral_gate):
+        parser.error(f"--frame_level and --spectral_gate need the {DEFAULT_EMBEDDER} embedder")
+
+    splitter = None
+    if args.frame_level:
+        window_seconds = args.window_seconds if args.window_seconds is not None else args.chunk_length
+        audio_data = AudioDataFactory.create_windowed_audio_data(window_seconds, args.hop_seconds, args.audio_folder)
+    elif args.source_recording is not None:
+        splitter = AudioSplitter(args.chunk_length * 1000, args.audio_folder)
+        audio_data = AudioDataFactory.create_audio_data(args.chunk_length,
+                                                        splitter.get_output_folder(args.source_recording), [])
+    else:
+        audio_data = AudioDataFactory.create_audio_data(args.chunk_length, args.audio_folder)
+
+    embedding_class = FrameEmbedding if args.frame_level else Embedding
+    embedding = embedding_class(audio_data, args.embedding_file, replace_existing=args.replace_existing,
+                                dtype=args.embedding_dtype, content_hash=args.content_hash)
+    feature_pipeline = FeaturePipeline(args.num_workers, args.queue_depth, args.prefetch) if args.num_workers > 0 else None
+    embedder = EmbedderFactory.create_embedder(args.embedder, audio_data, args, feature_pipeline, create_gate(args))
+    index = VectorIndexFactory.create_index(args.ann_index, args.ann_lists, args.ann_probes)
+    retriever = EmbeddingRetriever(audio_data, embedder, embedding, index)
+
+    if splitter is not None and (not embedding.embeddings_exist() or args.replace_existing):
+        chunks = splitter.iter_chunks(args.source_recording, write_files=args.write_chunks)
+        embeddings_list = embedder.generate_embeddings_from_waveforms(chunks)
+        audio_data.audio_paths = [path for path, _ in embeddings_list]
+        embedding.store_embeddings(embeddings_list)
+    elif args.incremental and not args.replace_existing and splitter is None:
+        embedding.refresh_embeddings(embedder)
+    elif not embedding.embeddings_exist() or args.replace_existing:
         embeddings_list = embedder.generate_embeddings()
         embedding.store_embeddings(embeddings_list)
     else:
@@ -38,23 +110,16 @@ def main():
             query_embedding = embedder.generate_embedding(args.query_audio_path).cpu().numpy().squeeze()
 
             try:
-                similarities, filtered_embeddings = retriever.find_similar_embeddings(query_embedding)
-                similarity_indices = np.argsort(similarities)[::-1]
-
                 similarity_threshold = 0.90
+                similarity_indices, similarity_scores = retriever.above_threshold(query_embedding, similarity_threshold)
+                filtered_embeddings = retriever.get_pooled_embeddings()
                 print(f"Audio files with similarity >= {similarity_threshold * 100}%:")
 
-                found = False
-                for index in similarity_indices:
-                    similarity_score = similarities[index]
-                    if similarity_score >= similarity_threshold:
-                        path, _ = filtered_embeddings[index]
-                        print(f"Audio file: {path}, Similarity score: {similarity_score}")
-                        found = True
-                    else:
-                        break  # Since the list is sorted in descending order, we can break the loop once we drop below the threshold
+                for index, similarity_score in zip(similarity_indices, similarity_scores):
+                    path, _ = filtered_embeddings[index]
+                    print(f"Audio file: {path}, Similarity score: {similarity_score}")
 
-                if not found:
+                if len(similarity_indices) == 0:
                     print("No audio files with similarity >= 90% found.")
 
             except ValueError as e:
@@ -63,7 +128,11 @@ def main():
         print("Query audio path not provided, skipping retrieval.")
 
 
-# python -m src.features.audio_embedding.main --audio_folder data/processed/Sample_4_3s --embedding_file  embeddings/embeddings_Sample_4_3s.pkl
+# python -m src.features.audio_embedding.main --audio_folder data/processed/Sample_4_3s --embedding_file embeddings/embeddings_Sample_4_3s.emb
 #                                             --chunk_length 3 --query_audio_path data/processed/Sample_4_3s/Sample_4_3s_chunk_6234_3s.wav
+# python -m src.features.audio_embedding.main --audio_folder data/raw --embedding_file embeddings/frames_raw.emb --frame_level
+#                                             --window_seconds 5 --hop_seconds 1 --query_audio_path data/processed/Sample_4_3s/Sample_4_3s_chunk_6234_3s.wav
+# python -m src.features.audio_embedding.main --audio_folder data/processed/Sample_4_3s --embedding_file embeddings/wav2vec2_Sample_4_3s.emb
+#                                             --chunk_length 3 --embedder wav2vec2 --hidden_layer 6 --query_audio_path data/processed/Sample_4_3s/Sample_4_3s_chunk_6234_3s.wav
 if __name__ == "__main__":
     main()
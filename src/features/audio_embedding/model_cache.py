@@ -0,0 +1,104 @@
+import argparse
+import copy
+import os
+
+import torch
+
+import config
+from .vggish_features import NUM_BANDS, NUM_FRAMES
+
+
+class VGGishNetwork(torch.nn.Module):
+    # The network part of the hub VGGish (conv features and fc embeddings) without its pre/post-processing, so the
+    # traced graph does not capture the device the hub model moves inputs to.
+    def __init__(self, model):
+        super().__init__()
+        self.features = model.features
+        self.embeddings = model.embeddings
+
+    def forward(self, x):
+        x = self.features(x)
+        x = torch.transpose(x, 1, 3)
+        x = torch.transpose(x, 1, 2)
+        x = x.contiguous()
+        x = x.view(x.size(0), -1)
+        return self.embeddings(x)
+
+
+def model_cache_path(variant):
+    name = config.MODEL_NAME.replace('/', '_')
+    return os.path.join(config.MODEL_CACHE_DIR, f"{name}_{config.MODEL_TYPE}_{variant}.pt")
+
+
+def example_inputs(batch_size=2):
+    return torch.zeros(batch_size, 1, NUM_FRAMES, NUM_BANDS)
+
+
+def load_cached_model(filepath, device):
+    # Loading a TorchScript artifact needs neither the network nor the hub repository code.
+    if not os.path.exists(filepath):
+        return None
+    model = torch.jit.load(filepath, map_location=device)
+    model.eval()
+    return model
+
+
+def save_cached_model(model, filepath):
+    # Eager models are traced first, on a CPU copy so the caller's model stays on its device; the file is written
+    # under a temporary name so readers never see a partial one.
+    if not isinstance(model, torch.jit.ScriptModule):
+        with torch.inference_mode():
+            model = torch.jit.trace(copy.deepcopy(model).cpu().eval(), example_inputs())
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    tmp_filepath = f"{filepath}.tmp"
+    torch.jit.save(model, tmp_filepath)
+    os.replace(tmp_filepath, filepath)
+    print(f"Cached model at {filepath} ({os.path.getsize(filepath) / (1024 * 1024):.1f} MB).")
+
+
+def main():
+    # Pre-warm: downloads the hub model once (on a host with network access) and writes the cache artifacts.
+    from .audio_data import AudioDataFactory
+    from .audio_embedder import (COMPILE_MODES, DEFAULT_CALIBRATION_CHUNKS, QUANTIZATION_MODES,
+                                 OptimizedVGGishAudioEmbedder, VGGishAudioEmbedder)
+
+    parser = argparse.ArgumentParser(description="Write the VGGish model cache so embedders start without the network")
+    parser.add_argument('--backend', type=str, choices=['eager', 'optimized'], default='eager',
+                        help="Backend whose model artifact is cached")
+    parser.add_argument('--quantization', type=str, choices=QUANTIZATION_MODES, default='dynamic',
+                        help="int8 quantization of the optimized backend")
+    parser.add_argument('--calibration_folder', type=str, default=None,
+                        help="Audio chunks calibrating static quantization")
+    parser.add_argument('--calibration_chunks', type=int, default=DEFAULT_CALIBRATION_CHUNKS,
+                        help="Chunks used to calibrate static quantization. Part of the cached artifact's name")
+    parser.add_argument('--chunk_length', type=int, choices=[1, 3], default=3,
+                        help="Length of the calibration audio chunks in seconds (1 or 3)")
+    parser.add_argument('--refresh', action='store_true', help="Rebuild the artifact even if it is already cached")
+
+    args = parser.parse_args()
+
+    if args.calibration_folder is not None:
+        audio_data = AudioDataFactory.create_audio_data(args.chunk_length, args.calibration_folder)
+    else:
+        audio_data = AudioDataFactory.create_audio_data(args.chunk_length, None, [])
+    if args.backend == 'optimized':
+        embedder_class = OptimizedVGGishAudioEmbedder
+        kwargs = {'quantization': args.quantization, 'compile_mode': COMPILE_MODES[-1],
+                  'calibration_chunks': args.calibration_chunks}
+    else:
+        embedder_class = VGGishAudioEmbedder
+        kwargs = {}
+
+    filepath = model_cache_path(embedder_class.get_model_variant(**kwargs))
+    if args.refresh and os.path.exists(filepath):
+        os.remove(filepath)
+    if os.path.exists(filepath):
+        print(f"{filepath} is already cached.")
+        return
+    embedder_class(audio_data, **kwargs)
+
+
+# python -m src.features.audio_embedding.model_cache
+# python -m src.features.audio_embedding.model_cache --backend optimized --quantization static --calibration_folder data/processed/Sample_4_3s
+if __name__ == "__main__":
+    main()
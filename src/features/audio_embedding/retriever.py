@@ -1,34 +1,160 @@
+from collections.abc import Sequence
+
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
-from sklearn.preprocessing import normalize
+
+from src.utils.instrumentation import span
+from .embedding_store import EmbeddingList
+from .vector_index import ExactIndex, index_filepath
+
+# Items pooled per step when building the corpus matrix, to bound the temporary frames x dim gather.
+POOLING_BLOCK_SIZE = 65536
+
+
+def pool_and_normalize(embeddings):
+    # Mean-pools frames (..., frames, dim) -> (..., dim) and L2-normalizes the result; zero vectors stay zero.
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    pooled = embeddings if embeddings.ndim == 1 else embeddings.mean(axis=-2)
+    norms = np.linalg.norm(pooled, axis=-1, keepdims=True)
+    return pooled / np.where(norms == 0, 1, norms)
+
+
+class PooledEmbeddings(Sequence):
+    # (path, normalized embedding) view over the cached corpus matrix, keeping the list contract of
+    # find_similar_embeddings without building one tuple per stored item.
+    def __init__(self, paths, matrix):
+        self.paths = paths
+        self.matrix = matrix
+
+    def __len__(self):
+        return len(self.matrix)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [self[i] for i in range(*item.indices(len(self)))]
+        return self.paths[item], self.matrix[item]
+
+
+class LazyPaths(Sequence):
+    def __init__(self, embeddings_list, items):
+        self.embeddings_list = embeddings_list
+        self.items = items
+
+    def __len__(self):
+        return len(self.items)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [self[i] for i in range(*item.indices(len(self)))]
+        return self.embeddings_list.get_path(int(self.items[item]))
 
 
 class EmbeddingRetriever:
-    def __init__(self, audio_data, embedder, embedding):
+    def __init__(self, audio_data, embedder, embedding, index=None):
         self.audio_data = audio_data
         self.embedder = embedder
         self.embedding = embedding
+        self.index = index if index is not None else ExactIndex()
+        self._source = None
+        self._pooled_embeddings = None
 
-    def find_similar_embeddings(self, query_embedding):
+    def get_pooled_embeddings(self):
+        # The pooled, L2-normalized N x dim float32 corpus matrix is built once per loaded embedding list.
         if self.embedding.embeddings_list is None:
             self.embedding.load_embeddings()
 
         stored_embeddings = self.embedding.embeddings_list
+        if self._pooled_embeddings is None or self._source is not stored_embeddings:
+            with span('pool_corpus', chunks=len(stored_embeddings)):
+                if isinstance(stored_embeddings, PooledEmbeddings):
+                    # Already pooled and normalized, e.g. the windows of a FrameEmbedding.
+                    self._pooled_embeddings = stored_embeddings
+                elif isinstance(stored_embeddings, EmbeddingList):
+                    self._pooled_embeddings = self._pool_embedding_list(stored_embeddings)
+                else:
+                    self._pooled_embeddings = self._pool_legacy_list(stored_embeddings)
+            self._source = stored_embeddings
+            if len(self._pooled_embeddings) > 0:
+                with span('build_index'):
+                    self._build_index(self._pooled_embeddings.matrix)
+
+        if len(self._pooled_embeddings) == 0:
+            raise ValueError("No embeddings with the required shape were found.")
+        return self._pooled_embeddings
+
+    def _build_index(self, matrix):
+        # Approximate indexes are persisted next to the embedding store and rebuilt when the corpus changed.
+        filepath = index_filepath(self.embedding.embedding_file, self.index)
+        if not self.index.load(filepath, matrix):
+            print(f"Building {self.index.name} index over {len(matrix)} embeddings.")
+            self.index.build(matrix)
+            self.index.save(filepath)
+
+    def _pool_embedding_list(self, embeddings_list):
+        expected_dimension = self.audio_data.get_expected_embedding_dimension()
+        frames, dim = (1, expected_dimension[0]) if len(expected_dimension) == 1 else expected_dimension
+        index = embeddings_list.index
+        if len(index) > 0 and embeddings_list.vectors.shape[1] != dim:
+            # A store written by another embedder, e.g. 128-d VGGish rows searched with a Wav2Vec2 query.
+            raise ValueError(f"The embedding store holds {embeddings_list.vectors.shape[1]}-dimensional embeddings "
+                             f"but the embedder produces {dim}-dimensional ones. Re-embed with --replace_existing "
+                             f"or use the embedder that wrote the store.")
+        mask = (index['num_rows'] == frames) & (index['ndim'] == len(expected_dimension))
+        items = np.flatnonzero(mask)
+
+        matrix = np.empty((len(items), dim), dtype=np.float32)
+        frame_offsets = np.arange(frames)
+        for start in range(0, len(items), POOLING_BLOCK_SIZE):
+            block = items[start:start + POOLING_BLOCK_SIZE]
+            rows = index['row_start'][block][:, None] + frame_offsets
+            matrix[start:start + len(block)] = pool_and_normalize(embeddings_list.vectors[rows])
+        return PooledEmbeddings(LazyPaths(embeddings_list, items), matrix)
 
-        filtered_embeddings = []
+    def _pool_legacy_list(self, stored_embeddings):
         expected_dimension = self.audio_data.get_expected_embedding_dimension()
+        paths = []
+        embeddings = []
         for item in stored_embeddings:
             if isinstance(item, tuple) and len(item) == 2:
                 path, se = item
                 if se.shape == expected_dimension:
-                    normalized_embedding = normalize(np.mean(se, axis=0).reshape(1, -1))[0]
-                    filtered_embeddings.append((path, normalized_embedding))
+                    paths.append(path)
+                    embeddings.append(se)
             else:
                 print(f"Invalid item format: {item}")
+        if not embeddings:
+            return PooledEmbeddings(paths, np.empty((0, expected_dimension[-1]), dtype=np.float32))
+        return PooledEmbeddings(paths, pool_and_normalize(np.stack(embeddings)))
 
-        if not filtered_embeddings:
-            raise ValueError("No embeddings with the required shape were found.")
+    def find_similar_embeddings(self, query_embedding):
+        pooled_embeddings = self.get_pooled_embeddings()
+        return self.score(query_embedding), pooled_embeddings
+
+    def score(self, query_embedding):
+        # Exact for every index; approximate indexes only speed up top_k and above_threshold.
+        pooled_embeddings = self.get_pooled_embeddings()
+        with span('similarity', chunks=len(pooled_embeddings)):
+            return self.index.score(pool_and_normalize(query_embedding))
+
+    def score_batch(self, query_embeddings):
+        # One Q x N GEMM for many queries; each query is a frames x dim or dim embedding.
+        pooled_embeddings = self.get_pooled_embeddings()
+        with span('similarity', chunks=len(query_embeddings) * len(pooled_embeddings)):
+            queries = np.stack([pool_and_normalize(query_embedding) for query_embedding in query_embeddings])
+            return self.index.score_batch(queries)
+
+    def top_k(self, query_embedding, k):
+        pooled_embeddings = self.get_pooled_embeddings()
+        with span('similarity', chunks=len(pooled_embeddings)):
+            return self.index.search(pool_and_normalize(query_embedding), k)
+
+    def top_k_batch(self, query_embeddings, k):
+        pooled_embeddings = self.get_pooled_embeddings()
+        with span('similarity', chunks=len(query_embeddings) * len(pooled_embeddings)):
+            queries = np.stack([pool_and_normalize(query_embedding) for query_embedding in query_embeddings])
+            return self.index.search_batch(queries, k)
 
-        query_embedding = normalize(np.mean(query_embedding, axis=0).reshape(1, -1))[0]
-        similarities = cosine_similarity([query_embedding], [embedding for _, embedding in filtered_embeddings])
-        return similarities[0], filtered_embeddings
+    def above_threshold(self, query_embedding, similarity_threshold):
+        # Indices with similarity >= threshold, highest first; only the matches are sorted.
+        pooled_embeddings = self.get_pooled_embeddings()
+        with span('similarity', chunks=len(pooled_embeddings)):
+            return self.index.range_search(pool_and_normalize(query_embedding), similarity_threshold)
@@ -0,0 +1,109 @@
+import numpy as np
+
+from .vggish_features import (_MEL_BREAK_FREQUENCY_HERTZ, _MEL_HIGH_FREQUENCY_Q, LOG_OFFSET, MEL_MAX_HZ, MEL_MIN_HZ,
+                              NUM_MEL_BINS, hertz_to_mel)
+
+# Fundamental range of wail and yelp sirens.
+SIREN_BAND_HZ = (500, 2000)
+GATE_FEATURES = ['level_db', 'band_ratio', 'tonality', 'sweep']
+# Defaults only reject chunks with no siren evidence at all: near silence (white noise at -20 dBFS measures about
+# 32 dB, so -10 dB is roughly -60 dBFS), or audio whose energy mostly lies outside the siren band with neither a
+# tonal peak nor a sweeping one in it. Broadband noise puts about 10% of its energy in the band.
+DEFAULT_MIN_LEVEL_DB = -10.0
+DEFAULT_MIN_BAND_RATIO = 0.4
+DEFAULT_MIN_TONALITY = 4.0
+DEFAULT_MIN_SWEEP = 0.6
+# Mel bins the dominant in-band peak has to travel (10th to 90th percentile) to count as a sweep.
+MIN_SWEEP_BINS = 2
+_EPSILON = 1e-10
+
+
+def mel_center_frequencies():
+    # Center of every VGGish mel band in Hz, matching spectrogram_to_mel_matrix.
+    edges = np.linspace(hertz_to_mel(MEL_MIN_HZ), hertz_to_mel(MEL_MAX_HZ), NUM_MEL_BINS + 2)
+    return _MEL_BREAK_FREQUENCY_HERTZ * (np.exp(edges[1:-1] / _MEL_HIGH_FREQUENCY_Q) - 1.0)
+
+
+_centers = mel_center_frequencies()
+SIREN_BAND_MASK = (_centers >= SIREN_BAND_HZ[0]) & (_centers <= SIREN_BAND_HZ[1])
+
+
+def gate_features(examples):
+    # Per-example gate features from the log-mel examples (..., frames, bands) the embedder already computed, so the
+    # gate needs no second decode or STFT:
+    #   level_db   - mean frame energy of the mel magnitudes in dB (RMS level)
+    #   band_ratio - share of the energy in the 500-2000 Hz siren band
+    #   tonality   - median over frames of the in-band peak-to-mean magnitude ratio; a tone concentrates in 1-2 bands
+    #   sweep      - share of frames whose in-band peak moves by at most one band, if the peak spans a range of
+    #                frequencies; steady tones and noise score 0
+    magnitudes = np.maximum(np.exp(np.asarray(examples, dtype=np.float32)) - LOG_OFFSET, 0)
+    energy = magnitudes ** 2
+    frame_energy = energy.sum(axis=-1)
+    band = magnitudes[..., SIREN_BAND_MASK]
+
+    peaks = band.argmax(axis=-1)
+    continuity = (np.abs(np.diff(peaks, axis=-1)) <= 1).mean(axis=-1)
+    peak_span = np.percentile(peaks, 90, axis=-1) - np.percentile(peaks, 10, axis=-1)
+    return {
+        'level_db': 10 * np.log10(frame_energy.mean(axis=-1) + _EPSILON),
+        'band_ratio': (band ** 2).sum(axis=(-2, -1)) / np.maximum(frame_energy.sum(axis=-1), _EPSILON),
+        'tonality': np.median(band.max(axis=-1) / np.maximum(band.mean(axis=-1), _EPSILON), axis=-1),
+        'sweep': np.where(peak_span >= MIN_SWEEP_BINS, continuity, 0.0),
+    }
+
+
+class SpectralGate:
+    # First stage in front of the embedder. A chunk is rejected, and embedded as zeros without a model call, when
+    # every one of its examples is rejected: the example is quieter than min_level_db, or it shows none of the siren
+    # cues (band energy, tonality, sweep) above their minimums. Any cue keeps the chunk, which keeps recall high.
+    def __init__(self, min_level_db=DEFAULT_MIN_LEVEL_DB, min_band_ratio=DEFAULT_MIN_BAND_RATIO,
+                 min_tonality=DEFAULT_MIN_TONALITY, min_sweep=DEFAULT_MIN_SWEEP):
+        self.min_level_db = min_level_db
+        self.min_band_ratio = min_band_ratio
+        self.min_tonality = min_tonality
+        self.min_sweep = min_sweep
+        self.num_chunks = 0
+        self.num_rejected = 0
+
+    def reject(self, features):
+        siren_cues = ((features['band_ratio'] >= self.min_band_ratio) | (features['tonality'] >= self.min_tonality)
+                      | (features['sweep'] >= self.min_sweep))
+        return (features['level_db'] < self.min_level_db) | ~siren_cues
+
+    def reject_examples(self, examples):
+        return self.reject(gate_features(examples))
+
+    def reject_chunks(self, stacked, counts):
+        # stacked holds the examples of consecutive chunks, counts[i] of them for chunk i. Chunks without examples
+        # are never rejected.
+        counts = np.asarray(counts)
+        ends = np.cumsum(counts)
+        cumulative_rejected = np.concatenate([[0], np.cumsum(self.reject_examples(stacked))])
+        rejected = (cumulative_rejected[ends] - cumulative_rejected[ends - counts] == counts) & (counts > 0)
+        self.num_chunks += len(counts)
+        self.num_rejected += int(rejected.sum())
+        return rejected
+
+    def skip_rate(self):
+        return self.num_rejected / self.num_chunks if self.num_chunks else 0.0
+
+
+def add_gate_arguments(parser, switch=True):
+    # switch adds --spectral_gate for CLIs where the gate is optional; the thresholds are always added.
+    if switch:
+        parser.add_argument('--spectral_gate', action='store_true',
+                            help="Skip the model on chunks a spectral pre-filter rejects; they get similarity 0")
+    parser.add_argument('--gate_min_level_db', type=float, default=DEFAULT_MIN_LEVEL_DB,
+                        help="Chunks quieter than this mel energy level in dB are rejected")
+    parser.add_argument('--gate_min_band_ratio', type=float, default=DEFAULT_MIN_BAND_RATIO,
+                        help="Share of energy in the 500-2000 Hz band that keeps a chunk")
+    parser.add_argument('--gate_min_tonality', type=float, default=DEFAULT_MIN_TONALITY,
+                        help="In-band peak-to-mean ratio that keeps a chunk")
+    parser.add_argument('--gate_min_sweep', type=float, default=DEFAULT_MIN_SWEEP,
+                        help="Share of frames with a continuously moving in-band peak that keeps a chunk")
+
+
+def create_gate(args):
+    if not getattr(args, 'spectral_gate', True):
+        return None
+    return SpectralGate(args.gate_min_level_db, args.gate_min_band_ratio, args.gate_min_tonality, args.gate_min_sweep)
@@ -0,0 +1,177 @@
+import hashlib
+import os
+
+import numpy as np
+
+DEFAULT_NUM_PROBES = 8
+# Rows used to fingerprint a corpus matrix when checking a persisted index against it.
+SIGNATURE_SAMPLE_ROWS = 1024
+# Corpus vectors assigned to lists per step while building an IVF index.
+ASSIGNMENT_BLOCK_SIZE = 65536
+# k-means is trained on at most this many vectors per list.
+TRAINING_SAMPLES_PER_LIST = 256
+
+
+def select_top_k(scores, k):
+    # Indices of the k largest scores, highest first, without sorting the whole vector.
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    candidates = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+    return candidates[np.argsort(-scores[candidates], kind='stable')]
+
+
+def corpus_signature(matrix):
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(np.asarray(matrix.shape, dtype=np.int64).tobytes())
+    sample = np.linspace(0, len(matrix) - 1, num=min(len(matrix), SIGNATURE_SAMPLE_ROWS)).astype(np.int64)
+    digest.update(np.ascontiguousarray(matrix[sample]).tobytes())
+    return digest.hexdigest()
+
+
+class ExactIndex:
+    # Brute-force cosine search over the normalized corpus matrix.
+    name = 'exact'
+    approximate = False
+
+    def __init__(self):
+        self.matrix = None
+
+    def build(self, matrix):
+        self.matrix = matrix
+
+    def score(self, query_vector):
+        return self.matrix @ query_vector
+
+    def score_batch(self, query_vectors):
+        return query_vectors @ self.matrix.T
+
+    def search(self, query_vector, k):
+        scores = self.score(query_vector)
+        indices = select_top_k(scores, k)
+        return indices, scores[indices]
+
+    def search_batch(self, query_vectors, k):
+        scores = self.score_batch(query_vectors)
+        indices = np.stack([select_top_k(row, k) for row in scores])
+        return indices, np.take_along_axis(scores, indices, axis=1)
+
+    def range_search(self, query_vector, threshold):
+        scores = self.score(query_vector)
+        indices = np.flatnonzero(scores >= threshold)
+        indices = indices[np.argsort(-scores[indices], kind='stable')]
+        return indices, scores[indices]
+
+    def save(self, filepath):
+        pass
+
+    def load(self, filepath, matrix):
+        self.build(matrix)
+        return True
+
+
+class IVFIndex(ExactIndex):
+    # Inverted file index: k-means splits the corpus into num_lists lists and a top-k or threshold query only scans
+    # the num_probes lists whose centroid is most similar to it. More probes trade speed for recall. A full score
+    # vector, as classification and threshold sweeps need, is always exact: estimating unscanned items would make
+    # up their scores.
+    name = 'ivf'
+    approximate = True
+
+    def __init__(self, num_lists=None, num_probes=DEFAULT_NUM_PROBES, random_state=42):
+        super().__init__()
+        self.num_lists = num_lists
+        self.num_probes = num_probes
+        self.random_state = random_state
+        self.centroids = None
+        self.assignments = None
+        self.order = None
+        self.list_offsets = None
+
+    def build(self, matrix):
+        from sklearn.cluster import MiniBatchKMeans
+
+        self.matrix = matrix
+        num_lists = self.num_lists or max(1, int(np.sqrt(len(matrix))))
+        num_lists = min(num_lists, len(matrix))
+
+        rng = np.random.default_rng(self.random_state)
+        num_samples = min(len(matrix), num_lists * TRAINING_SAMPLES_PER_LIST)
+        sample = matrix[np.sort(rng.choice(len(matrix), size=num_samples, replace=False))]
+        kmeans = MiniBatchKMeans(n_clusters=num_lists, random_state=self.random_state, n_init=3,
+                                 batch_size=max(1024, num_lists * 4))
+        kmeans.fit(sample)
+        # Unnormalized centroids are list means, so query . centroid is the mean similarity of a list's members.
+        self.centroids = kmeans.cluster_centers_.astype(np.float32)
+
+        centroid_norms = np.square(self.centroids).sum(axis=1)
+        assignments = np.empty(len(matrix), dtype=np.int32)
+        for start in range(0, len(matrix), ASSIGNMENT_BLOCK_SIZE):
+            block = matrix[start:start + ASSIGNMENT_BLOCK_SIZE]
+            assignments[start:start + len(block)] = np.argmax(2 * block @ self.centroids.T - centroid_norms, axis=1)
+        self._set_assignments(assignments)
+
+    def _set_assignments(self, assignments):
+        self.assignments = assignments
+        self.order = np.argsort(assignments, kind='stable')
+        self.list_offsets = np.concatenate([[0], np.cumsum(np.bincount(assignments, minlength=len(self.centroids)))])
+
+    def _candidates(self, query_vector):
+        probes = select_top_k(self.centroids @ query_vector, self.num_probes)
+        return np.concatenate([self.order[self.list_offsets[p]:self.list_offsets[p + 1]] for p in probes])
+
+    def search(self, query_vector, k):
+        candidates = self._candidates(query_vector)
+        scores = self.matrix[candidates] @ query_vector
+        best = select_top_k(scores, k)
+        return candidates[best], scores[best]
+
+    def search_batch(self, query_vectors, k):
+        # Probed lists differ per query, so queries are answered one at a time; rows shorter than k when the
+        # probed lists hold fewer items are padded with index -1 and score -inf.
+        indices = np.full((len(query_vectors), k), -1, dtype=np.int64)
+        scores = np.full((len(query_vectors), k), -np.inf, dtype=np.float32)
+        for i, query_vector in enumerate(query_vectors):
+            row_indices, row_scores = self.search(query_vector, k)
+            indices[i, :len(row_indices)] = row_indices
+            scores[i, :len(row_scores)] = row_scores
+        return indices, scores
+
+    def range_search(self, query_vector, threshold):
+        candidates = self._candidates(query_vector)
+        scores = self.matrix[candidates] @ query_vector
+        matches = np.flatnonzero(scores >= threshold)
+        matches = matches[np.argsort(-scores[matches], kind='stable')]
+        return candidates[matches], scores[matches]
+
+    def save(self, filepath):
+        np.savez(filepath, centroids=self.centroids, assignments=self.assignments,
+                 signature=corpus_signature(self.matrix))
+
+    def load(self, filepath, matrix):
+        if not os.path.exists(filepath):
+            return False
+        with np.load(filepath) as saved:
+            if str(saved['signature']) != corpus_signature(matrix) or (
+                    self.num_lists is not None and len(saved['centroids']) != self.num_lists):
+                return False
+            self.centroids = saved['centroids']
+            assignments = saved['assignments']
+        self.matrix = matrix
+        self._set_assignments(assignments)
+        return True
+
+
+class VectorIndexFactory:
+    @staticmethod
+    def create_index(index_type, num_lists=None, num_probes=DEFAULT_NUM_PROBES):
+        if index_type == ExactIndex.name:
+            return ExactIndex()
+        elif index_type == IVFIndex.name:
+            return IVFIndex(num_lists=num_lists, num_probes=num_probes)
+        else:
+            raise ValueError(f"Invalid index type '{index_type}'. Only {ExactIndex.name} or {IVFIndex.name} are supported.")
+
+
+def index_filepath(embedding_file, index):
+    return f"{embedding_file.rstrip(os.sep)}.{index.name}.npz"
@@ -0,0 +1,118 @@
+from functools import lru_cache
+
+import numpy as np
+import soundfile as sf
+
+from src.utils.instrumentation import span
+
+# Port of the torchvggish front end (vggish_params / mel_features / vggish_input) so log-mel examples can be
+# computed outside the model, in batches and in worker processes, with the same numbers the hub model produces.
+SAMPLE_RATE = 16000
+STFT_WINDOW_LENGTH_SECONDS = 0.025
+STFT_HOP_LENGTH_SECONDS = 0.010
+NUM_MEL_BINS = 64
+MEL_MIN_HZ = 125
+MEL_MAX_HZ = 7500
+LOG_OFFSET = 0.01
+EXAMPLE_WINDOW_SECONDS = 0.96
+EXAMPLE_HOP_SECONDS = 0.96
+# Shape of one log-mel example fed to the network.
+NUM_FRAMES = 96
+NUM_BANDS = NUM_MEL_BINS
+
+_MEL_BREAK_FREQUENCY_HERTZ = 700.0
+_MEL_HIGH_FREQUENCY_Q = 1127.0
+
+
+def frame(data, window_length, hop_length):
+    num_samples = data.shape[0]
+    num_frames = 1 + int(np.floor((num_samples - window_length) / hop_length))
+    shape = (num_frames, window_length) + data.shape[1:]
+    strides = (data.strides[0] * hop_length,) + data.strides
+    return np.lib.stride_tricks.as_strided(data, shape=shape, strides=strides)
+
+
+@lru_cache(maxsize=None)
+def periodic_hann(window_length):
+    return 0.5 - (0.5 * np.cos(2 * np.pi / window_length * np.arange(window_length)))
+
+
+def hertz_to_mel(frequencies_hertz):
+    return _MEL_HIGH_FREQUENCY_Q * np.log(1.0 + (frequencies_hertz / _MEL_BREAK_FREQUENCY_HERTZ))
+
+
+@lru_cache(maxsize=None)
+def spectrogram_to_mel_matrix(num_mel_bins, num_spectrogram_bins, audio_sample_rate, lower_edge_hertz,
+                              upper_edge_hertz):
+    nyquist_hertz = audio_sample_rate / 2.
+    if lower_edge_hertz < 0.0:
+        raise ValueError(f"lower_edge_hertz {lower_edge_hertz:.1f} must be >= 0")
+    if lower_edge_hertz >= upper_edge_hertz:
+        raise ValueError(f"lower_edge_hertz {lower_edge_hertz:.1f} >= upper_edge_hertz {upper_edge_hertz:.1f}")
+    if upper_edge_hertz > nyquist_hertz:
+        raise ValueError(f"upper_edge_hertz {upper_edge_hertz:.1f} is greater than Nyquist {nyquist_hertz:.1f}")
+
+    spectrogram_bins_mel = hertz_to_mel(np.linspace(0.0, nyquist_hertz, num_spectrogram_bins))
+    band_edges_mel = np.linspace(hertz_to_mel(lower_edge_hertz), hertz_to_mel(upper_edge_hertz), num_mel_bins + 2)
+    mel_weights_matrix = np.empty((num_spectrogram_bins, num_mel_bins))
+    for i in range(num_mel_bins):
+        lower_edge_mel, center_mel, upper_edge_mel = band_edges_mel[i:i + 3]
+        lower_slope = (spectrogram_bins_mel - lower_edge_mel) / (center_mel - lower_edge_mel)
+        upper_slope = (upper_edge_mel - spectrogram_bins_mel) / (upper_edge_mel - center_mel)
+        mel_weights_matrix[:, i] = np.maximum(0.0, np.minimum(lower_slope, upper_slope))
+    # HTK excludes the spectrogram DC bin.
+    mel_weights_matrix[0, :] = 0.0
+    mel_weights_matrix.setflags(write=False)
+    return mel_weights_matrix
+
+
+def log_mel_spectrogram(data, audio_sample_rate, log_offset, window_length_secs, hop_length_secs, **kwargs):
+    window_length_samples = int(round(audio_sample_rate * window_length_secs))
+    hop_length_samples = int(round(audio_sample_rate * hop_length_secs))
+    fft_length = 2 ** int(np.ceil(np.log(window_length_samples) / np.log(2.0)))
+
+    frames = frame(data, window_length_samples, hop_length_samples)
+    spectrogram = np.abs(np.fft.rfft(frames * periodic_hann(window_length_samples), fft_length))
+    mel_matrix = spectrogram_to_mel_matrix(num_spectrogram_bins=spectrogram.shape[1],
+                                           audio_sample_rate=audio_sample_rate, **kwargs)
+    return np.log(np.dot(spectrogram, mel_matrix) + log_offset)
+
+
+def load_waveform(audio_path):
+    with span('decode'):
+        wav_data, sample_rate = sf.read(audio_path, dtype='int16')
+    return wav_data / 32768.0, sample_rate
+
+
+def waveform_to_examples(data, sample_rate):
+    with span('feature_extraction', audio_seconds=len(data) / sample_rate):
+        return _waveform_to_examples(data, sample_rate)
+
+
+def _waveform_to_examples(data, sample_rate):
+    if len(data.shape) > 1:
+        data = np.mean(data, axis=1)
+    if sample_rate != SAMPLE_RATE:
+        import resampy
+
+        data = resampy.resample(data, sample_rate, SAMPLE_RATE)
+
+    log_mel = log_mel_spectrogram(
+        data,
+        audio_sample_rate=SAMPLE_RATE,
+        log_offset=LOG_OFFSET,
+        window_length_secs=STFT_WINDOW_LENGTH_SECONDS,
+        hop_length_secs=STFT_HOP_LENGTH_SECONDS,
+        num_mel_bins=NUM_MEL_BINS,
+        lower_edge_hertz=MEL_MIN_HZ,
+        upper_edge_hertz=MEL_MAX_HZ)
+
+    features_sample_rate = 1.0 / STFT_HOP_LENGTH_SECONDS
+    example_window_length = int(round(EXAMPLE_WINDOW_SECONDS * features_sample_rate))
+    example_hop_length = int(round(EXAMPLE_HOP_SECONDS * features_sample_rate))
+    examples = frame(log_mel, window_length=example_window_length, hop_length=example_hop_length)
+    return np.ascontiguousarray(examples, dtype=np.float32)
+
+
+def wavfile_to_examples(audio_path):
+    return waveform_to_examples(*load_waveform(audio_path))
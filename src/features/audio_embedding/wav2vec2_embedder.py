@@ -0,0 +1,159 @@
+import copy
+
+import numpy as np
+import torch
+from tqdm import tqdm
+
+import config
+from src.utils.instrumentation import count, span, timed_iter
+from .audio_embedder import DEFAULT_BATCH_SIZE, AudioEmbedder
+from .vggish_features import SAMPLE_RATE, load_waveform
+
+# Receptive field of the Wav2Vec2 feature encoder; shorter clips are zero padded to one frame.
+MIN_SAMPLES = 400
+# Batches of clips read ahead and sorted by length together, so each forward pass pads to a similar length.
+BUCKET_BATCHES = 8
+# Upper bound on the padded samples of one forward pass, so long clips are embedded in smaller batches.
+MAX_FORWARD_SAMPLES = 320 * SAMPLE_RATE
+_EPSILON = 1e-7
+
+
+def waveform_to_input(data, sample_rate):
+    # 16 kHz mono waveform, normalized to zero mean and unit variance per clip as the Wav2Vec2 feature extractor does.
+    with span('feature_extraction', audio_seconds=len(data) / sample_rate):
+        if len(data.shape) > 1:
+            data = np.mean(data, axis=1)
+        if sample_rate != SAMPLE_RATE:
+            import resampy
+
+            data = resampy.resample(data, sample_rate, SAMPLE_RATE)
+        if len(data):
+            data = (data - data.mean()) / np.sqrt(data.var() + _EPSILON)
+        if len(data) < MIN_SAMPLES:
+            data = np.pad(data, (0, MIN_SAMPLES - len(data)))
+        return np.ascontiguousarray(data, dtype=np.float32)
+
+
+def wavfile_to_input(audio_path):
+    return waveform_to_input(*load_waveform(audio_path))
+
+
+class Wav2Vec2AudioEmbedder(AudioEmbedder):
+    # Embeds the raw waveform with a transformers Wav2Vec2 model into one vector per chunk: the frames of
+    # hidden_layer (0 is the input of the first transformer layer, None the model's last_hidden_state) mean-pooled
+    # over the frames of the chunk's real samples. The layers above hidden_layer are dropped from the encoder once loaded, so they
+    # never run and no other hidden state is kept. model_config builds a randomly initialized model from a
+    # Wav2Vec2Config or the path of its config.json instead of loading weights, which runs offline, e.g. in tests.
+    def __init__(self, audio_data, batch_size=DEFAULT_BATCH_SIZE, feature_pipeline=None,
+                 model_name=config.WAV2VEC2_MODEL_NAME, hidden_layer=None, model_config=None, device=None, gate=None):
+        if gate is not None:
+            raise ValueError("The spectral gate works on VGGish log-mel features and cannot run in front of Wav2Vec2.")
+        self.model_name = model_name
+        self.hidden_layer = hidden_layer
+        self.model_config = model_config
+        self.num_samples = 0
+        self.num_padded_samples = 0
+        super().__init__(audio_data, device, batch_size, feature_pipeline)
+
+    def load_model(self):
+        from transformers import Wav2Vec2Config, Wav2Vec2Model
+
+        if self.model_config is not None:
+            # Copied, since dropping layers below updates the model's config.
+            model_config = self.model_config
+            if isinstance(model_config, Wav2Vec2Config):
+                model_config = copy.deepcopy(model_config)
+            else:
+                model_config = Wav2Vec2Config.from_pretrained(model_config)
+            model = Wav2Vec2Model(model_config)
+        else:
+            model = Wav2Vec2Model.from_pretrained(self.model_name)
+        if self.hidden_layer is not None:
+            if not 0 <= self.hidden_layer <= len(model.encoder.layers):
+                raise ValueError(f"Hidden layer {self.hidden_layer} is out of range. "
+                                 f"The model has {len(model.encoder.layers)} layers.")
+            if model.config.do_stable_layer_norm:
+                # Stable layer norm encoders normalize the output of their last layer; the chosen layer's output is
+                # pooled as is, matching the model's hidden_states[hidden_layer].
+                model.encoder.layer_norm = torch.nn.Identity()
+            model.encoder.layers = model.encoder.layers[:self.hidden_layer]
+            model.config.num_hidden_layers = self.hidden_layer
+        self.model = model.to(self.device).eval()
+        self.embedding_size = model.config.hidden_size
+        # Models with group norm in the feature encoder, e.g. wav2vec2-base, were trained on zero padded batches
+        # without an attention mask; for them the mask only keeps the padded frames out of the pooling. Their group
+        # norm also sees the padding, so their embeddings depend on it, which length bucketing keeps small.
+        self.use_attention_mask = model.config.feat_extract_norm == 'layer'
+
+    def get_embedding_shape(self):
+        return self.embedding_size,
+
+    def get_feature_extractor(self):
+        return wavfile_to_input
+
+    def waveform_to_features(self, samples, sample_rate):
+        return waveform_to_input(samples, sample_rate)
+
+    def embed_features(self, features):
+        with torch.inference_mode():
+            return torch.from_numpy(self._embed_waveforms([features]))
+
+    def generate_embeddings_from_features(self, features, total=None):
+        # Clips are read BUCKET_BATCHES batches ahead and embedded in batches of similar length; the output keeps
+        # the input order.
+        embeddings_list = []
+        pool = []
+        for item in tqdm(timed_iter('feature_wait', features), total=total):
+            pool.append(item)
+            if len(pool) == self.batch_size * BUCKET_BATCHES:
+                embeddings_list.extend(self._embed_pool(pool))
+                pool = []
+        if pool:
+            embeddings_list.extend(self._embed_pool(pool))
+        if self.num_samples:
+            padded_share = self.num_padded_samples / (self.num_samples + self.num_padded_samples)
+            print(f"Length bucketing padded {padded_share * 100:.1f}% of the samples run through the model.")
+        return embeddings_list
+
+    def _embed_pool(self, pool):
+        embeddings = [None] * len(pool)
+        for batch in self._length_batches([len(waveform) for _, waveform in pool]):
+            for i, embedding in zip(batch, self._embed_waveforms([pool[i][1] for i in batch])):
+                embeddings[i] = embedding
+        return [(path, embedding) for (path, _), embedding in zip(pool, embeddings)]
+
+    def _length_batches(self, lengths):
+        # In order of length, clips are cut into batches of at most batch_size clips whose padded size stays within
+        # MAX_FORWARD_SAMPLES; a longer clip is a batch of its own.
+        batches = []
+        batch = []
+        for i in np.argsort(lengths, kind='stable'):
+            if batch and (len(batch) == self.batch_size or (len(batch) + 1) * lengths[i] > MAX_FORWARD_SAMPLES):
+                batches.append(batch)
+                batch = []
+            batch.append(int(i))
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def _embed_waveforms(self, waveforms):
+        lengths = np.array([len(waveform) for waveform in waveforms])
+        padded = np.zeros((len(waveforms), lengths.max()), dtype=np.float32)
+        for i, waveform in enumerate(waveforms):
+            padded[i, :len(waveform)] = waveform
+        self.num_samples += int(lengths.sum())
+        self.num_padded_samples += int(padded.size - lengths.sum())
+        count('padded_samples', int(padded.size - lengths.sum()))
+
+        with span('model_forward', chunks=len(waveforms), audio_seconds=lengths.sum() / SAMPLE_RATE), \
+                torch.inference_mode():
+            input_values = torch.from_numpy(padded).to(self.device)
+            sample_lengths = torch.from_numpy(lengths)
+            attention_mask = None
+            if self.use_attention_mask:
+                attention_mask = (torch.arange(padded.shape[1]) < sample_lengths[:, None]).long().to(self.device)
+            hidden_states = self.model(input_values, attention_mask=attention_mask).last_hidden_state
+            frame_lengths = self.model._get_feat_extract_output_lengths(sample_lengths).to(self.device)
+            frame_mask = torch.arange(hidden_states.shape[1], device=self.device)[None, :] < frame_lengths[:, None]
+            pooled = (hidden_states * frame_mask[:, :, None]).sum(dim=1) / frame_lengths.clamp(min=1)[:, None]
+            return pooled.float().cpu().numpy()
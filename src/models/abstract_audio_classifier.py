@@ -15,7 +15,7 @@ class AbstractAudioClassifier(ABC):
         pass
 
     @abstractmethod
-    def classify(self, similarity_indices, similarities, filtered_embeddings, query_audio_path, similarity_threshold):
+    def classify(self, sweep, similarities, filtered_embeddings, query_audio_path, similarity_threshold):
         pass
 
     @abstractmethod
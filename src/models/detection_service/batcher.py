@@ -0,0 +1,76 @@
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+
+from .metrics import LatencyHistogram
+
+DEFAULT_MAX_BATCH_SIZE = 32
+DEFAULT_MAX_WAIT_MS = 5.0
+
+
+class DynamicBatcher:
+    # Collects items submitted from concurrent request threads and hands them to process_batch together. A batch is
+    # closed when it holds max_batch_size items or max_wait_ms after its first item arrived, so a lone request
+    # waits at most max_wait_ms while a burst of requests shares one model forward pass.
+    def __init__(self, process_batch, max_batch_size=DEFAULT_MAX_BATCH_SIZE, max_wait_ms=DEFAULT_MAX_WAIT_MS):
+        if max_batch_size < 1:
+            raise ValueError("Batch size must be at least 1.")
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait_seconds = max_wait_ms / 1000
+        self.requests = queue.Queue()
+        self.queue_wait = LatencyHistogram()
+        self.batch_latency = LatencyHistogram()
+        self.batch_sizes = Counter()
+        self.worker = threading.Thread(target=self._run, daemon=True)
+        self.worker.start()
+
+    def submit(self, item):
+        future = Future()
+        self.requests.put((time.perf_counter(), item, future))
+        return future
+
+    def get_queue_depth(self):
+        return self.requests.qsize()
+
+    def _next_batch(self):
+        batch = [self.requests.get()]
+        deadline = time.perf_counter() + self.max_wait_seconds
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self.requests.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            start = time.perf_counter()
+            for submitted, _, _ in batch:
+                self.queue_wait.observe(1000 * (start - submitted))
+            try:
+                results = self.process_batch([item for _, item, _ in batch])
+            except Exception as e:
+                for _, _, future in batch:
+                    future.set_exception(e)
+                continue
+            self.batch_latency.observe(1000 * (time.perf_counter() - start))
+            self.batch_sizes[len(batch)] += 1
+            for (_, _, future), result in zip(batch, results):
+                future.set_result(result)
+
+    def get_stats(self):
+        return {
+            'queue_depth': self.get_queue_depth(),
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': 1000 * self.max_wait_seconds,
+            'queue_wait': self.queue_wait.snapshot(),
+            'batch_latency': self.batch_latency.snapshot(),
+            'batch_sizes': {str(size): count for size, count in sorted(dict(self.batch_sizes).items())},
+        }
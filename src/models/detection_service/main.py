@@ -0,0 +1,94 @@
+import argparse
+import logging
+
+import config
+from src.features.audio_embedding.audio_data import AudioDataFactory
+from src.features.audio_embedding.audio_embedder import (COMPILE_MODES, DEFAULT_BATCH_SIZE, QUANTIZATION_MODES,
+                                                          OptimizedVGGishAudioEmbedder, VGGishAudioEmbedder,
+                                                          configure_threads)
+from src.features.audio_embedding.embedding import Embedding
+from src.features.audio_embedding.retriever import EmbeddingRetriever
+from src.features.audio_embedding.vector_index import DEFAULT_NUM_PROBES, ExactIndex, IVFIndex, VectorIndexFactory
+from src.models.detection_service.batcher import DEFAULT_MAX_BATCH_SIZE, DEFAULT_MAX_WAIT_MS
+from src.models.detection_service.service import DEFAULT_TOP_K, DetectionService, create_server
+from src.models.streaming_detector.detector import load_reference_embeddings
+from src.utils.instrumentation import add_profiling_arguments, start_profiling
+
+logging.basicConfig(level=logging.INFO)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve siren detection and similarity search with a resident VGGish model")
+    parser.add_argument('--search_dataset', type=str, required=True, help="Path to the folder containing the data set to search in.")
+    parser.add_argument('--chunk_length', type=int, choices=[1, 3], required=True, help="Length of the audio chunks in seconds (1 or 3)")
+    parser.add_argument('--embedding_file', type=str, default=f"{config.EMBEDDINGS_DIR}/vggish_zero_shot.emb",
+                        help="Embedding store of the search data set. It is created if it does not exist")
+    parser.add_argument('--reference_folder', type=str, default=None,
+                        help="Folder of reference siren clips. Without it responses have no siren decision")
+    parser.add_argument('--similarity_threshold', type=float, default=0.9,
+                        help="Clips at or above this similarity to a reference clip are reported as sirens")
+    parser.add_argument('--k', type=int, default=DEFAULT_TOP_K, help="Default number of similar chunks returned")
+    parser.add_argument('--host', type=str, default='127.0.0.1', help="Address the HTTP server listens on")
+    parser.add_argument('--port', type=int, default=8080, help="Port the HTTP server listens on")
+    parser.add_argument('--unix_socket', type=str, default=None, help="Serve on this Unix socket instead of TCP")
+    parser.add_argument('--max_batch_size', type=int, default=DEFAULT_MAX_BATCH_SIZE,
+                        help="Most requests embedded in one model forward pass")
+    parser.add_argument('--max_wait_ms', type=float, default=DEFAULT_MAX_WAIT_MS,
+                        help="How long a batch waits for more requests after its first one arrived")
+    parser.add_argument('--batch_size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help="Number of audio chunks embedded per model forward pass when building the store")
+    parser.add_argument('--ann_index', type=str, choices=[ExactIndex.name, IVFIndex.name], default=ExactIndex.name,
+                        help="Similarity search index. ivf is approximate and is persisted next to the embedding store")
+    parser.add_argument('--ann_lists', type=int, default=None, help="IVF lists. Defaults to sqrt of the corpus size")
+    parser.add_argument('--ann_probes', type=int, default=DEFAULT_NUM_PROBES,
+                        help="IVF lists scanned per query. Higher is slower with better recall")
+    parser.add_argument('--backend', type=str, choices=['eager', 'optimized'], default='eager',
+                        help="eager runs the float hub model. optimized is the quantized/compiled CPU backend")
+    parser.add_argument('--quantization', type=str, choices=QUANTIZATION_MODES, default='dynamic',
+                        help="int8 quantization of the optimized backend: fc layers only (dynamic) or conv and fc (static)")
+    parser.add_argument('--compile_mode', type=str, choices=COMPILE_MODES, default='torchscript',
+                        help="Graph compilation of the optimized backend")
+    parser.add_argument('--num_threads', type=int, default=None, help="Intra-op CPU threads used by torch")
+    parser.add_argument('--num_interop_threads', type=int, default=None, help="Inter-op CPU threads used by torch")
+    add_profiling_arguments(parser)
+
+    args = parser.parse_args()
+    start_profiling(args, 'detection_service')
+
+    audio_data = AudioDataFactory.create_audio_data(args.chunk_length, args.search_dataset)
+    embedding = Embedding(audio_data, args.embedding_file)
+    if args.backend == 'optimized':
+        embedder = OptimizedVGGishAudioEmbedder(audio_data, args.batch_size, None, args.quantization,
+                                                args.compile_mode, args.num_threads, args.num_interop_threads)
+    else:
+        configure_threads(args.num_threads, args.num_interop_threads)
+        embedder = VGGishAudioEmbedder(audio_data, batch_size=args.batch_size)
+    if not embedding.embeddings_exist():
+        embedding.store_embeddings(embedder.generate_embeddings())
+    index = VectorIndexFactory.create_index(args.ann_index, args.ann_lists, args.ann_probes)
+    retriever = EmbeddingRetriever(audio_data, embedder, embedding, index)
+
+    reference_embeddings = None
+    if args.reference_folder is not None:
+        reference_data = AudioDataFactory.create_audio_data(args.chunk_length, args.reference_folder)
+        reference_embeddings = load_reference_embeddings(embedder, reference_data.audio_paths)
+
+    service = DetectionService(embedder, retriever, reference_embeddings, args.similarity_threshold, args.k,
+                               args.max_batch_size, args.max_wait_ms)
+    server = create_server(service, args.host, args.port, args.unix_socket)
+    address = args.unix_socket or f"http://{args.host}:{args.port}"
+    logging.info(f"Serving {len(service.pooled_embeddings)} embeddings on {address}.")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+# python -m src.models.detection_service.main --search_dataset data/test --chunk_length 3 --reference_folder data/reference/siren
+# curl --data-binary @clip.wav -H 'Content-Type: audio/wav' 'http://127.0.0.1:8080/detect?k=5'
+# curl -d '{"path": "data/test/clip.wav"}' -H 'Content-Type: application/json' http://127.0.0.1:8080/detect
+# curl http://127.0.0.1:8080/metrics
+if __name__ == "__main__":
+    main()
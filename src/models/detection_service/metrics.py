@@ -0,0 +1,45 @@
+import threading
+
+import numpy as np
+
+# Upper bucket edges in milliseconds, roughly logarithmic; the last bucket is open ended.
+LATENCY_BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000]
+
+
+class LatencyHistogram:
+    # Fixed-bucket histogram that is cheap to update from many threads. Percentiles are estimated from the bucket
+    # edges, so their resolution is that of the buckets.
+    def __init__(self, buckets=LATENCY_BUCKETS_MS):
+        self.buckets = np.asarray(buckets, dtype=np.float64)
+        self.counts = np.zeros(len(buckets) + 1, dtype=np.int64)
+        self.total = 0.0
+        self.maximum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value_ms):
+        bucket = np.searchsorted(self.buckets, value_ms)
+        with self.lock:
+            self.counts[bucket] += 1
+            self.total += value_ms
+            self.maximum = max(self.maximum, value_ms)
+
+    def percentile(self, q):
+        count = self.counts.sum()
+        if count == 0:
+            return 0.0
+        bucket = int(np.searchsorted(np.cumsum(self.counts), q / 100 * count))
+        return float(self.buckets[bucket]) if bucket < len(self.buckets) else self.maximum
+
+    def snapshot(self):
+        with self.lock:
+            count = int(self.counts.sum())
+            return {
+                'count': count,
+                'mean_ms': self.total / count if count else 0.0,
+                'p50_ms': self.percentile(50),
+                'p95_ms': self.percentile(95),
+                'p99_ms': self.percentile(99),
+                'max_ms': self.maximum,
+                'buckets_ms': [float(edge) for edge in self.buckets] + ['+inf'],
+                'counts': self.counts.tolist(),
+            }
@@ -0,0 +1,190 @@
+import io
+import json
+import os
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import torch
+
+from src.features.audio_embedding.retriever import pool_and_normalize
+from src.features.audio_embedding.vggish_features import EXAMPLE_HOP_SECONDS
+from src.utils.instrumentation import span
+from .batcher import DEFAULT_MAX_BATCH_SIZE, DEFAULT_MAX_WAIT_MS, DynamicBatcher
+from .metrics import LatencyHistogram
+
+DEFAULT_TOP_K = 10
+MAX_TOP_K = 1000
+# Uploads larger than this are rejected before they are read.
+MAX_UPLOAD_BYTES = 64 * 1024 * 1024
+
+
+class DetectionService:
+    # Keeps the embedder, the pooled corpus matrix of the retriever and the reference siren embeddings in memory.
+    # Feature extraction runs on the request threads; embedding, corpus search and reference scoring run once per
+    # dynamic batch on the batcher thread.
+    def __init__(self, embedder, retriever, reference_embeddings=None, similarity_threshold=0.9, k=DEFAULT_TOP_K,
+                 max_batch_size=DEFAULT_MAX_BATCH_SIZE, max_wait_ms=DEFAULT_MAX_WAIT_MS):
+        self.embedder = embedder
+        self.retriever = retriever
+        self.reference_matrix = (np.asarray(reference_embeddings, dtype=np.float32)
+                                 if reference_embeddings is not None else None)
+        self.similarity_threshold = similarity_threshold
+        self.k = k
+        self.pooled_embeddings = retriever.get_pooled_embeddings()
+        self.batcher = DynamicBatcher(self._process_batch, max_batch_size, max_wait_ms)
+        self.request_latency = LatencyHistogram()
+        self.feature_latency = LatencyHistogram()
+        self.num_requests = 0
+        self.num_errors = 0
+        self.lock = threading.Lock()
+
+    def detect(self, audio, k=None):
+        # audio is a path or a file-like object holding a WAV/FLAC file.
+        start = time.perf_counter()
+        with self.lock:
+            self.num_requests += 1
+        try:
+            k = self.k if k is None else k
+            if not 1 <= k <= MAX_TOP_K:
+                raise ValueError(f"k must be between 1 and {MAX_TOP_K}.")
+            features = self.embedder.extract_features(audio)
+            if len(features) == 0:
+                raise ValueError("The clip is shorter than one VGGish example (0.96 s).")
+            self.feature_latency.observe(1000 * (time.perf_counter() - start))
+            result = self.batcher.submit((features, k)).result()
+        except Exception:
+            with self.lock:
+                self.num_errors += 1
+            raise
+        result['latency_ms'] = 1000 * (time.perf_counter() - start)
+        self.request_latency.observe(result['latency_ms'])
+        return result
+
+    def record_rejected(self):
+        # A request turned away before detect, e.g. a malformed body.
+        with self.lock:
+            self.num_requests += 1
+            self.num_errors += 1
+
+    def _process_batch(self, items):
+        features = [features for features, _ in items]
+        stacked = np.concatenate(features)
+        with span('model_forward', chunks=len(items), audio_seconds=len(stacked) * EXAMPLE_HOP_SECONDS), \
+                torch.inference_mode():
+            embeddings = self.embedder.embed_features(stacked).cpu().numpy()
+        per_clip = np.split(embeddings, np.cumsum([len(f) for f in features])[:-1])
+        indices, scores = self.retriever.top_k_batch(per_clip, max(k for _, k in items))
+
+        siren_scores = None
+        if self.reference_matrix is not None:
+            queries = np.stack([pool_and_normalize(clip_embeddings) for clip_embeddings in per_clip])
+            siren_scores = (queries @ self.reference_matrix.T).max(axis=1)
+
+        results = []
+        for i, (_, k) in enumerate(items):
+            result = {
+                # Approximate indexes pad rows they cannot fill with index -1.
+                'top_k': [{'path': self.pooled_embeddings.paths[index], 'score': float(score)}
+                          for index, score in zip(indices[i][:k], scores[i][:k]) if index >= 0],
+                'batch_size': len(items),
+            }
+            if siren_scores is not None:
+                result['siren_score'] = float(siren_scores[i])
+                result['is_siren'] = bool(siren_scores[i] >= self.similarity_threshold)
+            results.append(result)
+        return results
+
+    def get_stats(self):
+        with self.lock:
+            num_requests, num_errors = self.num_requests, self.num_errors
+        return {
+            'requests': num_requests,
+            'errors': num_errors,
+            'corpus_size': len(self.pooled_embeddings),
+            'request_latency': self.request_latency.snapshot(),
+            'feature_latency': self.feature_latency.snapshot(),
+            **self.batcher.get_stats(),
+        }
+
+
+class DetectionRequestHandler(BaseHTTPRequestHandler):
+    # POST /detect with a WAV/FLAC body, or with a JSON body {"path": ..., "k": ...} naming a file the service can
+    # read. GET /metrics returns the latency histograms and queue depth, GET /health a liveness check.
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == '/health':
+            self._send_json(200, {'status': 'ok'})
+        elif path == '/metrics':
+            self._send_json(200, self.server.service.get_stats())
+        else:
+            self._send_json(404, {'error': f"Unknown endpoint {path}"})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != '/detect':
+            self._send_json(404, {'error': f"Unknown endpoint {url.path}"})
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            if length <= 0 or length > MAX_UPLOAD_BYTES:
+                raise ValueError(f"Request body must be between 1 and {MAX_UPLOAD_BYTES} bytes.")
+            body = self.rfile.read(length)
+            k = parse_qs(url.query).get('k')
+            k = int(k[0]) if k else None
+            if self.headers.get('Content-Type', '').startswith('application/json'):
+                request = json.loads(body)
+                if not isinstance(request, dict):
+                    raise ValueError("The JSON body must be an object with a 'path' field.")
+                audio = request['path']
+                if not isinstance(audio, str) or not os.path.isfile(audio):
+                    raise ValueError(f"{audio} is not a file.")
+                k = request.get('k', k)
+                if k is not None and (isinstance(k, bool) or not isinstance(k, int)):
+                    raise ValueError(f"k must be an integer, got {k!r}.")
+            else:
+                audio = io.BytesIO(body)
+        except (ValueError, KeyError) as e:
+            self.server.service.record_rejected()
+            self._send_json(400, {'error': str(e)})
+            return
+        try:
+            self._send_json(200, self.server.service.detect(audio, k))
+        except (ValueError, KeyError, RuntimeError) as e:
+            self._send_json(400, {'error': str(e)})
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        # Unix socket peers have no address.
+        return self.client_address[0] if isinstance(self.client_address, tuple) else 'unix'
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def create_server(service, host='127.0.0.1', port=8080, unix_socket=None):
+    if unix_socket is not None:
+        if os.path.exists(unix_socket):
+            os.remove(unix_socket)
+        server = ThreadingUnixHTTPServer(unix_socket, DetectionRequestHandler)
+    else:
+        server = ThreadingHTTPServer((host, port), DetectionRequestHandler)
+        server.daemon_threads = True
+    server.service = service
+    return server
@@ -0,0 +1,192 @@
+from collections import defaultdict, namedtuple
+
+import numpy as np
+
+from src.dataset.audio_splitter.audio_splitter import parse_chunk_name
+
+SirenEvent = namedtuple('SirenEvent', ['start_seconds', 'end_seconds', 'peak_score'])
+
+
+class EventDetector:
+    # Turns the per-chunk similarity timeline of one recording into siren events. Scores are smoothed by a centered
+    # moving average over smoothing_chunks chunks; a chunk becomes active once its smoothed score reaches
+    # high_threshold and stays active until it drops below low_threshold (hysteresis). Active runs separated by at
+    # most merge_gap_seconds are merged, and merged events shorter than min_duration_seconds are dropped.
+    #
+    # Scores can arrive in blocks of any size via update; every block is processed with vectorized NumPy and the
+    # state needed to continue (the raw scores still inside the smoothing window, the hysteresis state, the open run
+    # and the last event that may still be merged) is carried to the next one, so a timeline costs linear time and
+    # the events are the same however it is split into blocks. update returns the events that became final; finish
+    # ends the timeline and returns the rest.
+    def __init__(self, chunk_seconds, high_threshold, low_threshold=None, smoothing_chunks=1,
+                 min_duration_seconds=0.0, merge_gap_seconds=0.0):
+        low_threshold = high_threshold if low_threshold is None else low_threshold
+        if low_threshold > high_threshold:
+            raise ValueError("The low threshold cannot be above the high threshold.")
+        if smoothing_chunks < 1:
+            raise ValueError("Smoothing must span at least one chunk.")
+        self.chunk_seconds = chunk_seconds
+        self.high_threshold = high_threshold
+        self.low_threshold = low_threshold
+        self.left = (smoothing_chunks - 1) // 2
+        self.right = smoothing_chunks - 1 - self.left
+        self.min_duration_seconds = min_duration_seconds
+        self.merge_gap_seconds = merge_gap_seconds
+
+        self.raw = np.empty(0, dtype=np.float64)
+        self.raw_start = 0
+        self.total = 0
+        # Chunks before the frontier have their smoothed score and activity decided.
+        self.frontier = 0
+        self.active = False
+        self.run_start = None
+        self.run_peak = -np.inf
+        self.pending = None
+        self.num_events = 0
+
+    def update(self, scores):
+        # Chunks without a score (NaN) count as 0, i.e. no siren.
+        scores = np.nan_to_num(np.asarray(scores, dtype=np.float64), nan=0.0)
+        self.raw = np.concatenate([self.raw, scores])
+        self.total += len(scores)
+        return self._advance(self.total - self.right)
+
+    def finish(self):
+        events = self._advance(self.total)
+        starts, ends, peaks = self._pending_arrays()
+        if self.run_start is not None:
+            starts, ends, peaks = (np.append(starts, self.run_start), np.append(ends, self.total),
+                                   np.append(peaks, self.run_peak))
+            self.run_start = None
+        self.pending = None
+        starts, ends, peaks = self._merge(starts, ends, peaks)
+        return events + self._emit(starts, ends, peaks)
+
+    def _advance(self, end):
+        block_start = self.frontier
+        if end <= block_start:
+            return []
+        positions = np.arange(block_start, end)
+        cumulative = np.concatenate([[0.0], np.cumsum(self.raw)])
+        low = np.maximum(positions - self.left, 0) - self.raw_start
+        high = np.minimum(positions + self.right + 1, self.total) - self.raw_start
+        smoothed = (cumulative[high] - cumulative[low]) / (high - low)
+        raw = self.raw[positions - self.raw_start]
+
+        # Hysteresis: chunks at or above the high threshold switch on, chunks below the low threshold switch off and
+        # chunks in between keep the state of the last chunk that decided it.
+        decision = np.where(smoothed >= self.high_threshold, 1, np.where(smoothed < self.low_threshold, 0, -1))
+        last_decided = np.maximum.accumulate(np.where(decision >= 0, np.arange(len(decision)), -1))
+        active = np.where(last_decided >= 0, decision[np.maximum(last_decided, 0)] == 1, self.active)
+
+        # Runs in block-relative indices; a run that was open before the block starts at 0.
+        changes = np.diff(np.concatenate([[self.active], active]).astype(np.int8))
+        falls = np.flatnonzero(changes == -1)
+        run_starts = np.flatnonzero(changes == 1)
+        if self.active:
+            run_starts = np.concatenate([[0], run_starts])
+        closed_starts = run_starts[:len(falls)]
+        closed_peaks = np.full(len(falls), -np.inf)
+        nonempty = closed_starts < falls
+        if nonempty.any():
+            bounds = np.stack([closed_starts[nonempty], falls[nonempty]], axis=1).ravel()
+            closed_peaks[nonempty] = np.maximum.reduceat(np.append(raw, -np.inf), bounds)[::2]
+        closed_starts = closed_starts + block_start
+        if self.active and len(falls):
+            closed_starts[0] = self.run_start
+            closed_peaks[0] = max(closed_peaks[0], self.run_peak)
+
+        if len(run_starts) > len(falls):
+            open_peak = raw[run_starts[-1]:].max()
+            if self.active and not len(falls):
+                self.run_peak = max(self.run_peak, open_peak)
+            else:
+                self.run_start, self.run_peak = int(run_starts[-1]) + block_start, open_peak
+        else:
+            self.run_start, self.run_peak = None, -np.inf
+
+        self.frontier = end
+        self.active = bool(active[-1])
+        keep_from = max(end - self.left, 0)
+        self.raw = self.raw[keep_from - self.raw_start:]
+        self.raw_start = keep_from
+
+        pending_starts, pending_ends, pending_peaks = self._pending_arrays()
+        starts, ends, peaks = self._merge(np.concatenate([pending_starts, closed_starts]),
+                                          np.concatenate([pending_ends, falls + block_start]),
+                                          np.concatenate([pending_peaks, closed_peaks]))
+        self.pending = None
+        if len(starts) == 0:
+            return []
+        if self.run_start is not None and self._within_gap(ends[-1], self.run_start):
+            # The open run continues the last closed event.
+            self.run_start, self.run_peak = int(starts[-1]), max(self.run_peak, peaks[-1])
+            starts, ends, peaks = starts[:-1], ends[:-1], peaks[:-1]
+        elif self.run_start is None and self._within_gap(ends[-1], self.frontier):
+            # A run starting at the frontier could still be merged into the last event.
+            self.pending = (starts[-1], ends[-1], peaks[-1])
+            starts, ends, peaks = starts[:-1], ends[:-1], peaks[:-1]
+        return self._emit(starts, ends, peaks)
+
+    def _within_gap(self, end, next_start):
+        return (next_start - end) * self.chunk_seconds <= self.merge_gap_seconds
+
+    def _pending_arrays(self):
+        if self.pending is None:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0)
+        start, end, peak = self.pending
+        return np.array([start]), np.array([end]), np.array([peak])
+
+    def _merge(self, starts, ends, peaks):
+        if len(starts) < 2:
+            return starts, ends, peaks
+        first = np.concatenate([[True], (starts[1:] - ends[:-1]) * self.chunk_seconds > self.merge_gap_seconds])
+        last = np.append(first[1:], True)
+        return starts[first], ends[last], np.maximum.reduceat(peaks, np.flatnonzero(first))
+
+    def _emit(self, starts, ends, peaks):
+        keep = (ends - starts) * self.chunk_seconds >= self.min_duration_seconds
+        events = [SirenEvent(start_seconds=float(start * self.chunk_seconds), end_seconds=float(end * self.chunk_seconds),
+                             peak_score=float(peak))
+                  for start, end, peak in zip(starts[keep], ends[keep], peaks[keep])]
+        self.num_events += len(events)
+        return events
+
+
+def detect_events(scores, chunk_seconds, high_threshold, low_threshold=None, smoothing_chunks=1,
+                  min_duration_seconds=0.0, merge_gap_seconds=0.0):
+    detector = EventDetector(chunk_seconds, high_threshold, low_threshold, smoothing_chunks, min_duration_seconds,
+                             merge_gap_seconds)
+    return detector.update(scores) + detector.finish()
+
+
+def build_timeline(chunk_indices, scores):
+    # Places the scores of 1-based chunk indices on a timeline; chunks without a score are NaN.
+    timeline = np.full(max(chunk_indices, default=0), np.nan)
+    timeline[np.asarray(chunk_indices, dtype=np.int64) - 1] = scores
+    return timeline
+
+
+def read_chunk_scores(classification_files):
+    # {recording: (chunk indices, scores)} from classifier output files of "path,similarity" lines, e.g. the siren
+    # and nosiren files of one threshold. Lines whose path is not a chunk name are skipped.
+    indices = defaultdict(list)
+    scores = defaultdict(list)
+    skipped = 0
+    for classification_file in classification_files:
+        with open(classification_file) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                path, score = line.rsplit(',', 1)
+                parsed = parse_chunk_name(path)
+                if parsed is None:
+                    skipped += 1
+                    continue
+                recording, chunk_index = parsed
+                indices[recording].append(chunk_index)
+                scores[recording].append(float(score))
+    if skipped:
+        print(f"Skipped {skipped} lines whose path is not a chunk of a split recording.")
+    return {recording: (indices[recording], scores[recording]) for recording in sorted(indices)}
+
@@ -0,0 +1,125 @@
+import argparse
+import csv
+import json
+import logging
+import os
+import sys
+
+import numpy as np
+
+from src.dataset.audio_splitter.audio_splitter import parse_chunk_name
+from src.models.event_detection.events import EventDetector, build_timeline, read_chunk_scores
+from src.utils.instrumentation import add_profiling_arguments, span, start_profiling
+
+logging.basicConfig(level=logging.INFO)
+
+
+def create_detector(args):
+    return EventDetector(args.chunk_length, args.high_threshold, args.low_threshold, args.smoothing_chunks,
+                         args.min_duration_seconds, args.merge_gap_seconds)
+
+
+def detect_from_files(args):
+    # Every recording's scores are placed on its chunk timeline and processed in one block.
+    events = {}
+    for recording, (chunk_indices, scores) in read_chunk_scores(args.classification_files).items():
+        timeline = build_timeline(chunk_indices, scores)
+        with span('detect_events', chunks=len(timeline), audio_seconds=len(timeline) * args.chunk_length):
+            detector = create_detector(args)
+            events[recording] = detector.update(timeline) + detector.finish()
+    return events
+
+
+def follow_stdin(args):
+    # "path,similarity" lines as the classifier or a streaming source produces them, in chunk order per recording.
+    # Events are printed as JSON lines as soon as they are final; skipped chunk indices count as score 0.
+    detectors = {}
+    next_indices = {}
+    events = {}
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        path, score = line.rsplit(',', 1)
+        parsed = parse_chunk_name(path)
+        if parsed is None:
+            logging.warning(f"Skipping {path}: not a chunk of a split recording.")
+            continue
+        recording, chunk_index = parsed
+        if recording not in detectors:
+            detectors[recording] = create_detector(args)
+            next_indices[recording] = 1
+            events[recording] = []
+        if chunk_index < next_indices[recording]:
+            logging.warning(f"Skipping {path}: chunk {chunk_index} arrived after chunk {next_indices[recording] - 1}.")
+            continue
+        scores = np.full(chunk_index - next_indices[recording] + 1, np.nan)
+        scores[-1] = float(score)
+        next_indices[recording] = chunk_index + 1
+        print_events(recording, detectors[recording].update(scores), events[recording])
+    for recording, detector in detectors.items():
+        print_events(recording, detector.finish(), events[recording])
+    return events
+
+
+def print_events(recording, new_events, events):
+    for event in new_events:
+        events.append(event)
+        print(json.dumps({'recording': recording, 'event': len(events), **event._asdict()}), flush=True)
+
+
+def write_events(events, output_file):
+    os.makedirs(os.path.dirname(output_file) or '.', exist_ok=True)
+    with open(output_file, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['recording', 'event', 'start_seconds', 'end_seconds', 'duration_seconds', 'peak_score'])
+        for recording, recording_events in events.items():
+            for number, event in enumerate(recording_events, 1):
+                writer.writerow([recording, number, f"{event.start_seconds:.2f}", f"{event.end_seconds:.2f}",
+                                 f"{event.end_seconds - event.start_seconds:.2f}", f"{event.peak_score:.4f}"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Detect and count siren events on the chunk timeline of each recording")
+    parser.add_argument('--classification_files', type=str, nargs='+', default=None,
+                        help="Classifier output files of \"path,similarity\" lines, e.g. the siren and nosiren files "
+                             "of one threshold. Without them, lines are read from stdin as they arrive")
+    parser.add_argument('--chunk_length', type=int, choices=[1, 3], required=True,
+                        help="Length of the audio chunks in seconds (1 or 3)")
+    parser.add_argument('--high_threshold', type=float, required=True,
+                        help="Smoothed similarity at or above which a siren event starts")
+    parser.add_argument('--low_threshold', type=float, default=None,
+                        help="Smoothed similarity below which an event ends. Defaults to --high_threshold")
+    parser.add_argument('--smoothing_chunks', type=int, default=1,
+                        help="Chunks averaged by the centered moving average applied before the thresholds")
+    parser.add_argument('--min_duration_seconds', type=float, default=0.0, help="Shorter events are dropped")
+    parser.add_argument('--merge_gap_seconds', type=float, default=0.0,
+                        help="Events separated by at most this many seconds are merged into one")
+    parser.add_argument('--output_file', type=str, default=None, help="Write the events of all recordings to this CSV file")
+    add_profiling_arguments(parser)
+
+    args = parser.parse_args()
+    start_profiling(args, 'event_detection')
+
+    if args.classification_files is not None:
+        events = detect_from_files(args)
+    else:
+        events = follow_stdin(args)
+
+    for recording, recording_events in events.items():
+        if args.classification_files is not None:
+            for number, event in enumerate(recording_events, 1):
+                logging.info(f"{recording} event {number}: {event.start_seconds:.1f}s - {event.end_seconds:.1f}s, "
+                             f"peak similarity {event.peak_score:.4f}")
+        logging.info(f"{recording}: {len(recording_events)} siren events")
+    logging.info(f"Total: {sum(len(recording_events) for recording_events in events.values())} siren events "
+                 f"in {len(events)} recordings")
+    if args.output_file is not None:
+        write_events(events, args.output_file)
+        logging.info(f"Events written to {args.output_file}")
+
+
+# python -m src.models.event_detection.main --classification_files output/vggish_zero_shot/<siren output file> output/vggish_zero_shot/<nosiren output file>
+#                                           --chunk_length 3 --high_threshold 0.85 --low_threshold 0.75 --smoothing_chunks 3 --min_duration_seconds 6 --merge_gap_seconds 3
+# <process printing "path,similarity" lines in chunk order> | python -m src.models.event_detection.main --chunk_length 3 --high_threshold 0.85
+if __name__ == "__main__":
+    main()
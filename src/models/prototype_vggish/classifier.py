@@ -0,0 +1,108 @@
+import logging
+import os
+
+import numpy as np
+import torch
+
+from src.features.audio_embedding.retriever import pool_and_normalize
+from src.models.threshold_sweep import NEGATIVE_LABEL, POSITIVE_LABEL, ThresholdSweep, labels_from_folders
+from src.models.zero_shot_vggish.classifier import ZeroShotVGGishClassifier
+from src.utils.file_manager import FileManager
+from src.utils.instrumentation import span
+
+logging.basicConfig(level=logging.INFO)
+
+AGGREGATIONS = ['max', 'mean', 'knn', 'centroid']
+DEFAULT_NUM_NEIGHBORS = 5
+
+
+def aggregate_scores(scores, reference_labels, aggregation, num_neighbors=DEFAULT_NUM_NEIGHBORS):
+    # Combines a references x corpus similarity matrix into one siren score per corpus item. With only siren
+    # references the score is the aggregated similarity. With non-siren references too it is the margin
+    # (1 + siren - nosiren) / 2, so 0.5 is a tie. A kNN vote is the fraction of siren references among the
+    # num_neighbors most similar ones.
+    positive = reference_labels == POSITIVE_LABEL
+    negative = reference_labels == NEGATIVE_LABEL
+    if aggregation == 'knn':
+        k = min(num_neighbors, len(scores))
+        nearest = np.argpartition(-scores, k - 1, axis=0)[:k]
+        return positive[nearest].mean(axis=0)
+
+    reduce = np.max if aggregation == 'max' else np.mean
+    positive_scores = reduce(scores[positive], axis=0)
+    if not negative.any():
+        return positive_scores
+    return (1 + positive_scores - reduce(scores[negative], axis=0)) / 2
+
+
+def class_prototypes(reference_embeddings, reference_labels):
+    # One L2-normalized centroid per class present in the references, siren first.
+    labels = [label for label in (POSITIVE_LABEL, NEGATIVE_LABEL) if (reference_labels == label).any()]
+    centroids = np.stack([reference_embeddings[reference_labels == label].mean(axis=0) for label in labels])
+    return pool_and_normalize(centroids[:, None]), np.asarray(labels, dtype=reference_labels.dtype)
+
+
+class PrototypeVGGishClassifier(ZeroShotVGGishClassifier):
+    # Zero-shot classification against a whole folder of reference clips instead of one query. All references
+    # are embedded in one batch and scored against the corpus in a single references x corpus GEMM, then the
+    # scores are aggregated per corpus item into a siren score that is thresholded like a single-query similarity.
+    def __init__(self, audio_data, embedding, embedder, retriever, stat_printer, force_refresh_embeddings,
+                 aggregation='max', num_neighbors=DEFAULT_NUM_NEIGHBORS, **kwargs):
+        super().__init__(audio_data, embedding, embedder, retriever, stat_printer, force_refresh_embeddings, **kwargs)
+        if aggregation not in AGGREGATIONS:
+            raise ValueError(f"Unsupported aggregation: {aggregation}. Choose from {AGGREGATIONS}.")
+        self.aggregation = aggregation
+        self.num_neighbors = num_neighbors
+
+    def load_references(self, reference_folder):
+        # reference_folder holds one sub folder per class, named like the labeled data sets (siren, nosiren).
+        paths = []
+        labels = []
+        for class_folder, label in ((self.first_class_folder, POSITIVE_LABEL), (self.second_class_folder, NEGATIVE_LABEL)):
+            folder = os.path.join(reference_folder, os.path.basename(os.path.normpath(class_folder)))
+            if os.path.isdir(folder):
+                class_paths = sorted(os.path.join(folder, file) for file in os.listdir(folder) if file.endswith('.wav'))
+                paths.extend(class_paths)
+                labels.extend([label] * len(class_paths))
+        reference_labels = np.asarray(labels, dtype=np.int8)
+        if not (reference_labels == POSITIVE_LABEL).any():
+            raise ValueError(f"No siren reference clips found in {reference_folder}.")
+
+        embeddings_list = self.embedder.generate_embeddings(paths)
+        reference_embeddings = np.stack([pool_and_normalize(embedding) for _, embedding in embeddings_list])
+        logging.info(f"Loaded {int((reference_labels == POSITIVE_LABEL).sum())} siren and "
+                     f"{int((reference_labels == NEGATIVE_LABEL).sum())} non-siren reference clips.")
+        return reference_embeddings, reference_labels
+
+    def score_corpus(self, reference_embeddings, reference_labels):
+        if self.aggregation == 'centroid':
+            prototypes, prototype_labels = class_prototypes(reference_embeddings, reference_labels)
+            scores = self.retriever.score_batch(prototypes)
+            with span('aggregate_scores', chunks=scores.shape[1]):
+                return aggregate_scores(scores, prototype_labels, 'max')
+        scores = self.retriever.score_batch(reference_embeddings)
+        with span('aggregate_scores', chunks=scores.shape[1]):
+            return aggregate_scores(scores, reference_labels, self.aggregation, self.num_neighbors)
+
+    def run(self, reference_folder, similarity_thresholds):
+        with torch.no_grad():
+            self.generate_embeddings()
+            reference_embeddings, reference_labels = self.load_references(reference_folder)
+            similarities = self.score_corpus(reference_embeddings, reference_labels)
+            filtered_embeddings = self.retriever.get_pooled_embeddings()
+
+            output_basepath = self.stat_printer.dataset_config.output_basepath
+            FileManager.create_directory(directory=output_basepath, allow_existing=True, allow_non_empty=True)
+
+            # Output files are named after the reference set and aggregation in place of a query clip.
+            query_name = f"{os.path.basename(os.path.normpath(reference_folder))}_{self.aggregation}"
+            paths = [path for path, _ in filtered_embeddings]
+            labels = labels_from_folders(paths, self.first_class_folder, self.second_class_folder)
+            sweep = ThresholdSweep(similarities, labels)
+
+            if self.write_threshold_files:
+                for threshold in similarity_thresholds:
+                    self.classify(sweep, similarities, filtered_embeddings, query_name, threshold)
+                    self.print_performance_stats(query_name, threshold)
+
+            self._write_sweep(sweep, query_name, similarity_thresholds, output_basepath)
@@ -0,0 +1,100 @@
+import argparse
+
+import config
+from src.features.audio_embedding.audio_data import AudioDataFactory
+from src.features.audio_embedding.audio_embedder import DEFAULT_BATCH_SIZE
+from src.features.audio_embedding.embedder_registry import EmbedderFactory, add_embedder_arguments
+from src.features.audio_embedding.embedding import Embedding
+from src.features.audio_embedding.embedding_store import DEFAULT_DTYPE, SUPPORTED_DTYPES
+from src.features.audio_embedding.feature_pipeline import DEFAULT_PREFETCH, DEFAULT_QUEUE_DEPTH, FeaturePipeline
+from src.features.audio_embedding.retriever import EmbeddingRetriever
+from src.features.audio_embedding.vector_index import DEFAULT_NUM_PROBES, ExactIndex, IVFIndex, VectorIndexFactory
+from src.models.prototype_vggish.classifier import AGGREGATIONS, DEFAULT_NUM_NEIGHBORS, PrototypeVGGishClassifier
+from src.models.stats.stats_printer import DatasetConfig, ClassificationStatPrinter
+from src.utils.instrumentation import add_profiling_arguments, start_profiling
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Classification of siren and nosiren audio dataset against a folder of VGGish reference clips")
+    parser.add_argument('--search_dataset', type=str, required=True, help="Path to the folder containing the data set to search in.")
+    parser.add_argument('--reference_folder', type=str, required=True,
+                        help="Path to the folder with siren and (optionally) nosiren sub folders of reference clips.")
+    parser.add_argument('--aggregation', type=str, choices=AGGREGATIONS, default='max',
+                        help="How the similarities to all reference clips are combined into one siren score")
+    parser.add_argument('--num_neighbors', type=int, default=DEFAULT_NUM_NEIGHBORS,
+                        help="Reference clips voting per item with the knn aggregation")
+    parser.add_argument('--similarity_thresholds', type=float, nargs='+', required=True,
+                        help="List of siren score thresholds to base the classification on. With nosiren references "
+                             "the score is a margin where 0.5 is a tie.")
+    parser.add_argument('--chunk_length', type=int, choices=[1, 3], required=True, help="Length of the audio chunks in seconds (1 or 3)")
+    parser.add_argument('--replace_existing', action='store_true', help="Replace existing embedding file if it exists")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Only embed new or changed audio files and evict deleted ones from the existing store")
+    parser.add_argument('--content_hash', action='store_true',
+                        help="Fingerprint audio files by content hash instead of modification time")
+    parser.add_argument('--batch_size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help="Number of audio chunks embedded per model forward pass")
+    parser.add_argument('--num_workers', type=int, default=0,
+                        help="Worker processes decoding audio and computing features. 0 runs them on the main thread")
+    parser.add_argument('--queue_depth', type=int, default=DEFAULT_QUEUE_DEPTH,
+                        help="Maximum number of decoded chunks waiting for the model")
+    parser.add_argument('--prefetch', type=int, default=DEFAULT_PREFETCH,
+                        help="Files submitted ahead per worker")
+    parser.add_argument('--embedding_dtype', type=str, choices=SUPPORTED_DTYPES, default=DEFAULT_DTYPE,
+                        help="Floating point type of the stored embedding matrix")
+    parser.add_argument('--ann_index', type=str, choices=[ExactIndex.name, IVFIndex.name], default=ExactIndex.name,
+                        help="Similarity search index, persisted next to the embedding store. Classification scores every "
+                             "chunk exactly; ivf only approximates top-k and threshold searches")
+    parser.add_argument('--ann_lists', type=int, default=None, help="IVF lists. Defaults to sqrt of the corpus size")
+    parser.add_argument('--ann_probes', type=int, default=DEFAULT_NUM_PROBES,
+                        help="IVF lists scanned per query. Higher is slower with better recall")
+    parser.add_argument('--skip_threshold_files', action='store_true',
+                        help="Only write the threshold sweep metrics, not the per-threshold classification files")
+    add_embedder_arguments(parser)
+    add_profiling_arguments(parser)
+
+    args = parser.parse_args()
+    start_profiling(args, 'prototype_vggish')
+
+    first_class_folder = f"{config.DATA_DIR}/test_labeled/siren"
+    second_class_folder = f"{config.DATA_DIR}/test_labeled/nosiren"
+    dataset_config = DatasetConfig(
+        'siren',
+        'nosiren',
+        first_class_folder,
+        second_class_folder,
+        f"{config.OUTPUT_DIR}/{args.embedder}_prototype",
+        f"{config.EMBEDDINGS_DIR}/{args.embedder}_zero_shot.emb"
+    )
+
+    audio_data = AudioDataFactory.create_audio_data(args.chunk_length, args.search_dataset)
+    embedding = Embedding(audio_data, dataset_config.embeddings_filepath, args.replace_existing, args.embedding_dtype,
+                          args.content_hash)
+    feature_pipeline = FeaturePipeline(args.num_workers, args.queue_depth, args.prefetch) if args.num_workers > 0 else None
+    embedder = EmbedderFactory.create_embedder(args.embedder, audio_data, args, feature_pipeline)
+    index = VectorIndexFactory.create_index(args.ann_index, args.ann_lists, args.ann_probes)
+    retriever = EmbeddingRetriever(audio_data, embedder, embedding, index)
+    stat_printer = ClassificationStatPrinter(dataset_config)
+
+    classifier = PrototypeVGGishClassifier(
+        audio_data=audio_data,
+        embedding=embedding,
+        embedder=embedder,
+        retriever=retriever,
+        stat_printer=stat_printer,
+        force_refresh_embeddings=args.replace_existing,
+        incremental_refresh=args.incremental,
+        first_class_folder=first_class_folder,
+        second_class_folder=second_class_folder,
+        write_threshold_files=not args.skip_threshold_files,
+        aggregation=args.aggregation,
+        num_neighbors=args.num_neighbors
+    )
+
+    classifier.run(args.reference_folder, args.similarity_thresholds)
+
+
+# python -m src.models.prototype_vggish.main --search_dataset data/test --reference_folder data/reference
+#                                            --chunk_length 3 --aggregation knn --similarity_thresholds 0.5 0.6 0.8
+if __name__ == "__main__":
+    main()
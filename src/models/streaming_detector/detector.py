@@ -0,0 +1,114 @@
+import time
+from collections import namedtuple
+
+import numpy as np
+import torch
+
+from src.features.audio_embedding.retriever import pool_and_normalize
+from src.features.audio_embedding.vggish_features import EXAMPLE_HOP_SECONDS
+from src.utils.instrumentation import count, span
+
+DetectionEvent = namedtuple('DetectionEvent', ['start_seconds', 'end_seconds', 'score', 'is_siren', 'latency_ms'])
+
+
+class RingBuffer:
+    # Fixed-size sample buffer addressed by absolute sample index since the start of the stream.
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.buffer = np.zeros(capacity, dtype=np.float32)
+        self.total_written = 0
+
+    def write(self, samples):
+        num_samples = len(samples)
+        if num_samples > self.capacity:
+            samples = samples[-self.capacity:]
+        start = (self.total_written + num_samples - len(samples)) % self.capacity
+        first = min(len(samples), self.capacity - start)
+        self.buffer[start:start + first] = samples[:first]
+        self.buffer[:len(samples) - first] = samples[first:]
+        self.total_written += num_samples
+
+    def read(self, end, length):
+        if end > self.total_written or end - length < max(0, self.total_written - self.capacity):
+            raise ValueError(f"Samples [{end - length}, {end}) are no longer or not yet in the ring buffer.")
+        start = (end - length) % self.capacity
+        if start + length <= self.capacity:
+            return self.buffer[start:start + length].copy()
+        return np.concatenate([self.buffer[start:], self.buffer[:start + length - self.capacity]])
+
+
+class StreamingSirenDetector:
+    # Cuts overlapping windows of window_seconds every hop_seconds out of a live sample stream, embeds every
+    # window that became complete in one batch and scores it by its best cosine similarity to the reference
+    # siren embeddings. When processing falls more than max_pending_windows behind, the oldest windows are dropped
+    # so latency stays bounded.
+    def __init__(self, embedder, reference_embeddings, sample_rate, window_seconds, hop_seconds,
+                 similarity_threshold, max_pending_windows=8):
+        self.embedder = embedder
+        # One L2-normalized row per reference clip, as returned by load_reference_embeddings.
+        self.reference_matrix = np.asarray(reference_embeddings, dtype=np.float32)
+        self.sample_rate = sample_rate
+        self.window_samples = int(round(window_seconds * sample_rate))
+        self.hop_samples = int(round(hop_seconds * sample_rate))
+        if self.window_samples < 1 or self.hop_samples < 1:
+            raise ValueError("Window and hop must be at least one sample long.")
+        if max_pending_windows < 1:
+            raise ValueError("At least one pending window must be processed per step.")
+        self.similarity_threshold = similarity_threshold
+        self.max_pending_windows = max_pending_windows
+        self.ring_buffer = RingBuffer(self.window_samples + self.hop_samples * max_pending_windows)
+        self.next_window_end = self.window_samples
+        self.window_latencies_ms = []
+        self.dropped_windows = 0
+        self.processing_seconds = 0.0
+
+    def process(self, samples):
+        arrival_time = time.perf_counter()
+        self.ring_buffer.write(samples)
+
+        window_ends = []
+        while self.next_window_end <= self.ring_buffer.total_written:
+            window_ends.append(self.next_window_end)
+            self.next_window_end += self.hop_samples
+        if len(window_ends) > self.max_pending_windows:
+            self.dropped_windows += len(window_ends) - self.max_pending_windows
+            count('dropped_windows', len(window_ends) - self.max_pending_windows)
+            window_ends = window_ends[-self.max_pending_windows:]
+        if not window_ends:
+            return []
+
+        windows = [self.ring_buffer.read(end, self.window_samples) for end in window_ends]
+        features = [self.embedder.waveform_to_features(window, self.sample_rate) for window in windows]
+        stacked = np.concatenate(features)
+        with span('model_forward', chunks=len(windows), audio_seconds=len(stacked) * EXAMPLE_HOP_SECONDS), \
+                torch.inference_mode():
+            embeddings = self.embedder.embed_features(stacked).cpu().numpy()
+        per_window = np.split(embeddings, np.cumsum([len(f) for f in features])[:-1])
+        with span('similarity', chunks=len(windows)):
+            scores = (pool_and_normalize(np.stack(per_window)) @ self.reference_matrix.T).max(axis=1)
+
+        done_time = time.perf_counter()
+        self.processing_seconds += done_time - arrival_time
+        latency_ms = 1000 * (done_time - arrival_time)
+        self.window_latencies_ms.extend([latency_ms] * len(window_ends))
+        return [DetectionEvent(start_seconds=(end - self.window_samples) / self.sample_rate,
+                               end_seconds=end / self.sample_rate,
+                               score=float(score),
+                               is_siren=bool(score >= self.similarity_threshold),
+                               latency_ms=latency_ms)
+                for end, score in zip(window_ends, scores)]
+
+    def get_audio_seconds(self):
+        return self.ring_buffer.total_written / self.sample_rate
+
+    def get_real_time_factor(self):
+        # Processing time per second of audio; below 1 keeps up with the stream.
+        audio_seconds = self.get_audio_seconds()
+        return self.processing_seconds / audio_seconds if audio_seconds else 0.0
+
+
+def load_reference_embeddings(embedder, reference_paths):
+    embeddings_list = embedder.generate_embeddings(reference_paths)
+    if not embeddings_list:
+        raise ValueError("No reference siren clips found.")
+    return np.stack([pool_and_normalize(embedding) for _, embedding in embeddings_list])
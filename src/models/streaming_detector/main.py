@@ -0,0 +1,103 @@
+import argparse
+import json
+import logging
+import sys
+
+import numpy as np
+
+from src.features.audio_embedding.audio_data import AudioDataFactory
+from src.features.audio_embedding.audio_embedder import (COMPILE_MODES, DEFAULT_BATCH_SIZE, QUANTIZATION_MODES,
+                                                          OptimizedVGGishAudioEmbedder, VGGishAudioEmbedder,
+                                                          configure_threads)
+from src.models.streaming_detector.detector import StreamingSirenDetector, load_reference_embeddings
+from src.models.streaming_detector.sources import PCMDecoder, follow_file, read_stdin, read_unix_socket
+from src.utils.instrumentation import add_profiling_arguments, start_profiling
+
+logging.basicConfig(level=logging.INFO)
+
+SOURCES = ['stdin', 'file', 'socket']
+
+
+def open_source(args):
+    if args.source == 'stdin':
+        return read_stdin(args.block_size)
+    if args.path is None:
+        raise ValueError(f"--path is required for the {args.source} source.")
+    if args.source == 'file':
+        return follow_file(args.path, args.block_size, idle_timeout=args.idle_timeout, skip_bytes=args.skip_bytes)
+    return read_unix_socket(args.path, args.block_size)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Detect sirens in a live 16-bit PCM audio stream using VGGish")
+    parser.add_argument('--source', type=str, choices=SOURCES, default='stdin', help="Where to read PCM audio from")
+    parser.add_argument('--path', type=str, default=None,
+                        help="File being appended to (file source) or Unix socket to listen on (socket source)")
+    parser.add_argument('--reference_folder', type=str, required=True,
+                        help="Path to the folder containing reference siren clips.")
+    parser.add_argument('--sample_rate', type=int, default=16000, help="Sample rate of the incoming PCM")
+    parser.add_argument('--channels', type=int, default=1, help="Interleaved channels of the incoming PCM")
+    parser.add_argument('--window_seconds', type=float, default=3.0, help="Length of each scored window")
+    parser.add_argument('--hop_seconds', type=float, default=1.0, help="Time between the starts of two windows")
+    parser.add_argument('--similarity_threshold', type=float, default=0.9,
+                        help="Windows at or above this similarity to a reference clip are reported as sirens")
+    parser.add_argument('--max_pending_windows', type=int, default=8,
+                        help="Windows processed per step at most. Older ones are dropped to bound latency")
+    parser.add_argument('--block_size', type=int, default=8192, help="Bytes read from the source at a time")
+    parser.add_argument('--skip_bytes', type=int, default=0, help="Header bytes to skip at the start of a file")
+    parser.add_argument('--idle_timeout', type=float, default=None,
+                        help="Stop following a file after this many seconds without new data")
+    parser.add_argument('--all_windows', action='store_true', help="Emit every scored window, not only detections")
+    parser.add_argument('--batch_size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help="Number of reference clips embedded per model forward pass")
+    parser.add_argument('--backend', type=str, choices=['eager', 'optimized'], default='eager',
+                        help="eager runs the float hub model. optimized is the quantized/compiled CPU backend")
+    parser.add_argument('--quantization', type=str, choices=QUANTIZATION_MODES, default='dynamic',
+                        help="int8 quantization of the optimized backend: fc layers only (dynamic) or conv and fc (static)")
+    parser.add_argument('--compile_mode', type=str, choices=COMPILE_MODES, default='torchscript',
+                        help="Graph compilation of the optimized backend")
+    parser.add_argument('--num_threads', type=int, default=None, help="Intra-op CPU threads used by torch")
+    parser.add_argument('--num_interop_threads', type=int, default=None, help="Inter-op CPU threads used by torch")
+    add_profiling_arguments(parser)
+
+    args = parser.parse_args()
+    if args.max_pending_windows < 1:
+        parser.error("--max_pending_windows must be at least 1")
+    start_profiling(args, 'streaming_detector')
+
+    reference_data = AudioDataFactory.create_audio_data(1, args.reference_folder)
+    if args.backend == 'optimized':
+        embedder = OptimizedVGGishAudioEmbedder(reference_data, args.batch_size, None, args.quantization,
+                                                args.compile_mode, args.num_threads, args.num_interop_threads)
+    else:
+        configure_threads(args.num_threads, args.num_interop_threads)
+        embedder = VGGishAudioEmbedder(reference_data, batch_size=args.batch_size)
+    reference_embeddings = load_reference_embeddings(embedder, reference_data.audio_paths)
+    detector = StreamingSirenDetector(embedder, reference_embeddings, args.sample_rate, args.window_seconds,
+                                      args.hop_seconds, args.similarity_threshold, args.max_pending_windows)
+    decoder = PCMDecoder(args.channels)
+
+    logging.info(f"Listening on {args.source} with {len(reference_embeddings)} reference clips.")
+    try:
+        for block in open_source(args):
+            for event in detector.process(decoder.decode(block)):
+                if event.is_siren or args.all_windows:
+                    print(json.dumps(event._asdict()), flush=True)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        latencies = np.asarray(detector.window_latencies_ms)
+        if len(latencies):
+            logging.info(f"Processed {detector.get_audio_seconds():.1f}s of audio in {len(latencies)} windows "
+                         f"({detector.dropped_windows} dropped). Window latency ms: "
+                         f"p50={np.percentile(latencies, 50):.1f}, p95={np.percentile(latencies, 95):.1f}, "
+                         f"max={latencies.max():.1f}. Real-time factor: {detector.get_real_time_factor():.3f}")
+        else:
+            logging.info("No complete window was received.")
+        sys.stdout.flush()
+
+
+# ffmpeg -i rtsp://camera/audio -f s16le -ac 1 -ar 16000 - | python -m src.models.streaming_detector.main
+#                                                            --reference_folder data/reference/siren --hop_seconds 0.5
+if __name__ == "__main__":
+    main()
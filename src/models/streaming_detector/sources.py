@@ -0,0 +1,72 @@
+import os
+import socket
+import sys
+import time
+
+import numpy as np
+
+PCM_SAMPLE_WIDTH_BYTES = 2
+
+
+class PCMDecoder:
+    # Turns raw signed 16-bit little-endian PCM blocks into mono float samples in [-1, 1]. Blocks may split a
+    # frame anywhere; the incomplete tail is kept for the next block.
+    def __init__(self, channels=1):
+        self.channels = channels
+        self.frame_bytes = PCM_SAMPLE_WIDTH_BYTES * channels
+        self.pending = b''
+
+    def decode(self, block):
+        data = self.pending + block
+        usable = len(data) - len(data) % self.frame_bytes
+        self.pending = data[usable:]
+        samples = np.frombuffer(data[:usable], dtype='<i2').astype(np.float32) / 32768.0
+        if self.channels > 1:
+            samples = samples.reshape(-1, self.channels).mean(axis=1)
+        return samples
+
+
+def read_stdin(block_size):
+    stream = sys.stdin.buffer
+    while True:
+        block = stream.read1(block_size)
+        if not block:
+            return
+        yield block
+
+
+def follow_file(filepath, block_size, poll_interval=0.05, idle_timeout=None, skip_bytes=0):
+    # Like tail -f: keeps reading bytes appended to the file and stops after idle_timeout seconds without new data.
+    with open(filepath, 'rb') as f:
+        f.seek(skip_bytes)
+        last_data_time = time.monotonic()
+        while True:
+            block = f.read(block_size)
+            if block:
+                last_data_time = time.monotonic()
+                yield block
+            elif idle_timeout is not None and time.monotonic() - last_data_time > idle_timeout:
+                return
+            else:
+                time.sleep(poll_interval)
+
+
+def read_unix_socket(socket_path, block_size):
+    # Listens on a local Unix socket and streams the PCM of the first client until it disconnects.
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        server.bind(socket_path)
+        server.listen(1)
+        connection, _ = server.accept()
+        with connection:
+            while True:
+                block = connection.recv(block_size)
+                if not block:
+                    return
+                yield block
+    finally:
+        server.close()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
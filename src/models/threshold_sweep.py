@@ -0,0 +1,91 @@
+import os
+
+import numpy as np
+
+POSITIVE_LABEL = 1
+NEGATIVE_LABEL = 0
+UNKNOWN_LABEL = -1
+
+
+def labels_from_folders(paths, positive_folder, negative_folder):
+    # Ground truth by file name: chunks whose name appears in the positive (negative) labeled folder.
+    positive_names = set(os.listdir(positive_folder)) if os.path.isdir(positive_folder) else set()
+    negative_names = set(os.listdir(negative_folder)) if os.path.isdir(negative_folder) else set()
+    labels = np.full(len(paths), UNKNOWN_LABEL, dtype=np.int8)
+    for i, path in enumerate(paths):
+        name = os.path.basename(path)
+        if name in positive_names:
+            labels[i] = POSITIVE_LABEL
+        elif name in negative_names:
+            labels[i] = NEGATIVE_LABEL
+    return labels
+
+
+def _area_under_curve(x, y):
+    return float(np.sum(np.diff(x) * (y[1:] + y[:-1]) / 2))
+
+
+class ThresholdSweep:
+    # Classifies at any number of thresholds from one descending sort of the similarity vector. Cumulative
+    # positive counts along the sort give the confusion matrix at a threshold with one binary search, so a sweep
+    # costs O(N log N) once instead of one pass over the corpus per threshold.
+    def __init__(self, similarities, labels=None):
+        self.similarities = np.asarray(similarities)
+        self.order = np.argsort(-self.similarities, kind='stable')
+        self.sorted_scores = self.similarities[self.order]
+        self.labels = labels
+        if labels is not None:
+            sorted_labels = np.asarray(labels)[self.order]
+            known = sorted_labels != UNKNOWN_LABEL
+            self.cumulative_known = np.concatenate([[0], np.cumsum(known)])
+            self.cumulative_positives = np.concatenate([[0], np.cumsum(sorted_labels == POSITIVE_LABEL)])
+            self.total_positives = int(self.cumulative_positives[-1])
+            self.total_negatives = int(self.cumulative_known[-1]) - self.total_positives
+
+    def count_above(self, thresholds):
+        # Number of items with similarity >= threshold, i.e. the split point in the sorted order.
+        return np.searchsorted(-self.sorted_scores, -np.asarray(thresholds, dtype=self.sorted_scores.dtype),
+                               side='right')
+
+    def confusion_matrices(self, thresholds):
+        if self.labels is None:
+            raise ValueError("Confusion matrices need labels.")
+        split = self.count_above(thresholds)
+        true_positives = self.cumulative_positives[split]
+        false_positives = self.cumulative_known[split] - true_positives
+        false_negatives = self.total_positives - true_positives
+        true_negatives = self.total_negatives - false_positives
+        return true_positives, false_positives, false_negatives, true_negatives
+
+    def metrics(self, thresholds):
+        tp, fp, fn, tn = (counts.astype(np.float64) for counts in self.confusion_matrices(thresholds))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            precision = np.where(tp + fp > 0, tp / (tp + fp), 0.0)
+            recall = np.where(tp + fn > 0, tp / (tp + fn), 0.0)
+            f1 = np.where(precision + recall > 0, 2 * precision * recall / (precision + recall), 0.0)
+            accuracy = np.where(tp + fp + fn + tn > 0, (tp + tn) / (tp + fp + fn + tn), 0.0)
+            false_positive_rate = np.where(fp + tn > 0, fp / (fp + tn), 0.0)
+        return {
+            'threshold': np.asarray(thresholds, dtype=np.float64),
+            'true_positives': tp, 'false_positives': fp, 'false_negatives': fn, 'true_negatives': tn,
+            'precision': precision, 'recall': recall, 'f1': f1, 'accuracy': accuracy,
+            'false_positive_rate': false_positive_rate,
+        }
+
+    def curves(self):
+        # PR and ROC points at every distinct similarity, from the highest threshold down.
+        last_of_run = np.flatnonzero(np.diff(self.sorted_scores, append=-np.inf) != 0)
+        thresholds = self.sorted_scores[last_of_run]
+        metrics = self.metrics(thresholds)
+        roc_fpr = np.concatenate([[0.0], metrics['false_positive_rate']])
+        roc_tpr = np.concatenate([[0.0], metrics['recall']])
+        pr_recall = np.concatenate([[0.0], metrics['recall']])
+        pr_precision = np.concatenate([[1.0], metrics['precision']])
+        metrics['roc_auc'] = _area_under_curve(roc_fpr, roc_tpr)
+        metrics['average_precision'] = float(np.sum(np.diff(pr_recall) * pr_precision[1:]))
+        return metrics
+
+    def write_metrics(self, filepath, metrics):
+        columns = [name for name, values in metrics.items() if isinstance(values, np.ndarray)]
+        np.savetxt(filepath, np.column_stack([metrics[name] for name in columns]), delimiter=',',
+                   header=','.join(columns), comments='', fmt='%.6g')
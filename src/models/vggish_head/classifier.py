@@ -0,0 +1,99 @@
+import logging
+import os
+import time
+
+import numpy as np
+import torch
+
+from src.models.threshold_sweep import UNKNOWN_LABEL, ThresholdSweep, labels_from_folders
+from src.models.vggish_head.head import EmbeddingHead
+from src.models.zero_shot_vggish.classifier import ZeroShotVGGishClassifier
+from src.utils.file_manager import FileManager
+from src.utils.instrumentation import span
+
+logging.basicConfig(level=logging.INFO)
+
+
+class TrainedHeadVGGishClassifier(ZeroShotVGGishClassifier):
+    # Classifies the search corpus with a logistic regression or MLP head trained on the stored VGGish embeddings of
+    # the DataSplitter train split. Training and inference both read the pooled corpus matrices of the embedding
+    # stores, so no audio is re-embedded once the stores exist. The siren probability takes the place of the
+    # similarity, so thresholds, sweeps and output files work as for the zero-shot classifier.
+    def __init__(self, audio_data, embedding, embedder, retriever, stat_printer, force_refresh_embeddings,
+                 train_embedding, train_retriever, head, first_train_folder, second_train_folder, retrain=False,
+                 **kwargs):
+        super().__init__(audio_data, embedding, embedder, retriever, stat_printer, force_refresh_embeddings, **kwargs)
+        self.train_embedding = train_embedding
+        self.train_retriever = train_retriever
+        self.head = head
+        self.first_train_folder = first_train_folder
+        self.second_train_folder = second_train_folder
+        self.retrain = retrain
+
+    def generate_embeddings(self):
+        super().generate_embeddings()
+        if self.incremental_refresh and not self.force_refresh_embeddings:
+            self.train_embedding.refresh_embeddings(self.embedder)
+        elif not self.train_embedding.embeddings_exist() or self.force_refresh_embeddings:
+            embeddings_list = self.embedder.generate_embeddings(self.train_embedding.audio_data.audio_paths)
+            self.train_embedding.store_embeddings(embeddings_list)
+        else:
+            logging.info("The training embedding file already exists. Skipping embedding computation.")
+
+    def train(self, head_filepath):
+        train_embeddings = self.train_retriever.get_pooled_embeddings()
+        paths = [path for path, _ in train_embeddings]
+        train_folders = {os.path.abspath(self.first_train_folder), os.path.abspath(self.second_train_folder)}
+        outside = [path for path in paths if os.path.abspath(os.path.dirname(path)) not in train_folders]
+        if outside:
+            raise ValueError(f"The training store holds {len(outside)} embeddings outside the train folders, "
+                             f"e.g. {outside[0]}. Rebuild it with --replace_existing.")
+        labels = labels_from_folders(paths, self.first_train_folder, self.second_train_folder)
+        known = labels != UNKNOWN_LABEL
+        if len(np.unique(labels[known])) < 2:
+            raise ValueError("The training split needs embeddings of both classes.")
+
+        start = time.perf_counter()
+        with span('head_train', chunks=int(known.sum())):
+            self.head.fit(train_embeddings.matrix[known], labels[known])
+        elapsed = time.perf_counter() - start
+        accuracy = np.mean((self.head.predict_proba(train_embeddings.matrix[known]) >= 0.5) == labels[known])
+        logging.info(f"Trained {self.head.name} head on {int(known.sum())} chunks in {elapsed:.1f}s. "
+                     f"Training accuracy: {accuracy:.4f}")
+
+        FileManager.create_directory(directory=os.path.dirname(head_filepath), allow_existing=True,
+                                     allow_non_empty=True)
+        self.head.save(head_filepath)
+        logging.info(f"Saved head to {head_filepath} ({os.path.getsize(head_filepath) / 1024:.1f} kB).")
+
+    def run(self, head_filepath, similarity_thresholds):
+        with torch.no_grad():
+            self.generate_embeddings()
+            if self.retrain or not os.path.exists(head_filepath):
+                self.train(head_filepath)
+            else:
+                self.head = EmbeddingHead.load(head_filepath)
+                logging.info(f"Loaded {self.head.name} head from {head_filepath}.")
+
+            filtered_embeddings = self.retriever.get_pooled_embeddings()
+            start = time.perf_counter()
+            with span('head_predict', chunks=len(filtered_embeddings)):
+                probabilities = self.head.predict_proba(filtered_embeddings.matrix)
+            elapsed_ms = 1000 * (time.perf_counter() - start)
+            logging.info(f"Scored {len(probabilities)} chunks in {elapsed_ms:.2f} ms "
+                         f"({len(probabilities) / max(elapsed_ms, 1e-6):.0f} chunks/ms).")
+
+            output_basepath = self.stat_printer.dataset_config.output_basepath
+            FileManager.create_directory(directory=output_basepath, allow_existing=True, allow_non_empty=True)
+
+            query_name = os.path.splitext(os.path.basename(head_filepath))[0]
+            paths = [path for path, _ in filtered_embeddings]
+            labels = labels_from_folders(paths, self.first_class_folder, self.second_class_folder)
+            sweep = ThresholdSweep(probabilities, labels)
+
+            if self.write_threshold_files:
+                for threshold in similarity_thresholds:
+                    self.classify(sweep, probabilities, filtered_embeddings, query_name, threshold)
+                    self.print_performance_stats(query_name, threshold)
+
+            self._write_sweep(sweep, query_name, similarity_thresholds, output_basepath)
@@ -0,0 +1,99 @@
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+DEFAULT_HIDDEN_SIZE = 64
+DEFAULT_REGULARIZATION = 1.0
+# Logits are clipped before the sigmoid so float32 exp never overflows.
+MAX_LOGIT = 30.0
+
+
+class EmbeddingHead(ABC):
+    # A small dense network over pooled, L2-normalized embeddings: ReLU hidden layers and a sigmoid output for
+    # the siren probability. Training is delegated to scikit-learn; only the float32 weights are kept, so the
+    # head serializes to a few kB and inference is a couple of numpy GEMMs over the whole batch.
+    def __init__(self):
+        self.weights = []
+        self.biases = []
+
+    @abstractmethod
+    def fit(self, matrix, labels):
+        pass
+
+    def set_layers(self, weights, biases):
+        self.weights = [np.ascontiguousarray(weight, dtype=np.float32) for weight in weights]
+        self.biases = [np.asarray(bias, dtype=np.float32).reshape(-1) for bias in biases]
+
+    def predict_proba(self, matrix):
+        activations = np.asarray(matrix, dtype=np.float32)
+        for weight, bias in zip(self.weights[:-1], self.biases[:-1]):
+            activations = activations @ weight
+            activations += bias
+            np.maximum(activations, 0, out=activations)
+        logits = (activations @ self.weights[-1]).reshape(-1) + self.biases[-1]
+        np.clip(logits, -MAX_LOGIT, MAX_LOGIT, out=logits)
+        return 1 / (1 + np.exp(-logits))
+
+    def save(self, filepath):
+        layers = {}
+        for i, (weight, bias) in enumerate(zip(self.weights, self.biases)):
+            layers[f"weight_{i}"] = weight
+            layers[f"bias_{i}"] = bias
+        with open(filepath, 'wb') as f:
+            np.savez(f, name=self.name, num_layers=len(self.weights), **layers)
+
+    @staticmethod
+    def load(filepath):
+        with np.load(filepath) as data:
+            head = HeadFactory.create_head(str(data['name']))
+            num_layers = int(data['num_layers'])
+            head.set_layers([data[f"weight_{i}"] for i in range(num_layers)],
+                            [data[f"bias_{i}"] for i in range(num_layers)])
+        return head
+
+
+class LogisticRegressionHead(EmbeddingHead):
+    name = 'logistic'
+
+    def __init__(self, regularization=DEFAULT_REGULARIZATION):
+        super().__init__()
+        self.regularization = regularization
+
+    def fit(self, matrix, labels):
+        from sklearn.linear_model import LogisticRegression
+
+        model = LogisticRegression(C=self.regularization, class_weight='balanced', max_iter=1000)
+        model.fit(matrix, labels)
+        self.set_layers([model.coef_.T], [model.intercept_])
+        return self
+
+
+class MLPHead(EmbeddingHead):
+    name = 'mlp'
+
+    def __init__(self, hidden_size=DEFAULT_HIDDEN_SIZE, regularization=DEFAULT_REGULARIZATION, random_state=42):
+        super().__init__()
+        self.hidden_size = hidden_size
+        self.regularization = regularization
+        self.random_state = random_state
+
+    def fit(self, matrix, labels):
+        from sklearn.neural_network import MLPClassifier
+
+        # sklearn's alpha is an L2 penalty, the inverse of the logistic regression C.
+        model = MLPClassifier(hidden_layer_sizes=(self.hidden_size,), alpha=1e-4 / self.regularization,
+                              early_stopping=len(labels) >= 50, max_iter=500, random_state=self.random_state)
+        model.fit(matrix, labels)
+        self.set_layers(model.coefs_, model.intercepts_)
+        return self
+
+
+class HeadFactory:
+    @staticmethod
+    def create_head(head_type, hidden_size=DEFAULT_HIDDEN_SIZE, regularization=DEFAULT_REGULARIZATION):
+        if head_type == LogisticRegressionHead.name:
+            return LogisticRegressionHead(regularization)
+        elif head_type == MLPHead.name:
+            return MLPHead(hidden_size, regularization)
+        else:
+            raise ValueError("Unsupported head type. Please use 'logistic' or 'mlp'.")
@@ -0,0 +1,112 @@
+import argparse
+import os
+
+import config
+from src.features.audio_embedding.audio_data import AudioDataFactory
+from src.features.audio_embedding.audio_embedder import DEFAULT_BATCH_SIZE, VGGishAudioEmbedder
+from src.features.audio_embedding.embedding import Embedding
+from src.features.audio_embedding.embedding_store import DEFAULT_DTYPE, SUPPORTED_DTYPES
+from src.features.audio_embedding.feature_pipeline import DEFAULT_PREFETCH, DEFAULT_QUEUE_DEPTH, FeaturePipeline
+from src.features.audio_embedding.retriever import EmbeddingRetriever
+from src.models.stats.stats_printer import DatasetConfig, ClassificationStatPrinter
+from src.models.vggish_head.classifier import TrainedHeadVGGishClassifier
+from src.models.vggish_head.head import (DEFAULT_HIDDEN_SIZE, DEFAULT_REGULARIZATION, HeadFactory,
+                                         LogisticRegressionHead, MLPHead)
+from src.utils.instrumentation import add_profiling_arguments, start_profiling
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Classification of siren and nosiren audio dataset with a classifier head trained on VGGish embeddings")
+    parser.add_argument('--search_dataset', type=str, required=True, help="Path to the folder containing the data set to search in.")
+    parser.add_argument('--train_dataset', type=str, default=f"{config.DATA_DIR}/train",
+                        help="Path to the DataSplitter train split with siren and nosiren sub folders.")
+    parser.add_argument('--head', type=str, choices=[LogisticRegressionHead.name, MLPHead.name],
+                        default=LogisticRegressionHead.name, help="Classifier head trained on the embeddings")
+    parser.add_argument('--hidden_size', type=int, default=DEFAULT_HIDDEN_SIZE, help="Hidden units of the mlp head")
+    parser.add_argument('--regularization', type=float, default=DEFAULT_REGULARIZATION,
+                        help="Inverse L2 regularization strength of the head. Smaller is stronger")
+    parser.add_argument('--head_file', type=str, default=None,
+                        help="Where the trained head is saved. Defaults to a file in the output folder")
+    parser.add_argument('--retrain', action='store_true', help="Train the head even if the head file exists")
+    parser.add_argument('--similarity_thresholds', type=float, nargs='+', default=[0.5],
+                        help="List of siren probability thresholds to base the classification on.")
+    parser.add_argument('--chunk_length', type=int, choices=[1, 3], required=True, help="Length of the audio chunks in seconds (1 or 3)")
+    parser.add_argument('--replace_existing', action='store_true', help="Replace existing embedding file if it exists")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Only embed new or changed audio files and evict deleted ones from the existing store")
+    parser.add_argument('--content_hash', action='store_true',
+                        help="Fingerprint audio files by content hash instead of modification time")
+    parser.add_argument('--batch_size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help="Number of audio chunks embedded per model forward pass")
+    parser.add_argument('--num_workers', type=int, default=0,
+                        help="Worker processes decoding audio and computing features. 0 runs them on the main thread")
+    parser.add_argument('--queue_depth', type=int, default=DEFAULT_QUEUE_DEPTH,
+                        help="Maximum number of decoded chunks waiting for the model")
+    parser.add_argument('--prefetch', type=int, default=DEFAULT_PREFETCH,
+                        help="Files submitted ahead per worker")
+    parser.add_argument('--embedding_dtype', type=str, choices=SUPPORTED_DTYPES, default=DEFAULT_DTYPE,
+                        help="Floating point type of the stored embedding matrix")
+    parser.add_argument('--skip_threshold_files', action='store_true',
+                        help="Only write the threshold sweep metrics, not the per-threshold classification files")
+    add_profiling_arguments(parser)
+
+    args = parser.parse_args()
+    start_profiling(args, 'vggish_head')
+
+    first_class_folder = f"{config.DATA_DIR}/test_labeled/siren"
+    second_class_folder = f"{config.DATA_DIR}/test_labeled/nosiren"
+    dataset_config = DatasetConfig(
+        'siren',
+        'nosiren',
+        first_class_folder,
+        second_class_folder,
+        f"{config.OUTPUT_DIR}/vggish_head",
+        f"{config.EMBEDDINGS_DIR}/vggish_zero_shot.emb"
+    )
+    head_filepath = args.head_file or os.path.join(dataset_config.output_basepath,
+                                                   f"{args.head}_head_{args.chunk_length}s.npz")
+
+    first_train_folder = os.path.join(args.train_dataset, 'siren')
+    second_train_folder = os.path.join(args.train_dataset, 'nosiren')
+    train_paths = []
+    for folder in (first_train_folder, second_train_folder):
+        train_paths.extend(AudioDataFactory.create_audio_data(args.chunk_length, folder).audio_paths)
+    train_data = AudioDataFactory.create_audio_data(args.chunk_length, args.train_dataset, train_paths)
+
+    audio_data = AudioDataFactory.create_audio_data(args.chunk_length, args.search_dataset)
+    embedding = Embedding(audio_data, dataset_config.embeddings_filepath, args.replace_existing, args.embedding_dtype,
+                          args.content_hash)
+    train_embedding = Embedding(train_data, f"{config.EMBEDDINGS_DIR}/vggish_train.emb", args.replace_existing,
+                                args.embedding_dtype, args.content_hash)
+    feature_pipeline = FeaturePipeline(args.num_workers, args.queue_depth, args.prefetch) if args.num_workers > 0 else None
+    embedder = VGGishAudioEmbedder(audio_data, batch_size=args.batch_size, feature_pipeline=feature_pipeline)
+    retriever = EmbeddingRetriever(audio_data, embedder, embedding)
+    train_retriever = EmbeddingRetriever(train_data, embedder, train_embedding)
+    stat_printer = ClassificationStatPrinter(dataset_config)
+
+    classifier = TrainedHeadVGGishClassifier(
+        audio_data=audio_data,
+        embedding=embedding,
+        embedder=embedder,
+        retriever=retriever,
+        stat_printer=stat_printer,
+        force_refresh_embeddings=args.replace_existing,
+        train_embedding=train_embedding,
+        train_retriever=train_retriever,
+        head=HeadFactory.create_head(args.head, args.hidden_size, args.regularization),
+        first_train_folder=first_train_folder,
+        second_train_folder=second_train_folder,
+        retrain=args.retrain,
+        incremental_refresh=args.incremental,
+        first_class_folder=first_class_folder,
+        second_class_folder=second_class_folder,
+        write_threshold_files=not args.skip_threshold_files
+    )
+
+    classifier.run(head_filepath, args.similarity_thresholds)
+
+
+# python -m src.models.vggish_head.main --search_dataset data/test --train_dataset data/train --chunk_length 3
+#                                       --head mlp --similarity_thresholds 0.3 0.5 0.7
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,25 @@
 import logging
+import os
 
-import numpy as np
 import torch
 
 from src.models.abstract_audio_classifier import AbstractAudioClassifier
+from src.models.threshold_sweep import ThresholdSweep, labels_from_folders
 from src.utils.file_manager import FileManager
+from src.utils.instrumentation import span
 
 logging.basicConfig(level=logging.INFO)
 
 
 class ZeroShotVGGishClassifier(AbstractAudioClassifier):
-    def __init__(self, audio_data, embedding, embedder, retriever, stat_printer, force_refresh_embeddings):
+    def __init__(self, audio_data, embedding, embedder, retriever, stat_printer, force_refresh_embeddings,
+                 incremental_refresh=False, first_class_folder=None, second_class_folder=None,
+                 write_threshold_files=True):
         super().__init__(force_refresh_embeddings)
+        self.incremental_refresh = incremental_refresh
+        self.first_class_folder = first_class_folder
+        self.second_class_folder = second_class_folder
+        self.write_threshold_files = write_threshold_files
         self.audio_data = audio_data
         self.embedding = embedding
         self.embedder = embedder
@@ -21,48 +29,73 @@ class ZeroShotVGGishClassifier(AbstractAudioClassifier):
     def run(self, query_audio_path, similarity_thresholds):
         with torch.no_grad():
             self.generate_embeddings()
-            query_embedding = self.embedder.generate_embedding(query_audio_path).cpu().numpy().squeeze()
+            with span('embed_query'):
+                query_embedding = self.embedder.generate_embedding(query_audio_path).cpu().numpy().squeeze()
             similarities, filtered_embeddings = self.retriever.find_similar_embeddings(query_embedding)
-            similarity_indices = np.argsort(similarities)[::-1]
 
-            FileManager.create_directory(directory=self.stat_printer.dataset_config.output_basepath, allow_existing=True, allow_non_empty=True)
+            output_basepath = self.stat_printer.dataset_config.output_basepath
+            FileManager.create_directory(directory=output_basepath, allow_existing=True, allow_non_empty=True)
 
-            for threshold in similarity_thresholds:
-                self.classify(similarity_indices, similarities, filtered_embeddings, query_audio_path, threshold)
-                self.print_performance_stats(query_audio_path, threshold)
+            labels = None
+            if self.first_class_folder is not None and self.second_class_folder is not None:
+                paths = [path for path, _ in filtered_embeddings]
+                labels = labels_from_folders(paths, self.first_class_folder, self.second_class_folder)
+            sweep = ThresholdSweep(similarities, labels)
+
+            if self.write_threshold_files:
+                for threshold in similarity_thresholds:
+                    self.classify(sweep, similarities, filtered_embeddings, query_audio_path, threshold)
+                    self.print_performance_stats(query_audio_path, threshold)
+
+            if labels is not None:
+                self._write_sweep(sweep, query_audio_path, similarity_thresholds, output_basepath)
+
+    @staticmethod
+    def _write_sweep(sweep, query_audio_path, similarity_thresholds, output_basepath):
+        query_name = os.path.splitext(os.path.basename(query_audio_path))[0]
+        with span('threshold_sweep', chunks=len(sweep.order)):
+            metrics = sweep.metrics(sorted(similarity_thresholds))
+            for i, threshold in enumerate(metrics['threshold']):
+                logging.info(f"Threshold {threshold * 100:.1f}%: precision={metrics['precision'][i]:.4f}, "
+                             f"recall={metrics['recall'][i]:.4f}, f1={metrics['f1'][i]:.4f}, "
+                             f"accuracy={metrics['accuracy'][i]:.4f}")
+            sweep.write_metrics(os.path.join(output_basepath, f"{query_name}_threshold_sweep.csv"), metrics)
+
+            curves = sweep.curves()
+            logging.info(f"ROC AUC={curves['roc_auc']:.4f}, average precision={curves['average_precision']:.4f}")
+            sweep.write_metrics(os.path.join(output_basepath, f"{query_name}_pr_roc_curves.csv"), curves)
 
     def generate_embeddings(self):
-        if not self.embedding.embeddings_exist() or self.force_refresh_embeddings:
+        if self.incremental_refresh and not self.force_refresh_embeddings:
+            self.embedding.refresh_embeddings(self.embedder)
+        elif not self.embedding.embeddings_exist() or self.force_refresh_embeddings:
             embeddings_list = self.embedder.generate_embeddings()
             self.embedding.store_embeddings(embeddings_list)
         else:
             logging.info("The embedding file already exists. Skipping embedding computation.")
 
-    def classify(self, similarity_indices, similarities, filtered_embeddings, query_audio_path, similarity_threshold):
+    def classify(self, sweep, similarities, filtered_embeddings, query_audio_path, similarity_threshold):
+        # sweep.order is sorted by descending similarity, so the first class is a prefix of it whose length is one
+        # binary search in the sweep's sorted scores.
         try:
             logging.info(f"Using similarity threshold as {similarity_threshold * 100}%")
 
             first_class_output_filepath, second_class_output_filepath = self.stat_printer.get_output_filepaths(query_audio_path, similarity_threshold)
+            similarity_indices = sweep.order
+            split = int(sweep.count_above(similarity_threshold))
 
-            with open(first_class_output_filepath, 'w') as first_class_file, open(second_class_output_filepath, 'w') as second_class_file:
-                for i, index in enumerate(similarity_indices):
-                    similarity_score = similarities[index]
-                    path, _ = filtered_embeddings[index]
-                    if similarity_score >= similarity_threshold:
-                        first_class_file.write(f"{path},{similarity_score}\n")
-                    else:
-                        self._write_remaining_paths(second_class_file, similarity_indices[i:], filtered_embeddings, similarities)
-                        break
+            with span('write_classification', chunks=len(similarity_indices)), \
+                    open(first_class_output_filepath, 'w') as first_class_file, open(second_class_output_filepath, 'w') as second_class_file:
+                self._write_paths(first_class_file, similarity_indices[:split], filtered_embeddings, similarities)
+                self._write_paths(second_class_file, similarity_indices[split:], filtered_embeddings, similarities)
 
         except ValueError as e:
             logging.error(f"Error: {e}")
 
     @staticmethod
-    def _write_remaining_paths(file, indices, embeddings, similarities):
-        for idx in indices:
-            path, _ = embeddings[idx]
-            similarity_score = similarities[idx]
-            file.write(f"{path},{similarity_score}\n")
+    def _write_paths(file, indices, embeddings, similarities):
+        file.writelines(f"{embeddings[idx][0]},{similarities[idx]}\n" for idx in indices)
 
     def print_performance_stats(self, query_audio_path, similarity_threshold):
-        self.stat_printer.print_performance_stats(query_audio_path, similarity_threshold)
+        with span('performance_stats'):
+            self.stat_printer.print_performance_stats(query_audio_path, similarity_threshold)
@@ -1,5 +1,8 @@
 import os
 import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+LINK_MODES = ['hardlink', 'symlink', 'copy']
 
 
 class FileManager:
@@ -35,3 +38,30 @@ class FileManager:
             dest = file.replace(source_dir, destination_dir)
             os.makedirs(os.path.dirname(dest), exist_ok=True)
             shutil.copy(file, dest)
+
+    @staticmethod
+    def link_files(file_list, source_dir, destination_dir, mode='hardlink', num_workers=None):
+        # Mirrors file_list from source_dir into destination_dir as hard links, symbolic links or copies, in a
+        # thread pool. Hard links that fail, e.g. across file systems, fall back to a copy. Returns the number of
+        # files that were copied.
+        if mode not in LINK_MODES:
+            raise ValueError(f"Unsupported link mode: {mode}. Choose from {LINK_MODES}.")
+        jobs = [(file, os.path.join(destination_dir, os.path.relpath(file, source_dir))) for file in file_list]
+        for directory in {os.path.dirname(dest) for _, dest in jobs}:
+            os.makedirs(directory, exist_ok=True)
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            return sum(executor.map(lambda job: FileManager._link_file(*job, mode), jobs))
+
+    @staticmethod
+    def _link_file(source, destination, mode):
+        if mode == 'symlink':
+            os.symlink(os.path.abspath(source), destination)
+            return False
+        if mode == 'hardlink':
+            try:
+                os.link(source, destination)
+                return False
+            except OSError:
+                pass
+        shutil.copy(source, destination)
+        return True
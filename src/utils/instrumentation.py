@@ -0,0 +1,218 @@
+import atexit
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import nullcontext
+
+PROFILE_CAPTURES = ['none', 'cprofile', 'torch']
+# Functions listed in the JSON report of a cProfile capture.
+CPROFILE_TOP_FUNCTIONS = 30
+
+
+class StageStats:
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.chunks = 0
+        self.audio_seconds = 0.0
+
+    def to_dict(self, wall_seconds):
+        stats = {
+            'calls': self.calls,
+            'seconds': self.seconds,
+            'mean_ms': 1000 * self.seconds / self.calls if self.calls else 0.0,
+            'max_ms': 1000 * self.max_seconds,
+            'share_of_wall': self.seconds / wall_seconds if wall_seconds else 0.0,
+        }
+        if self.chunks:
+            stats['chunks'] = self.chunks
+            stats['chunks_per_second'] = self.chunks / max(self.seconds, 1e-9)
+        if self.audio_seconds:
+            stats['audio_seconds'] = self.audio_seconds
+            stats['audio_seconds_per_second'] = self.audio_seconds / max(self.seconds, 1e-9)
+        return stats
+
+
+class Span:
+    def __init__(self, instrumentation, name, chunks, audio_seconds):
+        self.instrumentation = instrumentation
+        self.name = name
+        self.chunks = chunks
+        self.audio_seconds = audio_seconds
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.instrumentation.record(self.name, time.perf_counter() - self.start, self.chunks, self.audio_seconds)
+        return False
+
+
+class Instrumentation:
+    # Process-wide stage timers and counters. While disabled, span() returns a shared no-op context manager and
+    # count() returns immediately, so instrumented code pays next to nothing. Stages of worker processes are not
+    # collected; the parent records the time it waits for their results instead.
+    def __init__(self):
+        self.enabled = False
+        self.stages = defaultdict(StageStats)
+        self.counters = Counter()
+        self.lock = threading.Lock()
+        self.start_time = time.perf_counter()
+        self._null_span = nullcontext()
+
+    def span(self, name, chunks=0, audio_seconds=0.0):
+        if not self.enabled:
+            return self._null_span
+        return Span(self, name, chunks, audio_seconds)
+
+    def record(self, name, seconds, chunks=0, audio_seconds=0.0):
+        with self.lock:
+            stage = self.stages[name]
+            stage.calls += 1
+            stage.seconds += seconds
+            stage.max_seconds = max(stage.max_seconds, seconds)
+            stage.chunks += chunks
+            stage.audio_seconds += audio_seconds
+
+    def count(self, name, value=1):
+        if self.enabled:
+            with self.lock:
+                self.counters[name] += value
+
+    def enable(self):
+        self.enabled = True
+        self.start_time = time.perf_counter()
+
+    def report(self):
+        wall_seconds = time.perf_counter() - self.start_time
+        with self.lock:
+            stages = {name: stage.to_dict(wall_seconds)
+                      for name, stage in sorted(self.stages.items(), key=lambda item: -item[1].seconds)}
+            counters = dict(self.counters)
+        return {'wall_seconds': wall_seconds, 'stages': stages, 'counters': counters}
+
+
+instrumentation = Instrumentation()
+
+
+def span(name, chunks=0, audio_seconds=0.0):
+    return instrumentation.span(name, chunks, audio_seconds)
+
+
+def record(name, seconds, chunks=0, audio_seconds=0.0):
+    # For stages that time themselves and only know their chunk count at the end.
+    if instrumentation.enabled:
+        instrumentation.record(name, seconds, chunks, audio_seconds)
+
+
+def count(name, value=1):
+    instrumentation.count(name, value)
+
+
+def timed_iter(name, iterable):
+    # Records the time spent waiting on each item of a producer such as the feature pipeline.
+    if not instrumentation.enabled:
+        return iterable
+    return _timed_iter(name, iterable)
+
+
+def _timed_iter(name, iterable):
+    iterator = iter(iterable)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        instrumentation.record(name, time.perf_counter() - start, 1)
+        yield item
+
+
+def add_profiling_arguments(parser):
+    parser.add_argument('--profile', action='store_true',
+                        help="Time every pipeline stage and write the breakdown as JSON when the command exits")
+    parser.add_argument('--profile_output', type=str, default=None,
+                        help="JSON file of the stage breakdown. Defaults to output/profiles/<command>_<timestamp>.json")
+    parser.add_argument('--profile_capture', type=str, choices=PROFILE_CAPTURES, default='none',
+                        help="With --profile, also capture a cProfile or torch profiler trace next to the JSON file")
+
+
+class Profiler:
+    def __init__(self, command, output_path, capture='none'):
+        if capture not in PROFILE_CAPTURES:
+            raise ValueError(f"Unsupported profile capture: {capture}. Choose from {PROFILE_CAPTURES}.")
+        self.command = command
+        self.output_path = output_path
+        self.capture = capture
+        self.capture_profiler = None
+        self.stopped = False
+
+    def start(self):
+        instrumentation.enable()
+        if self.capture == 'cprofile':
+            import cProfile
+
+            self.capture_profiler = cProfile.Profile()
+            self.capture_profiler.enable()
+        elif self.capture == 'torch':
+            import torch
+
+            self.capture_profiler = torch.profiler.profile(activities=[torch.profiler.ProfilerActivity.CPU],
+                                                           record_shapes=True)
+            self.capture_profiler.__enter__()
+
+    def stop(self):
+        if self.stopped:
+            return
+        self.stopped = True
+        report = {'command': self.command, 'argv': sys.argv, **instrumentation.report()}
+        os.makedirs(os.path.dirname(self.output_path) or '.', exist_ok=True)
+        base_path = os.path.splitext(self.output_path)[0]
+        if self.capture == 'cprofile':
+            self.capture_profiler.disable()
+            report['cprofile'] = {'file': f"{base_path}.prof", 'top_functions': self._top_functions()}
+            self.capture_profiler.dump_stats(f"{base_path}.prof")
+        elif self.capture == 'torch':
+            self.capture_profiler.__exit__(None, None, None)
+            self.capture_profiler.export_chrome_trace(f"{base_path}.trace.json")
+            report['torch_profiler'] = {'file': f"{base_path}.trace.json"}
+
+        with open(self.output_path, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Profile written to {self.output_path}", file=sys.stderr)
+        for name, stage in report['stages'].items():
+            line = f"  {name:<28}{stage['seconds']:>10.3f}s {stage['calls']:>8} calls"
+            if 'chunks_per_second' in stage:
+                line += f" {stage['chunks_per_second']:>10.1f} chunks/s"
+            if 'audio_seconds_per_second' in stage:
+                line += f" {stage['audio_seconds_per_second']:>10.1f} audio s/s"
+            print(line, file=sys.stderr)
+
+    def _top_functions(self):
+        import pstats
+
+        stats = pstats.Stats(self.capture_profiler)
+        rows = sorted(stats.stats.items(), key=lambda item: -item[1][3])[:CPROFILE_TOP_FUNCTIONS]
+        return [{'function': f"{filename}:{line}({name})", 'calls': calls, 'total_seconds': total_time,
+                 'cumulative_seconds': cumulative_time}
+                for (filename, line, name), (_, calls, total_time, cumulative_time, _) in rows]
+
+
+def start_profiling(args, command):
+    # Enables the stage timers and writes the report when the process exits, including early returns and errors.
+    # config is imported here so feature workers importing the instrumented modules do not load it.
+    if not args.profile:
+        return None
+    import config
+
+    output_path = args.profile_output or os.path.join(
+        config.OUTPUT_DIR, 'profiles', f"{command}_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    profiler = Profiler(command, output_path, args.profile_capture)
+    profiler.start()
+    atexit.register(profiler.stop)
+    return profiler
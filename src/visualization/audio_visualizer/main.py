@@ -1,18 +1,43 @@
 import argparse
-from .waveform_generator import WaveformGenerator
+
+from src.utils.instrumentation import add_profiling_arguments, start_profiling
 
 
 def main():
     parser = argparse.ArgumentParser(description="Generate waveforms for WAV files in a folder.")
     parser.add_argument("--input_folder", type=str, required=True, help="Folder containing WAV files")
     parser.add_argument("--output_folder", type=str, required=True, help="Folder containing visualization of input audio files.")
+    parser.add_argument("--fast", action="store_true",
+                        help="Render min/max envelopes on a reused Agg figure in a process pool instead of plotting every sample")
+    parser.add_argument("--num_workers", type=int, default=None,
+                        help="Worker processes of --fast. Defaults to the number of CPUs")
+    parser.add_argument("--view", type=str, choices=["waveform", "spectrogram", "both"], default="waveform",
+                        help="Panels drawn by --fast: the waveform, a log spectrogram, or both stacked")
+    parser.add_argument("--width", type=int, default=1000, help="Width of the --fast panels in pixels")
+    parser.add_argument("--height", type=int, default=400, help="Height of each --fast panel in pixels")
+    parser.add_argument("--classification_file", type=str, default=None,
+                        help="Only render the chunks listed in this classifier output file, e.g. the siren file of a threshold")
+    add_profiling_arguments(parser)
 
     args = parser.parse_args()
+    start_profiling(args, 'audio_visualizer')
+    if args.view != "waveform" and not args.fast:
+        parser.error("--view spectrogram and --view both require --fast")
+
+    # matplotlib and pydub are only imported once the arguments are valid.
+    from .waveform_generator import BatchWaveformRenderer, WaveformGenerator, collect_wav_files, read_classified_files
 
-    waveform_generator = WaveformGenerator()
-    waveform_generator.generate_waveforms(args.input_folder, args.output_folder)
+    file_names = read_classified_files(args.classification_file) if args.classification_file is not None else None
+    if args.fast:
+        audio_paths = collect_wav_files(args.input_folder, file_names)
+        renderer = BatchWaveformRenderer(args.num_workers, args.view, args.width, args.height)
+        renderer.render_files(audio_paths, args.output_folder)
+    else:
+        waveform_generator = WaveformGenerator()
+        waveform_generator.generate_waveforms(args.input_folder, args.output_folder, file_names)
 
 
 # python -m src.visualization.audio_visualizer.main --input_folder data/processed/Sample_1_3s --output_folder data/visualized/Sample_1_3s
+# python -m src.visualization.audio_visualizer.main --input_folder data/processed/Sample_1_3s --output_folder data/visualized/Sample_1_3s_sirens --fast --view both --classification_file output/vggish_zero_shot/<siren output file>
 if __name__ == "__main__":
     main()
@@ -1,7 +1,58 @@
 import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
 import numpy as np
-import matplotlib.pyplot as plt
-from pydub import AudioSegment
+import soundfile as sf
+from tqdm import tqdm
+
+from src.utils.instrumentation import span
+
+VIEWS = ['waveform', 'spectrogram', 'both']
+# Size of each rendered panel in pixels.
+DEFAULT_WIDTH = 1000
+DEFAULT_HEIGHT = 400
+DEFAULT_DPI = 100
+SPECTROGRAM_WINDOW_SECONDS = 0.025
+SPECTROGRAM_HOP_SECONDS = 0.010
+SPECTROGRAM_LOG_OFFSET = 1e-6
+# zlib level of the fast renderer's PNGs; encoding at the default level 6 takes longer than drawing.
+PNG_COMPRESS_LEVEL = 1
+
+
+def collect_wav_files(input_folder, file_names=None):
+    # file_names optionally restricts the folder to a set of base names, e.g. the chunks of a classifier output.
+    return sorted(os.path.join(input_folder, file) for file in os.listdir(input_folder)
+                  if file.endswith(".wav") and (file_names is None or file in file_names))
+
+
+def read_classified_files(classification_file):
+    # Classifier output files hold one "path,similarity" line per chunk.
+    with open(classification_file) as f:
+        return {os.path.basename(line.rsplit(',', 1)[0]) for line in f if line.strip()}
+
+
+def min_max_envelope(samples, num_columns):
+    # Minimum and maximum of the samples falling into each of num_columns equal pixel columns. Drawn as one
+    # min/max pair per column, the envelope looks the same as plotting every sample.
+    if len(samples) <= num_columns:
+        return samples, samples
+    edges = np.linspace(0, len(samples), num_columns + 1).astype(np.int64)[:-1]
+    return np.minimum.reduceat(samples, edges), np.maximum.reduceat(samples, edges)
+
+
+def log_spectrogram(samples, sample_rate, num_columns):
+    # Log-magnitude STFT (frequencies x frames), max-pooled over time to at most num_columns frames.
+    window_length = int(round(SPECTROGRAM_WINDOW_SECONDS * sample_rate))
+    hop_length = int(round(SPECTROGRAM_HOP_SECONDS * sample_rate))
+    if len(samples) < window_length:
+        samples = np.pad(samples, (0, window_length - len(samples)))
+    frames = np.lib.stride_tricks.sliding_window_view(samples, window_length)[::hop_length]
+    spectrogram = np.log(np.abs(np.fft.rfft(frames * np.hanning(window_length))) + SPECTROGRAM_LOG_OFFSET)
+    if len(spectrogram) > num_columns:
+        edges = np.linspace(0, len(spectrogram), num_columns + 1).astype(np.int64)[:-1]
+        spectrogram = np.maximum.reduceat(spectrogram, edges, axis=0)
+    return spectrogram.T
 
 
 class WaveformGenerator:
@@ -10,6 +61,8 @@ class WaveformGenerator:
         return samples / 10946.0
 
     def plot_waveform(self, audio_chunk, chunk_name):
+        import matplotlib.pyplot as plt
+
         samples = np.array(audio_chunk.get_array_of_samples())
         normalized_samples = self.normalize_samples(samples)
 
@@ -23,13 +76,153 @@ class WaveformGenerator:
         plt.savefig(f"{chunk_name}.png")
         plt.close()
 
-    def generate_waveforms(self, input_folder, output_folder):
+    def generate_waveforms(self, input_folder, output_folder, file_names=None):
+        from pydub import AudioSegment
+
         os.makedirs(output_folder, exist_ok=True)
-        for file_name in os.listdir(input_folder):
-            if file_name.endswith(".wav"):
-                file_path = os.path.join(input_folder, file_name)
+        for file_path in collect_wav_files(input_folder, file_names):
+            file_name = os.path.basename(file_path)
+            with span('decode'):
                 audio_chunk = AudioSegment.from_wav(file_path)
-                base_name = os.path.splitext(file_name)[0]
-                chunk_name = os.path.join(output_folder, base_name)
+            base_name = os.path.splitext(file_name)[0]
+            chunk_name = os.path.join(output_folder, base_name)
+            with span('render_waveform', chunks=1, audio_seconds=audio_chunk.duration_seconds):
                 self.plot_waveform(audio_chunk, chunk_name)
-                print(f"Generated waveform for {file_name}")
+            print(f"Generated waveform for {file_name}")
+
+
+class WaveformRenderer:
+    # Fast counterpart of WaveformGenerator.plot_waveform. One Agg figure is built on the first file and reused:
+    # axes, ticks and grid are drawn once per chunk duration and kept as a background, and each file only restores
+    # that background and draws its own line, spectrogram image and title on top before the PNG is encoded. The
+    # waveform is reduced to a min/max envelope with one pair per pixel column, and the spectrogram to at most one
+    # frame per pixel column, before they are drawn.
+    def __init__(self, view='waveform', width=DEFAULT_WIDTH, height=DEFAULT_HEIGHT, dpi=DEFAULT_DPI):
+        if view not in VIEWS:
+            raise ValueError(f"Unsupported view: {view}. Choose from {VIEWS}.")
+        self.view = view
+        self.width = width
+        self.height = height
+        self.dpi = dpi
+        self.figure = None
+        self.background = None
+        self.background_key = None
+
+    def build_figure(self):
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+
+        panels = 2 if self.view == 'both' else 1
+        self.figure = Figure(figsize=(self.width / self.dpi, panels * self.height / self.dpi), dpi=self.dpi)
+        self.canvas = FigureCanvasAgg(self.figure)
+        axes = list(self.figure.subplots(panels, 1, squeeze=False)[:, 0])
+        title_axes = axes[0]
+        self.waveform_axes = axes.pop(0) if self.view != 'spectrogram' else None
+        self.spectrogram_axes = axes.pop(0) if self.view != 'waveform' else None
+        self.dynamic_artists = []
+
+        if self.waveform_axes is not None:
+            self.line, = self.waveform_axes.plot([], [], linewidth=0.6, animated=True)
+            self.dynamic_artists.append(self.line)
+            self.waveform_axes.set_xlabel("Time (s)")
+            self.waveform_axes.set_ylabel("Normalized Amplitude")
+            self.waveform_axes.set_ylim([-1, 1])
+            self.waveform_axes.grid(True)
+        if self.spectrogram_axes is not None:
+            self.image = self.spectrogram_axes.imshow(np.zeros((2, 2)), origin='lower', aspect='auto', cmap='magma',
+                                                      interpolation='nearest', animated=True)
+            self.dynamic_artists.append(self.image)
+            self.spectrogram_axes.set_xlabel("Time (s)")
+            self.spectrogram_axes.set_ylabel("Frequency (Hz)")
+        # A placeholder title makes tight_layout reserve room for the per-file titles.
+        self.title = title_axes.set_title("Waveform of", animated=True)
+        self.dynamic_artists.append(self.title)
+        self.figure.tight_layout()
+
+    def draw_background(self, duration, sample_rate):
+        # Animated artists are skipped by a full draw, so the background holds only the static parts.
+        if self.waveform_axes is not None:
+            self.waveform_axes.set_xlim(0, duration)
+        if self.spectrogram_axes is not None:
+            self.spectrogram_axes.set_xlim(0, duration)
+            self.spectrogram_axes.set_ylim(0, sample_rate / 2)
+        self.canvas.draw()
+        self.background = self.canvas.copy_from_bbox(self.figure.bbox)
+        self.background_key = (duration, sample_rate)
+
+    def render(self, audio_path, output_path):
+        from PIL import Image
+
+        with span('decode'):
+            samples, sample_rate = sf.read(audio_path, dtype='int16', always_2d=True)
+        samples = WaveformGenerator.normalize_samples(samples.mean(axis=1))
+        duration = len(samples) / sample_rate
+
+        with span('render_waveform', chunks=1, audio_seconds=duration):
+            if self.figure is None:
+                self.build_figure()
+            if self.background_key != (duration, sample_rate):
+                self.draw_background(duration, sample_rate)
+            if self.waveform_axes is not None:
+                minimums, maximums = min_max_envelope(samples, self.width)
+                times = np.linspace(0, duration, len(minimums)).repeat(2)
+                self.line.set_data(times, np.column_stack([minimums, maximums]).ravel())
+            if self.spectrogram_axes is not None:
+                spectrogram = log_spectrogram(samples, sample_rate, self.width)
+                self.image.set_data(spectrogram)
+                self.image.set_extent((0, duration, 0, sample_rate / 2))
+                self.image.set_clim(spectrogram.min(), spectrogram.max())
+            self.title.set_text(f"Waveform of {os.path.splitext(output_path)[0]}")
+
+            self.canvas.restore_region(self.background)
+            for artist in self.dynamic_artists:
+                self.figure.draw_artist(artist)
+            pixels = np.asarray(self.canvas.buffer_rgba())[:, :, :3]
+            Image.fromarray(pixels).save(output_path, compress_level=PNG_COMPRESS_LEVEL)
+
+
+_worker_renderer = None
+
+
+def _init_worker(view, width, height, dpi):
+    global _worker_renderer
+    _worker_renderer = WaveformRenderer(view, width, height, dpi)
+
+
+def _render_file(audio_path, output_path):
+    _worker_renderer.render(audio_path, output_path)
+    return audio_path
+
+
+class BatchWaveformRenderer:
+    # Renders many files concurrently. Each worker process keeps its own WaveformRenderer, so a figure is built
+    # once per worker rather than once per file.
+    def __init__(self, num_workers=None, view='waveform', width=DEFAULT_WIDTH, height=DEFAULT_HEIGHT,
+                 dpi=DEFAULT_DPI):
+        if view not in VIEWS:
+            raise ValueError(f"Unsupported view: {view}. Choose from {VIEWS}.")
+        self.num_workers = num_workers or os.cpu_count()
+        self.view = view
+        self.width = width
+        self.height = height
+        self.dpi = dpi
+
+    def render_files(self, audio_paths, output_folder):
+        os.makedirs(output_folder, exist_ok=True)
+        jobs = [(path, os.path.join(output_folder, f"{os.path.splitext(os.path.basename(path))[0]}.png"))
+                for path in audio_paths]
+        start = time.perf_counter()
+        if self.num_workers == 1 or len(jobs) <= 1:
+            renderer = WaveformRenderer(self.view, self.width, self.height, self.dpi)
+            for audio_path, output_path in tqdm(jobs):
+                renderer.render(audio_path, output_path)
+        else:
+            with ProcessPoolExecutor(max_workers=self.num_workers, initializer=_init_worker,
+                                     initargs=(self.view, self.width, self.height, self.dpi)) as executor:
+                futures = [executor.submit(_render_file, audio_path, output_path) for audio_path, output_path in jobs]
+                for future in tqdm(as_completed(futures), total=len(futures)):
+                    future.result()
+        elapsed = time.perf_counter() - start
+        print(f"Rendered {len(jobs)} files to {output_folder} in {elapsed:.1f}s "
+              f"({len(jobs) / max(elapsed, 1e-9):.1f} files/s).")
+        return len(jobs)